@@ -1,6 +1,6 @@
 import os
 
-from celery import Celery
+from celery import Celery, signals
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Spotify_Clone.settings')
@@ -15,3 +15,27 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+@signals.celeryd_init.connect
+def configure_worker_class(sender=None, conf=None, options=None, **kwargs):
+    '''
+    Tasks are annotated with their class (`@shared_task(queue='media')`) and
+    each class is consumed by its own workers (`worker -Q media`). A worker
+    consuming a single class takes that class's concurrency and prefetch
+    from CELERY_WORKER_CLASSES, unless they are given on the command line.
+    '''
+    from django.conf import settings
+
+    queues = (options or {}).get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if len(queues) != 1:
+        return
+    worker_class = getattr(settings, 'CELERY_WORKER_CLASSES', {}).get(queues[0])
+    if not worker_class:
+        return
+    if not options.get('concurrency'):
+        conf.worker_concurrency = worker_class['concurrency']
+    if not options.get('prefetch_multiplier'):
+        conf.worker_prefetch_multiplier = worker_class['prefetch_multiplier']
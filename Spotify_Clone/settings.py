@@ -1,9 +1,11 @@
 import os
 import sys
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
 import dotenv
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -14,6 +16,91 @@ dotenv.load_dotenv(BASE_DIR / '.env')
 
 # Custom App Settings
 CATALOG_HLS_VARIANTS = [int(x) for x in os.getenv('CATALOG_HLS_VARIANTS', '64,128,256').split(',')]
+# 'parallel' encodes each variant as its own ffmpeg process; 'merged' runs them all in one ffmpeg call.
+CATALOG_TRANSCODE_MODE = os.getenv('CATALOG_TRANSCODE_MODE', 'parallel')
+CATALOG_TRANSCODE_CONCURRENCY = int(os.getenv('CATALOG_TRANSCODE_CONCURRENCY', 3))
+# Loudness normalization applied at encode time (EBU R128 integrated loudness, true-peak ceiling).
+CATALOG_LOUDNESS_NORMALIZE = os.getenv('CATALOG_LOUDNESS_NORMALIZE', 'True').lower() in ('true', '1', 't')
+CATALOG_LOUDNESS_TARGET_LUFS = float(os.getenv('CATALOG_LOUDNESS_TARGET_LUFS', -14.0))
+CATALOG_TRUE_PEAK_CEILING_DBTP = float(os.getenv('CATALOG_TRUE_PEAK_CEILING_DBTP', -1.0))
+# Preview clip cut at ingest from the loudest window of the track (0 seconds disables it).
+CATALOG_PREVIEW_SECONDS = int(os.getenv('CATALOG_PREVIEW_SECONDS', 30))
+CATALOG_PREVIEW_BITRATE = int(os.getenv('CATALOG_PREVIEW_BITRATE', 64))
+# Bulk catalog ingest (POST catalog/ingest/, manage.py ingest_catalog): tracks written per transaction
+# and the most tracks one API request may carry.
+CATALOG_INGEST_BATCH_SIZE = int(os.getenv('CATALOG_INGEST_BATCH_SIZE', 1000))
+CATALOG_INGEST_MAX_TRACKS = int(os.getenv('CATALOG_INGEST_MAX_TRACKS', 5000))
+# Buffer size (bytes) for streaming media between object storage and local temp files.
+MEDIA_COPY_BUFFER_SIZE = int(os.getenv('MEDIA_COPY_BUFFER_SIZE', 1024 * 1024))
+# Orphaned media GC: objects under MEDIA_GC_PREFIXES that nothing in the database refers to are deleted
+# once older than MEDIA_GC_GRACE_HOURS (daily beat task; MEDIA_GC_DRY_RUN only reports them).
+MEDIA_GC_PREFIXES = [p for p in os.getenv('MEDIA_GC_PREFIXES', 'content/,tracks/,uploads/original/').split(',') if p]
+MEDIA_GC_GRACE_HOURS = int(os.getenv('MEDIA_GC_GRACE_HOURS', 72))
+MEDIA_GC_DRY_RUN = os.getenv('MEDIA_GC_DRY_RUN', 'False').lower() in ('true', '1', 't')
+# Shared thread pool (and S3 connection pool) size for bulk segment uploads, and per-object retries.
+MEDIA_UPLOAD_CONCURRENCY = int(os.getenv('MEDIA_UPLOAD_CONCURRENCY', 16))
+MEDIA_UPLOAD_RETRIES = int(os.getenv('MEDIA_UPLOAD_RETRIES', 3))
+# Direct uploads of masters: files larger than one MEDIA_UPLOAD_PART_SIZE part use S3 multipart uploads
+# (parallel, resumable parts); open multipart uploads can be resumed for MEDIA_UPLOAD_SESSION_TTL seconds.
+MEDIA_UPLOAD_MAX_BYTES = int(os.getenv('MEDIA_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))
+MEDIA_UPLOAD_PART_SIZE = int(os.getenv('MEDIA_UPLOAD_PART_SIZE', 16 * 1024 * 1024))
+MEDIA_UPLOAD_SESSION_TTL = int(os.getenv('MEDIA_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+# Presigned GET URLs: validity, and how long one signature is shared between requests (0 disables the cache).
+MEDIA_PRESIGNED_URL_EXPIRY = int(os.getenv('MEDIA_PRESIGNED_URL_EXPIRY', 3600))
+MEDIA_PRESIGNED_URL_REUSE = int(os.getenv('MEDIA_PRESIGNED_URL_REUSE', 900))
+# Per-object working directories that survive task retries, so a retry resumes from its last finished stage.
+MEDIA_PIPELINE_WORK_DIR = os.getenv('MEDIA_PIPELINE_WORK_DIR', os.path.join(tempfile.gettempdir(), 'audio-pipeline'))
+STREAMING_HLS_BITRATES = [int(x) for x in os.getenv('STREAMING_HLS_BITRATES', '64,128,256').split(',')]
+# 'ts' writes HLS with MPEG-TS segments; 'cmaf' writes fMP4 segments shared by an HLS and a DASH manifest.
+STREAMING_PACKAGING = os.getenv('STREAMING_PACKAGING', 'ts')
+# With CMAF, store each variant as one file addressed by byte ranges instead of one object per segment.
+STREAMING_CMAF_SINGLE_FILE = os.getenv('STREAMING_CMAF_SINGLE_FILE', 'False').lower() in ('true', '1', 't')
+# Lazy mode encodes only the baseline bitrate at ingest; other rungs are encoded on first request
+# and evicted again once they have not been requested for STREAMING_VARIANT_IDLE_DAYS.
+STREAMING_LAZY_VARIANTS = os.getenv('STREAMING_LAZY_VARIANTS', 'False').lower() in ('true', '1', 't')
+STREAMING_BASELINE_BITRATE = int(os.getenv('STREAMING_BASELINE_BITRATE', 128))
+STREAMING_VARIANT_IDLE_DAYS = int(os.getenv('STREAMING_VARIANT_IDLE_DAYS', 30))
+# Variant requests are counted in Redis and written to AudioQuality every STREAMING_VARIANT_REQUEST_FLUSH_SECONDS.
+STREAMING_VARIANT_REQUEST_FLUSH_SECONDS = int(os.getenv('STREAMING_VARIANT_REQUEST_FLUSH_SECONDS', 60))
+# Bitrate of a single-file AAC rendition encoded at ingest for the progressive endpoint (0 disables it).
+STREAMING_PROGRESSIVE_BITRATE = int(os.getenv('STREAMING_PROGRESSIVE_BITRATE', 0))
+# Behind the nginx proxy, progressive downloads are handed to it with X-Accel-Redirect to internal
+# locations under this prefix (see proxy/nginx.conf.template); otherwise clients are redirected to the storage URL.
+STREAMING_ACCEL_REDIRECT = os.getenv('STREAMING_ACCEL_REDIRECT', 'False').lower() in ('true', '1', 't')
+STREAMING_ACCEL_REDIRECT_PREFIX = os.getenv('STREAMING_ACCEL_REDIRECT_PREFIX', '/_protected/')
+# Highest HLS bitrate served for each UserPreferences.playback_quality (0 means no cap), and the cap for
+# users without an active subscription. Rendered master playlists are cached per track and tier.
+STREAMING_QUALITY_TIERS = {'LOW': 64, 'NORMAL': 128, 'HIGH': 256, 'LOSSLESS': 0}
+STREAMING_FREE_MAX_BITRATE = int(os.getenv('STREAMING_FREE_MAX_BITRATE', 128))
+STREAMING_MANIFEST_CACHE_TTL = int(os.getenv('STREAMING_MANIFEST_CACHE_TTL', 300))
+# Lifetime (seconds) of the `?token=` on master playlist URLs, for players that cannot send the Authorization header.
+STREAMING_MASTER_TOKEN_TTL = int(os.getenv('STREAMING_MASTER_TOKEN_TTL', 60 * 60))
+# Number of upcoming tracks (from the session's queue or playlist) bundled into a session start.
+STREAMING_PREFETCH_TRACKS = int(os.getenv('STREAMING_PREFETCH_TRACKS', 3))
+# Session heartbeats (PATCH last_position_ms) are buffered in Redis and written to the database
+# in bulk every STREAMING_HEARTBEAT_FLUSH_SECONDS, at most STREAMING_HEARTBEAT_FLUSH_BATCH rows per UPDATE.
+STREAMING_HEARTBEAT_BUFFER = os.getenv('STREAMING_HEARTBEAT_BUFFER', 'True').lower() in ('true', '1', 't')
+STREAMING_HEARTBEAT_FLUSH_SECONDS = int(os.getenv('STREAMING_HEARTBEAT_FLUSH_SECONDS', 10))
+STREAMING_HEARTBEAT_FLUSH_BATCH = int(os.getenv('STREAMING_HEARTBEAT_FLUSH_BATCH', 1000))
+STREAMING_HEARTBEAT_TTL = int(os.getenv('STREAMING_HEARTBEAT_TTL', 24 * 60 * 60))
+# Seconds a track's stream resolution (manifest keys, qualities, status) stays cached; processing tasks invalidate it.
+STREAMING_RESOLUTION_CACHE_TTL = int(os.getenv('STREAMING_RESOLUTION_CACHE_TTL', 60 * 60))
+# Landmark fingerprints taken during analysis flag near-duplicate masters. A match needs at least
+# STREAMING_FINGERPRINT_MIN_MATCHES time-aligned landmarks making up STREAMING_FINGERPRINT_MIN_SCORE of the upload's.
+# With STREAMING_FINGERPRINT_HOLD_DUPLICATES, matches are held before the encode stage for review.
+STREAMING_FINGERPRINT = os.getenv('STREAMING_FINGERPRINT', 'True').lower() in ('true', '1', 't')
+STREAMING_FINGERPRINT_MIN_MATCHES = int(os.getenv('STREAMING_FINGERPRINT_MIN_MATCHES', 20))
+STREAMING_FINGERPRINT_MIN_SCORE = float(os.getenv('STREAMING_FINGERPRINT_MIN_SCORE', 0.1))
+STREAMING_FINGERPRINT_HOLD_DUPLICATES = os.getenv('STREAMING_FINGERPRINT_HOLD_DUPLICATES', 'False').lower() in ('true', '1', 't')
+# Plays are counted in sharded Redis hashes and applied to Track.play_count/popularity in bulk.
+# Popularity is log-scaled and reaches 100 at TRACK_POPULARITY_CEILING plays.
+TRACK_PLAY_COUNTER_SHARDS = int(os.getenv('TRACK_PLAY_COUNTER_SHARDS', 16))
+TRACK_POPULARITY_FLUSH_SECONDS = int(os.getenv('TRACK_POPULARITY_FLUSH_SECONDS', 60))
+TRACK_POPULARITY_FLUSH_BATCH = int(os.getenv('TRACK_POPULARITY_FLUSH_BATCH', 1000))
+TRACK_POPULARITY_CEILING = int(os.getenv('TRACK_POPULARITY_CEILING', 1_000_000))
+# Artist pages (top tracks, latest albums, counts) are precomputed into Artist.page. Changes to an artist's
+# tracks, albums or popularity rebuild it after this many seconds, sharing one rebuild per artist.
+ARTIST_PAGE_REBUILD_DELAY = int(os.getenv('ARTIST_PAGE_REBUILD_DELAY', 10))
 
 
 # Quick-start development settings - unsuitable for production
@@ -235,6 +322,7 @@ REST_FRAMEWORK = {
         'password_reset': '5/min',
         'search': '100/min',
         'upload': '20/hour',
+        'ingest': '30/hour',
         'stream': '500/day',
     }
 }
@@ -287,6 +375,47 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Tasks are annotated with their class (@shared_task(queue=...)) and each class has its own workers:
+# 'media' for minutes of ffmpeg, 'realtime' for user-facing work, 'batch' for scheduled aggregation.
+CELERY_TASK_DEFAULT_QUEUE = 'batch'
+# Concurrency and prefetch of a worker started on one class (`celery -A Spotify_Clone worker -Q media`).
+CELERY_WORKER_CLASSES = {
+    'media': {
+        'concurrency': int(os.getenv('CELERY_MEDIA_CONCURRENCY', 2)),
+        'prefetch_multiplier': int(os.getenv('CELERY_MEDIA_PREFETCH', 1)),
+    },
+    'realtime': {
+        'concurrency': int(os.getenv('CELERY_REALTIME_CONCURRENCY', 8)),
+        'prefetch_multiplier': int(os.getenv('CELERY_REALTIME_PREFETCH', 4)),
+    },
+    'batch': {
+        'concurrency': int(os.getenv('CELERY_BATCH_CONCURRENCY', 2)),
+        'prefetch_multiplier': int(os.getenv('CELERY_BATCH_PREFETCH', 1)),
+    },
+}
+# Run by celery beat's default PersistentScheduler (see the compose `beat` service); edits apply on restart.
+CELERY_BEAT_SCHEDULE = {
+    'evict-cold-variants': {
+        'task': 'streaming.tasks.evict_cold_variants',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'flush-variant-requests': {
+        'task': 'streaming.tasks.flush_variant_requests',
+        'schedule': STREAMING_VARIANT_REQUEST_FLUSH_SECONDS,
+    },
+    'flush-session-heartbeats': {
+        'task': 'streaming.tasks.flush_session_heartbeats',
+        'schedule': STREAMING_HEARTBEAT_FLUSH_SECONDS,
+    },
+    'collect-orphaned-media': {
+        'task': 'streaming.tasks.collect_orphaned_media',
+        'schedule': crontab(hour=5, minute=0),
+    },
+    'flush-track-popularity': {
+        'task': 'artists.tasks.flush_track_popularity',
+        'schedule': TRACK_POPULARITY_FLUSH_SECONDS,
+    },
+}
 
 
 # Email
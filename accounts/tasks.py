@@ -7,7 +7,7 @@ from django.utils.encoding import force_bytes
 from .models import CustomUser
 
 
-@shared_task
+@shared_task(queue='realtime')
 def send_password_reset_email(user_id):
     '''
     Sends a password reset email to the user.
@@ -34,7 +34,7 @@ def send_password_reset_email(user_id):
         pass
 
 
-@shared_task
+@shared_task(queue='realtime')
 def send_verification_email(user_id):
     '''
     Sends a verification email to the user.
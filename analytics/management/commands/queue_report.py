@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from analytics.task_queues import queue_report, tasks_by_class
+
+
+class Command(BaseCommand):
+    help = 'Shows the depth of each Celery task class queue and how long its tasks waited and ran.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=1,
+            help='How many hours of task timings to include. Defaults to 1.',
+        )
+        parser.add_argument(
+            '--tasks',
+            action='store_true',
+            help='Also list the tasks annotated with each class.',
+        )
+
+    def handle(self, *args, **options):
+        def seconds(value):
+            return f'{value:.3f}s' if value is not None else '-'
+
+        self.stdout.write(f"{'class':<10} {'depth':>7} {'tasks':>8} {'mean wait':>10} {'mean run':>10}")
+        for row in queue_report(hours=options['hours']):
+            self.stdout.write(
+                f"{row['queue']:<10} {row['depth']:>7} {row['tasks']:>8} "
+                f"{seconds(row['mean_wait']):>10} {seconds(row['mean_run']):>10}"
+            )
+
+        if options['tasks']:
+            for queue, names in tasks_by_class().items():
+                self.stdout.write(f'\n{queue}:')
+                for name in names:
+                    self.stdout.write(f'  {name}')
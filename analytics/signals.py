@@ -0,0 +1,38 @@
+import time
+
+from celery import signals
+
+from .task_queues import PUBLISHED_HEADER, record_task
+
+# Start time of the tasks running in this worker process, by task id.
+_started = {}
+
+
+@signals.before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_HEADER, time.time())
+
+
+@signals.task_prerun.connect
+def mark_task_start(task_id=None, **kwargs):
+    _started[task_id] = time.time()
+
+
+@signals.task_postrun.connect
+def record_task_timing(task_id=None, task=None, **kwargs):
+    '''
+    Records how long the task waited between publish and start, and how long
+    it ran, under the queue it was delivered from (its task class).
+    '''
+    started = _started.pop(task_id, None)
+    if started is None or task is None or task.request.is_eager:
+        return
+    published = getattr(task.request, PUBLISHED_HEADER, None)
+    queue = (task.request.delivery_info or {}).get('routing_key') or task.queue or task.app.conf.task_default_queue
+    record_task(
+        queue,
+        started - float(published) if published else None,
+        time.time() - started,
+        now=started,
+    )
@@ -0,0 +1,100 @@
+import logging
+import time
+
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'celery:queue-stats:{queue}:{hour}'
+STATS_TTL = 48 * 60 * 60
+
+# Message header stamped by the publisher, read back by the worker.
+PUBLISHED_HEADER = 'published_at'
+
+
+def _redis_client():
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client()
+
+
+def task_classes():
+    'Returns the task classes (queue names): the configured worker classes, then the default queue.'
+    classes = list(getattr(settings, 'CELERY_WORKER_CLASSES', {}))
+    default = current_app.conf.task_default_queue
+    return classes + ([default] if default not in classes else [])
+
+
+def tasks_by_class():
+    'Maps each task class to the names of the registered tasks annotated with it.'
+    # Make sure every app's tasks module is registered, not only those imported so far.
+    current_app.loader.import_default_modules()
+    default = current_app.conf.task_default_queue
+    grouped = {}
+    for name, task in sorted(current_app.tasks.items()):
+        if name.startswith('celery.'):
+            continue
+        grouped.setdefault(task.queue or default, []).append(name)
+    return grouped
+
+
+def record_task(queue, wait_seconds, run_seconds, now=None):
+    '''
+    Adds one executed task to the hourly stats of its class: how long it
+    waited in the queue and how long it ran. A no-op without Redis.
+    '''
+    client = _redis_client()
+    if client is None:
+        return
+    key = STATS_KEY.format(queue=queue, hour=int((now or time.time()) // 3600))
+    pipe = client.pipeline()
+    pipe.hincrby(key, 'tasks', 1)
+    if wait_seconds is not None:
+        pipe.hincrby(key, 'waited', 1)
+        pipe.hincrby(key, 'wait_ms', int(wait_seconds * 1000))
+    pipe.hincrby(key, 'run_ms', int(run_seconds * 1000))
+    pipe.expire(key, STATS_TTL)
+    pipe.execute()
+
+
+def queue_depth(queue):
+    'Returns the number of messages waiting in `queue` on the broker.'
+    try:
+        with current_app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as e:
+        # Passive declares fail for queues nothing was ever sent to.
+        logger.debug(f'Could not read the depth of queue {queue}: {e}')
+        return 0
+
+
+def queue_report(hours=1, now=None):
+    '''
+    Returns one row per task class with its current depth and, over the last
+    `hours`, the tasks executed and their mean wait and run time (seconds).
+    '''
+    client = _redis_client()
+    current_hour = int((now or time.time()) // 3600)
+    rows = []
+    for queue in task_classes():
+        totals = {'tasks': 0, 'waited': 0, 'wait_ms': 0, 'run_ms': 0}
+        if client is not None:
+            pipe = client.pipeline()
+            for hour in range(current_hour - hours + 1, current_hour + 1):
+                pipe.hgetall(STATS_KEY.format(queue=queue, hour=hour))
+            for stats in pipe.execute():
+                for field, value in stats.items():
+                    field = field.decode() if isinstance(field, bytes) else field
+                    if field in totals:
+                        totals[field] += int(value)
+        rows.append({
+            'queue': queue,
+            'depth': queue_depth(queue),
+            'tasks': totals['tasks'],
+            'mean_wait': round(totals['wait_ms'] / totals['waited'] / 1000, 3) if totals['waited'] else None,
+            'mean_run': round(totals['run_ms'] / totals['tasks'] / 1000, 3) if totals['tasks'] else None,
+        })
+    return rows
@@ -8,7 +8,7 @@ from datetime import date, timedelta
 from django.db.models import Sum, Count, Avg, F
 from .models import UserAnalytics, ContentAnalytics
 
-@shared_task
+@shared_task(queue='realtime')
 def ingest_play_event(event):
     """
     Ingests a play event. This is a simplified implementation.
@@ -41,7 +41,7 @@ def ingest_play_event(event):
     # redis_client.sadd(f'content:{event["track_id"]}:daily_listeners', event.get('user_id'))
 
 
-@shared_task
+@shared_task(queue='batch')
 def aggregate_daily_user_analytics(day=None):
     """
     Aggregates user play data for a given day.
@@ -75,7 +75,7 @@ def aggregate_daily_user_analytics(day=None):
     duration = time.time() - start_time
     # analytics_aggregation_runtime_seconds.labels(aggregator_type='user_analytics').observe(duration)
 
-@shared_task
+@shared_task(queue='batch')
 def aggregate_daily_content_analytics(day=None):
     """
     Aggregates content play data for a given day.
@@ -0,0 +1,142 @@
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from celery import current_app
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from analytics.signals import mark_task_start, record_task_timing
+from analytics.task_queues import queue_report, record_task, tasks_by_class
+from Spotify_Clone.celery import configure_worker_class
+
+WORKER_CLASSES = {
+    'media': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'realtime': {'concurrency': 8, 'prefetch_multiplier': 4},
+    'batch': {'concurrency': 2, 'prefetch_multiplier': 1},
+}
+
+
+class FakeRedis:
+    'Hash commands used by the queue stats, returning bytes like redis-py.'
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hincrby(self, key, field, amount):
+        hash_ = self.hashes.setdefault(key, {})
+        hash_[field.encode()] = str(int(hash_.get(field.encode(), 0)) + amount).encode()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def expire(self, key, seconds):
+        pass
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+
+class TaskClassTest(SimpleTestCase):
+    def test_tasks_are_annotated_with_their_class(self):
+        classes = tasks_by_class()
+
+        self.assertIn('artists.tasks.process_audio_upload', classes['media'])
+        self.assertIn('streaming.tasks.encode_variant', classes['media'])
+        self.assertIn('notifications.tasks.deliver_notification', classes['realtime'])
+        self.assertIn('analytics.tasks.aggregate_daily_user_analytics', classes['batch'])
+
+    def test_every_project_task_has_a_known_class(self):
+        classes = tasks_by_class()
+
+        self.assertLessEqual(set(classes), set(WORKER_CLASSES))
+        for name in sum(classes.values(), []):
+            self.assertIsNotNone(current_app.tasks[name].queue, name)
+
+    @override_settings(CELERY_WORKER_CLASSES=WORKER_CLASSES)
+    def test_single_class_worker_takes_its_class_settings(self):
+        conf = SimpleNamespace(worker_concurrency=None, worker_prefetch_multiplier=4)
+
+        configure_worker_class(conf=conf, options={'queues': ['media']})
+
+        self.assertEqual((conf.worker_concurrency, conf.worker_prefetch_multiplier), (2, 1))
+
+    @override_settings(CELERY_WORKER_CLASSES=WORKER_CLASSES)
+    def test_command_line_and_mixed_workers_are_left_alone(self):
+        conf = SimpleNamespace(worker_concurrency=None, worker_prefetch_multiplier=4)
+
+        configure_worker_class(conf=conf, options={'queues': ['media'], 'concurrency': 6})
+        configure_worker_class(conf=conf, options={'queues': ['media', 'batch']})
+
+        self.assertEqual((conf.worker_concurrency, conf.worker_prefetch_multiplier), (None, 1))
+
+
+@override_settings(CELERY_WORKER_CLASSES=WORKER_CLASSES)
+class QueueReportTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = patch('analytics.task_queues._redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        depths = {'media': 3, 'realtime': 0, 'batch': 1}
+        patcher = patch('analytics.task_queues.queue_depth', side_effect=depths.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_report_separates_the_classes(self):
+        now = 10 * 3600 + 5
+        record_task('media', 4.0, 90.0, now=now)
+        record_task('media', 2.0, 30.0, now=now)
+        record_task('realtime', 0.01, 0.02, now=now)
+        record_task('realtime', None, 0.04, now=now)
+
+        rows = {row['queue']: row for row in queue_report(now=now)}
+
+        self.assertEqual(rows['media'], {'queue': 'media', 'depth': 3, 'tasks': 2, 'mean_wait': 3.0, 'mean_run': 60.0})
+        self.assertEqual((rows['realtime']['mean_wait'], rows['realtime']['mean_run']), (0.01, 0.03))
+        self.assertEqual((rows['batch']['tasks'], rows['batch']['mean_wait']), (0, None))
+
+    def test_report_only_covers_the_requested_hours(self):
+        record_task('batch', 1.0, 1.0, now=8 * 3600)
+        record_task('batch', 3.0, 1.0, now=10 * 3600)
+
+        rows = {row['queue']: row for row in queue_report(hours=1, now=10 * 3600)}
+        self.assertEqual(rows['batch']['tasks'], 1)
+        rows = {row['queue']: row for row in queue_report(hours=3, now=10 * 3600)}
+        self.assertEqual((rows['batch']['tasks'], rows['batch']['mean_wait']), (2, 2.0))
+
+    def test_worker_signals_record_wait_and_run_time(self):
+        task = SimpleNamespace(
+            queue='media',
+            app=current_app,
+            request=SimpleNamespace(is_eager=False, published_at=100.0, delivery_info={'routing_key': 'media'}),
+        )
+
+        with patch('analytics.signals.time.time', side_effect=[102.0, 112.0]):
+            mark_task_start(task_id='abc')
+            record_task_timing(task_id='abc', task=task)
+
+        rows = {row['queue']: row for row in queue_report(now=102.0)}
+        self.assertEqual((rows['media']['mean_wait'], rows['media']['mean_run']), (2.0, 10.0))
+
+    def test_command_prints_one_line_per_class(self):
+        record_task('media', 4.0, 90.0)
+        out = StringIO()
+
+        call_command('queue_report', '--tasks', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split()[:3], ['media', '3', '1'])
+        self.assertIn('  artists.tasks.process_audio_upload', lines)
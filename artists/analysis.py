@@ -0,0 +1,207 @@
+import math
+
+import numpy as np
+from django.conf import settings
+from scipy.signal import firwin, lfilter
+
+from .fingerprint import Fingerprinter
+from .waveform import WaveformAccumulator, decode_pcm
+
+ANALYSIS_SAMPLE_RATE = 48000
+
+# ITU-R BS.1770-4 gating parameters.
+GATE_BLOCK_SUBBLOCKS = 4  # 400ms gating blocks built from 100ms sub-blocks (75% overlap)
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+TRUE_PEAK_OVERSAMPLING = 4
+TRUE_PEAK_TAPS = 48
+
+
+def _k_weighting(sample_rate):
+    '''
+    Returns the two K-weighting biquads (high shelf, then RLB high-pass) for
+    `sample_rate`, derived the same way as libebur128.
+    '''
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = np.array([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0])
+    shelf_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass_b = np.array([1.0, -2.0, 1.0])
+    highpass_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    return [(shelf_b, shelf_a), (highpass_b, highpass_a)]
+
+
+def _to_db(value):
+    return 20 * math.log10(value) if value > 0 else None
+
+
+class AudioAnalyzer:
+    '''
+    Computes integrated loudness (EBU R128 / BS.1770), true peak, sample
+    peak, duration and waveform peaks from interleaved float PCM fed chunk
+    by chunk. Filter state is carried between chunks, so the results are the
+    same however the stream is split.
+    '''
+
+    def __init__(self, sample_rate=ANALYSIS_SAMPLE_RATE, channels=2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+        self.waveform = WaveformAccumulator(sample_rate)
+
+        self._filters = _k_weighting(sample_rate)
+        self._filter_state = [np.zeros((2, channels)) for _ in self._filters]
+        self._subblock_size = sample_rate // 10
+        self._pending_energy = np.empty((0, channels))
+        self._subblock_energies = []
+
+        interpolator = firwin(TRUE_PEAK_TAPS, 1 / TRUE_PEAK_OVERSAMPLING) * TRUE_PEAK_OVERSAMPLING
+        self._phases = [interpolator[p::TRUE_PEAK_OVERSAMPLING] for p in range(TRUE_PEAK_OVERSAMPLING)]
+        self._peak_history = np.zeros((len(self._phases[0]) - 1, channels))
+
+    def feed(self, samples):
+        frames = np.asarray(samples, dtype=np.float64).reshape(-1, self.channels)
+        if not len(frames):
+            return
+        self.frames += len(frames)
+
+        self.waveform.feed(frames.mean(axis=1))
+        self.sample_peak = max(self.sample_peak, float(np.abs(frames).max()))
+        self._feed_true_peak(frames)
+        self._feed_loudness(frames)
+
+    def _feed_true_peak(self, frames):
+        # Polyphase 4x interpolation: each phase is a short FIR over the original samples.
+        padded = np.concatenate([self._peak_history, frames])
+        for channel in range(self.channels):
+            for phase in self._phases:
+                interpolated = np.convolve(padded[:, channel], phase, mode='valid')
+                self.true_peak = max(self.true_peak, float(np.abs(interpolated).max()))
+        self._peak_history = padded[-len(self._peak_history):]
+
+    def _feed_loudness(self, frames):
+        weighted = frames
+        for i, (b, a) in enumerate(self._filters):
+            weighted, self._filter_state[i] = lfilter(b, a, weighted, axis=0, zi=self._filter_state[i])
+
+        energy = np.concatenate([self._pending_energy, np.square(weighted)])
+        whole = len(energy) - len(energy) % self._subblock_size
+        if whole:
+            blocks = energy[:whole].reshape(-1, self._subblock_size, self.channels)
+            self._subblock_energies.append(blocks.mean(axis=1))
+        self._pending_energy = energy[whole:]
+
+    def integrated_loudness(self):
+        if not self._subblock_energies:
+            return None
+        subblocks = np.concatenate(self._subblock_energies)
+        if len(subblocks) < GATE_BLOCK_SUBBLOCKS:
+            return None
+
+        # Mean square of each overlapping 400ms block, summed over channels (all weights are 1).
+        cumulative = np.concatenate([np.zeros((1, self.channels)), np.cumsum(subblocks, axis=0)])
+        block_energy = (
+            (cumulative[GATE_BLOCK_SUBBLOCKS:] - cumulative[:-GATE_BLOCK_SUBBLOCKS]) / GATE_BLOCK_SUBBLOCKS
+        ).sum(axis=1)
+
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(block_energy)
+        gated = block_energy[block_loudness > ABSOLUTE_GATE_LUFS]
+        if not len(gated):
+            return None
+
+        relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+        gated = block_energy[(block_loudness > ABSOLUTE_GATE_LUFS) & (block_loudness > relative_gate)]
+        return round(float(-0.691 + 10 * np.log10(gated.mean())), 2)
+
+    def normalization_gain(self, loudness):
+        '''
+        Returns the gain (dB) that brings the track to the target loudness
+        without pushing the true peak above the ceiling.
+        '''
+        if loudness is None:
+            return 0.0
+        target = getattr(settings, 'CATALOG_LOUDNESS_TARGET_LUFS', -14.0)
+        ceiling = getattr(settings, 'CATALOG_TRUE_PEAK_CEILING_DBTP', -1.0)
+        gain = target - loudness
+        true_peak_db = _to_db(self.true_peak)
+        if true_peak_db is not None:
+            gain = min(gain, ceiling - true_peak_db)
+        return round(gain, 2)
+
+    def loudest_window(self, seconds):
+        '''
+        Returns the start (ms) of the `seconds`-long window with the most
+        K-weighted energy, on the 100ms sub-block grid; 0 when the track is
+        not longer than the window.
+        '''
+        if not self._subblock_energies or seconds <= 0:
+            return 0
+        energy = np.concatenate(self._subblock_energies).sum(axis=1)
+        width = int(seconds * 10)
+        if len(energy) <= width:
+            return 0
+        cumulative = np.concatenate([[0.0], np.cumsum(energy)])
+        return int(np.argmax(cumulative[width:] - cumulative[:-width])) * 100
+
+    def finish(self):
+        loudness = self.integrated_loudness()
+        true_peak_db = _to_db(self.true_peak)
+        sample_peak_db = _to_db(self.sample_peak)
+        return {
+            'duration_ms': int(self.frames * 1000 / self.sample_rate),
+            'integrated_lufs': loudness,
+            'true_peak_dbtp': round(true_peak_db, 2) if true_peak_db is not None else None,
+            'sample_peak_dbfs': round(sample_peak_db, 2) if sample_peak_db is not None else None,
+            'gain_db': self.normalization_gain(loudness),
+            'waveform': self.waveform.finish(),
+            'preview_start_ms': self.loudest_window(getattr(settings, 'CATALOG_PREVIEW_SECONDS', 30)),
+        }
+
+
+def analyze_audio(input_path, channels=2, pcm_output_path=None, fingerprint=False):
+    '''
+    Decodes `input_path` exactly once and analyses it chunk by chunk. When
+    `pcm_output_path` is given the decoded PCM (f32le, ANALYSIS_SAMPLE_RATE)
+    is written there as it streams past, so the encoders can read it without
+    another decode. With `fingerprint` the result also carries the landmark
+    fingerprint of the same PCM.
+    '''
+    channels = max(1, min(int(channels or 2), 2))
+    analyzer = AudioAnalyzer(ANALYSIS_SAMPLE_RATE, channels)
+    fingerprinter = Fingerprinter(ANALYSIS_SAMPLE_RATE, channels) if fingerprint else None
+    pcm_file = open(pcm_output_path, 'wb') if pcm_output_path else None
+    try:
+        for samples in decode_pcm(input_path, sample_rate=ANALYSIS_SAMPLE_RATE, channels=channels):
+            if pcm_file:
+                pcm_file.write(samples.tobytes())
+            analyzer.feed(samples)
+            if fingerprinter:
+                fingerprinter.feed(samples)
+    finally:
+        if pcm_file:
+            pcm_file.close()
+
+    result = analyzer.finish()
+    result['channels'] = channels
+    result['sample_rate'] = ANALYSIS_SAMPLE_RATE
+    if fingerprinter:
+        result['fingerprint'] = fingerprinter.finish()
+    return result
+
+
+def pcm_input_options(analysis):
+    '''
+    Returns the ffmpeg input options for reading the raw PCM written by analyze_audio.
+    '''
+    return {'format': 'f32le', 'ar': analysis['sample_rate'], 'ac': analysis['channels']}
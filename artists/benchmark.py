@@ -0,0 +1,244 @@
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+import wave
+
+import numpy as np
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.test import override_settings
+
+from .pipeline import stage_completed, work_dir_root
+
+SIGNALS = ('sweep', 'noise')
+CODECS = {
+    'wav': [],
+    'flac': ['-acodec', 'flac'],
+    'mp3': ['-acodec', 'libmp3lame', '-b:a', '320k'],
+    'm4a': ['-acodec', 'aac', '-b:a', '256k'],
+}
+CHUNK_SECONDS = 10
+
+
+def _chunks(kind, seconds, sample_rate, channels, seed=0):
+    '''
+    Yields float samples of a synthetic master, CHUNK_SECONDS at a time:
+    a logarithmic sine sweep from 20Hz to just below Nyquist, or white noise
+    (seeded, so masters are reproducible). Both sit at -6 dBFS.
+    '''
+    total = int(seconds * sample_rate)
+    amplitude = 10 ** (-6 / 20)
+    rng = np.random.default_rng(seed)
+    low, high = 20.0, min(20000.0, sample_rate / 2 * 0.9)
+    rate = np.log(high / low)
+    for start in range(0, total, CHUNK_SECONDS * sample_rate):
+        t = np.arange(start, min(start + CHUNK_SECONDS * sample_rate, total)) / sample_rate
+        if kind == 'sweep':
+            phase = 2 * np.pi * low * seconds / rate * (np.exp(t / seconds * rate) - 1)
+            mono = amplitude * np.sin(phase)
+        elif kind == 'noise':
+            mono = amplitude * rng.uniform(-1, 1, len(t))
+        else:
+            raise ValueError(f'Unknown signal {kind!r}, expected one of {SIGNALS}.')
+        yield np.repeat(mono[:, None], channels, axis=1)
+
+
+def write_wav(path, kind, seconds, sample_rate, channels=2):
+    'Writes a 16-bit PCM WAV of the synthetic signal, chunk by chunk.'
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for chunk in _chunks(kind, seconds, sample_rate, channels):
+            wav.writeframes((chunk * 32767).astype('<i2').tobytes())
+    return path
+
+
+def make_master(directory, kind, seconds, sample_rate, codec='wav', channels=2):
+    '''
+    Generates a synthetic master in `directory` and returns its path. Codecs
+    other than WAV are encoded from the WAV with ffmpeg.
+    '''
+    name = f'{kind}_{seconds}s_{sample_rate}hz'
+    wav_path = write_wav(os.path.join(directory, f'{name}.wav'), kind, seconds, sample_rate, channels)
+    if codec == 'wav':
+        return wav_path
+    path = os.path.join(directory, f'{name}.{codec}')
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-i', wav_path, *CODECS[codec], path], check=True, capture_output=True
+    )
+    os.remove(wav_path)
+    return path
+
+
+def _tree_size(*roots):
+    total = 0
+    for root in roots:
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(directory, filename))
+                except OSError:
+                    pass
+    return total
+
+
+def _cpu_seconds():
+    # ffmpeg runs in child processes, so their (reaped) CPU time counts too.
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux. The children figure is the largest single child.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+class StageRecorder:
+    '''
+    Collects wall time, CPU time, peak RSS and bytes written for each
+    checkpointed stage of one pipeline run. Bytes written is the growth of
+    the work directory and media root since the previous stage (the work
+    directory is removed once the run finishes, so only growth is counted).
+    '''
+
+    def __init__(self, key, roots):
+        self.key = key
+        self.roots = roots
+        self.stages = []
+
+    def __enter__(self):
+        self._cpu = _cpu_seconds()
+        self._bytes = _tree_size(*self.roots)
+        self._started = time.monotonic()
+        stage_completed.connect(self._on_stage, sender=None, weak=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        stage_completed.disconnect(self._on_stage)
+        self.wall_seconds = round(time.monotonic() - self._started, 3)
+
+    def _on_stage(self, sender, key, stage, seconds, **kwargs):
+        if key != self.key:
+            return
+        cpu = _cpu_seconds()
+        size = _tree_size(*self.roots)
+        self.stages.append({
+            'stage': stage,
+            'wall_seconds': seconds,
+            'cpu_seconds': round(cpu - self._cpu, 3),
+            'peak_rss_mb': _peak_rss_mb(),
+            'bytes_written': max(0, size - self._bytes),
+        })
+        self._cpu, self._bytes = cpu, size
+
+
+def _catalog_objects(master_path):
+    from .models import Album, Artist, Track
+
+    suffix = uuid.uuid4().hex[:12]
+    artist = Artist.objects.create(name='Benchmark', slug=f'benchmark-{suffix}')
+    album = Album.objects.create(title='Benchmark', slug=f'benchmark-{suffix}', primary_artist=artist)
+    track = Track(
+        title=os.path.basename(master_path), slug=f'benchmark-{suffix}', album=album, primary_artist=artist,
+        track_number=1, duration_ms=1,
+    )
+    with open(master_path, 'rb') as f:
+        track.audio_original.save(os.path.basename(master_path), File(f), save=False)
+    track.save()
+    return track
+
+
+def _run_catalog(master_path):
+    from .tasks import process_audio_upload
+
+    track = _catalog_objects(master_path)
+    return f'track-{track.pk}', lambda: process_audio_upload(track.pk)
+
+
+def _run_streaming(master_path):
+    from streaming.models import AudioFile
+    from streaming.tasks import process_audio_file
+
+    audio_file = AudioFile(track=_catalog_objects(master_path))
+    with open(master_path, 'rb') as f:
+        audio_file.original_file.save(os.path.basename(master_path), File(f), save=False)
+    audio_file.save()
+    return f'audiofile-{audio_file.pk}', lambda: process_audio_file(audio_file.pk)
+
+
+PIPELINES = {
+    'catalog': _run_catalog,  # artists.tasks.process_audio_upload
+    'streaming': _run_streaming,  # streaming.tasks.process_audio_file
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run_case(pipeline, master_path, seconds):
+    '''
+    Runs one pipeline on a master against FileSystemStorage in a scratch
+    media root and returns its measurements. The database rows are rolled
+    back afterwards, so repeated runs never hit the duplicate-master reuse.
+    '''
+    with tempfile.TemporaryDirectory(prefix='pipeline-bench-') as media_root, override_settings(
+        MEDIA_ROOT=media_root,
+        STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}},
+    ):
+        result = {'pipeline': pipeline, 'error': None}
+        try:
+            with transaction.atomic():
+                key, run = PIPELINES[pipeline](master_path)
+                with StageRecorder(key, [media_root, work_dir_root()]) as recorder:
+                    try:
+                        run()
+                    except Exception as e:
+                        result['error'] = f'{type(e).__name__}: {e}'
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    result['stages'] = recorder.stages
+    result['wall_seconds'] = recorder.wall_seconds
+    result['cpu_seconds'] = round(sum(stage['cpu_seconds'] for stage in recorder.stages), 3)
+    result['peak_rss_mb'] = max((stage['peak_rss_mb'] for stage in recorder.stages), default=None)
+    result['bytes_written'] = sum(stage['bytes_written'] for stage in recorder.stages)
+    result['seconds_per_audio_minute'] = round(recorder.wall_seconds / (seconds / 60), 3)
+    return result
+
+
+def environment():
+    'Describes the machine and pipeline settings, so result files can be compared fairly.'
+    try:
+        ffmpeg_version = subprocess.run(
+            ['ffmpeg', '-version'], capture_output=True, text=True, check=True
+        ).stdout.splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        ffmpeg_version = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version,
+        'hls_variants': getattr(settings, 'CATALOG_HLS_VARIANTS', None),
+        'transcode_mode': getattr(settings, 'CATALOG_TRANSCODE_MODE', None),
+        'transcode_concurrency': getattr(settings, 'CATALOG_TRANSCODE_CONCURRENCY', None),
+        'preview_seconds': getattr(settings, 'CATALOG_PREVIEW_SECONDS', None),
+    }
@@ -0,0 +1,109 @@
+import numpy as np
+from scipy.signal import firwin, lfilter
+
+FINGERPRINT_SAMPLE_RATE = 8000
+FINGERPRINT_VERSION = 1
+
+# 256ms Hann frames every 128ms: ~7.8 frames a second, 3.9Hz per bin below 4kHz.
+FRAME_SIZE = 2048
+HOP_SIZE = 1024
+MIN_BIN = 26  # ignore everything below ~100Hz (rumble, DC)
+PEAKS_PER_FRAME = 2
+PEAK_FLOOR = 1e-4
+PEAK_PROMINENCE = 2.0  # a peak must sit this many nepers above the frame's median magnitude
+# Each anchor peak is paired with the next FAN_OUT peaks within MAX_DELTA frames (~4s).
+FAN_OUT = 3
+MAX_DELTA = 31
+DECIMATION_TAPS = 63
+
+
+def landmark_hash(anchor_bin, target_bin, delta):
+    'Packs a peak pair into 23 bits: 9 per (halved) frequency bin, 5 for the frame distance.'
+    return (anchor_bin >> 1) << 14 | (target_bin >> 1) << 5 | delta
+
+
+class Fingerprinter:
+    '''
+    Builds a spectral-peak landmark fingerprint from interleaved float PCM
+    fed chunk by chunk. The audio is mixed down and decimated to 8kHz, the
+    strongest peaks of each short-time spectrum are kept and pairs of nearby
+    peaks are hashed with the time between them, which survives re-encoding,
+    resampling and gain changes. Filter state is carried between chunks, so
+    the landmarks are the same however the stream is split.
+    '''
+
+    def __init__(self, sample_rate=FINGERPRINT_SAMPLE_RATE, channels=2):
+        if sample_rate % FINGERPRINT_SAMPLE_RATE:
+            raise ValueError(f'Fingerprints need a multiple of {FINGERPRINT_SAMPLE_RATE}Hz, got {sample_rate}Hz.')
+        self.channels = channels
+        self.frames = 0
+        self.sample_rate = sample_rate
+        self._factor = sample_rate // FINGERPRINT_SAMPLE_RATE
+        if self._factor > 1:
+            self._taps = firwin(DECIMATION_TAPS, 0.9 / self._factor)
+            self._filter_state = np.zeros(DECIMATION_TAPS - 1)
+        self._phase = 0
+        self._window = np.hanning(FRAME_SIZE)
+        self._pending = np.empty(0)
+        self._frame_index = 0
+        self._peaks = []
+
+    def feed(self, samples):
+        frames = np.asarray(samples, dtype=np.float64).reshape(-1, self.channels)
+        if not len(frames):
+            return
+        self.frames += len(frames)
+
+        mono = frames.mean(axis=1)
+        if self._factor > 1:
+            mono, self._filter_state = lfilter(self._taps, 1.0, mono, zi=self._filter_state)
+            decimated = mono[self._phase::self._factor]
+            self._phase = (self._phase - len(mono)) % self._factor
+            mono = decimated
+        self._pending = np.concatenate([self._pending, mono])
+        self._find_peaks()
+
+    def _find_peaks(self):
+        count = 1 + (len(self._pending) - FRAME_SIZE) // HOP_SIZE if len(self._pending) >= FRAME_SIZE else 0
+        if not count:
+            return
+        windows = np.lib.stride_tricks.sliding_window_view(self._pending, FRAME_SIZE)[::HOP_SIZE][:count]
+        spectra = np.abs(np.fft.rfft(windows * self._window, axis=1))[:, MIN_BIN:-1]
+        self._pending = self._pending[count * HOP_SIZE:]
+
+        # Local maxima along frequency that stand out of their frame.
+        inner = spectra[:, 1:-1]
+        is_peak = (inner > spectra[:, :-2]) & (inner >= spectra[:, 2:]) & (inner > PEAK_FLOOR)
+        median = np.median(spectra, axis=1, keepdims=True)
+        is_peak &= np.log(inner + 1e-12) > np.log(median + 1e-12) + PEAK_PROMINENCE
+        strength = np.where(is_peak, inner, 0.0)
+        strongest = np.argsort(strength, axis=1)[:, -PEAKS_PER_FRAME:]
+        for row, bins in enumerate(strongest):
+            for column in sorted(bins):
+                if strength[row, column] > 0:
+                    self._peaks.append((self._frame_index + row, int(column) + 1 + MIN_BIN))
+        self._frame_index += count
+
+    def finish(self):
+        '''
+        Returns the fingerprint: the sorted, de-duplicated (hash, anchor
+        frame) landmarks and the duration it covers.
+        '''
+        landmarks = set()
+        for i, (anchor_frame, anchor_bin) in enumerate(self._peaks):
+            paired = 0
+            for target_frame, target_bin in self._peaks[i + 1:]:
+                delta = target_frame - anchor_frame
+                if delta > MAX_DELTA:
+                    break
+                if delta < 1:
+                    continue
+                landmarks.add((landmark_hash(anchor_bin, target_bin, delta), anchor_frame))
+                paired += 1
+                if paired == FAN_OUT:
+                    break
+        return {
+            'version': FINGERPRINT_VERSION,
+            'duration_ms': int(self.frames * 1000 / self.sample_rate),
+            'landmarks': sorted(landmarks, key=lambda landmark: (landmark[1], landmark[0])),
+        }
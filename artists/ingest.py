@@ -0,0 +1,297 @@
+import csv
+import io
+import json
+import logging
+import uuid
+from collections import Counter
+
+from celery import group
+from django.conf import settings
+from django.db import transaction
+from django.utils.text import slugify
+
+from search.indexing import refresh_search_vectors
+from .models import Album, AlbumArtist, Artist, Genre, Track, TrackArtist
+from .pages import schedule_artist_pages
+from .serializers import IngestManifestSerializer
+from .tasks import process_audio_upload
+from .uploads import upload_prefix
+
+logger = logging.getLogger(__name__)
+
+LIST_SEPARATOR = ';'
+TRUE_VALUES = ('true', '1', 't', 'yes', 'y')
+ALBUM_COLUMNS = {
+    'album_title': 'title',
+    'album_slug': 'slug',
+    'primary_artist': 'primary_artist',
+    'album_artists': 'artists',
+    'release_date': 'release_date',
+    'album_type': 'album_type',
+    'label': 'label',
+    'album_is_explicit': 'is_explicit',
+}
+LIST_COLUMNS = ('artists', 'featured_artists', 'genres', 'album_artists')
+LOOKUP_BATCH = 500
+
+
+class IngestError(Exception):
+    'The manifest cannot be ingested; `errors` says why, per album where possible.'
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} problem(s) in the manifest')
+        self.errors = errors
+
+
+def _batch_size():
+    return getattr(settings, 'CATALOG_INGEST_BATCH_SIZE', 1000)
+
+
+def _csv_albums(text):
+    '''
+    Groups CSV rows (one per track, album columns repeated) into albums.
+    Rows belong to the same album when they share album_slug, or else
+    primary_artist and album_title.
+    '''
+    albums = {}
+    for row in csv.DictReader(io.StringIO(text)):
+        row = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        row = {key: value for key, value in row.items() if value != ''}
+        for column in LIST_COLUMNS:
+            if column in row:
+                row[column] = [item.strip() for item in row[column].split(LIST_SEPARATOR) if item.strip()]
+        for column in ('is_explicit', 'album_is_explicit'):
+            if column in row:
+                row[column] = row[column].lower() in TRUE_VALUES
+        album = {field: row.pop(column) for column, field in ALBUM_COLUMNS.items() if column in row}
+        key = album.get('slug') or (album.get('primary_artist'), album.get('title'))
+        albums.setdefault(key, {**album, 'tracks': []})['tracks'].append(row)
+    return list(albums.values())
+
+
+def parse_manifest(content, format='json'):
+    '''
+    Reads a delivery manifest: JSON ({"albums": [...]}, a list of albums or a
+    single album with "tracks") or CSV with one row per track. Returns the
+    albums as plain dicts, not yet validated.
+    '''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if format == 'csv':
+        return _csv_albums(content)
+    data = json.loads(content) if isinstance(content, str) else content
+    if isinstance(data, dict):
+        data = data['albums'] if 'albums' in data else [data]
+    return data
+
+
+def _unique_slug(text):
+    return f'{slugify(text)[:200]}-{uuid.uuid4().hex[:8]}'
+
+
+def _check_masters(names, user):
+    '''
+    Masters must exist in storage and, for non-staff users, have been
+    uploaded by the caller (under their upload prefix), so a manifest cannot
+    point a track at someone else's upload.
+    '''
+    errors = []
+    if user is not None and not user.is_staff:
+        prefix = upload_prefix(user)
+        foreign = sorted(name for name in set(names) if not name.startswith(prefix) or '..' in name)
+        if foreign:
+            errors.append(f"Masters not uploaded by you: {', '.join(foreign)}")
+        names = [name for name in names if name not in foreign]
+    storage = Track._meta.get_field('audio_original').storage
+    missing = sorted(name for name in set(names) if not storage.exists(name))
+    if missing:
+        errors.append(f"Masters not found in storage: {', '.join(missing)}")
+    return errors
+
+
+def _check_references(albums, user):
+    '''
+    Resolves every artist and genre slug with one query per table and checks
+    slugs, ISRCs, masters and (for non-staff users) artist management against
+    the database and storage. Returns (artists by slug, genres by slug) or raises IngestError.
+    '''
+    errors = []
+    artist_slugs, genre_slugs = set(), set()
+    album_slugs, track_slugs, isrcs, masters = [], [], [], []
+    for album in albums:
+        artist_slugs.add(album['primary_artist'])
+        artist_slugs.update(album['artists'])
+        album_slugs.extend([album['slug']] if album.get('slug') else [])
+        for track in album['tracks']:
+            artist_slugs.update(track['artists'] + track['featured_artists'])
+            genre_slugs.update(track['genres'])
+            track_slugs.extend([track['slug']] if track.get('slug') else [])
+            isrcs.extend([track['isrc']] if track.get('isrc') else [])
+            masters.extend([track['audio_original']] if track.get('audio_original') else [])
+
+    artists = {artist.slug: artist for artist in Artist.objects.filter(slug__in=artist_slugs)}
+    genres = dict(Genre.objects.filter(slug__in=genre_slugs).values_list('slug', 'pk'))
+    if artist_slugs - set(artists):
+        errors.append(f"Unknown artists: {', '.join(sorted(artist_slugs - set(artists)))}")
+    if genre_slugs - set(genres):
+        errors.append(f"Unknown genres: {', '.join(sorted(genre_slugs - set(genres)))}")
+
+    for label, values, model, field in (
+        ('album slugs', album_slugs, Album, 'slug'),
+        ('track slugs', track_slugs, Track, 'slug'),
+        ('ISRCs', isrcs, Track, 'isrc'),
+    ):
+        repeated = [value for value, count in Counter(values).items() if count > 1]
+        if repeated:
+            errors.append(f"Repeated {label} in the manifest: {', '.join(sorted(repeated))}")
+        taken = set()
+        for start in range(0, len(values), LOOKUP_BATCH):
+            lookup = {f'{field}__in': values[start:start + LOOKUP_BATCH]}
+            taken.update(model.objects.filter(**lookup).values_list(field, flat=True))
+        if taken:
+            errors.append(f"Existing {label}: {', '.join(sorted(taken))}")
+
+    errors.extend(_check_masters(masters, user))
+
+    if user is not None and not user.is_staff:
+        managed = set(user.managed_artists.filter(slug__in=artist_slugs).values_list('slug', flat=True))
+        foreign = {album['primary_artist'] for album in albums} - managed
+        if foreign:
+            errors.append(f"You do not manage: {', '.join(sorted(foreign))}")
+
+    if errors:
+        raise IngestError(errors)
+    return artists, genres
+
+
+def validate_manifest(albums, user=None):
+    '''
+    Validates the albums of a parsed manifest and resolves their references.
+    Returns (validated albums, artists by slug, genres by slug); raises
+    IngestError listing every problem found, so nothing is half-ingested.
+    '''
+    serializer = IngestManifestSerializer(data={'albums': albums})
+    if not serializer.is_valid():
+        errors = []
+        for index, album_errors in enumerate(serializer.errors.get('albums', [])):
+            if album_errors:
+                title = albums[index].get('title', '') if isinstance(albums[index], dict) else ''
+                errors.append({'album': index, 'title': title, 'errors': album_errors})
+        raise IngestError(errors or [serializer.errors])
+    albums = serializer.validated_data['albums']
+    artists, genres = _check_references(albums, user)
+    return albums, artists, genres
+
+
+def _write_batch(batch, artists, genres, transcode=True):
+    '''
+    Inserts a batch of albums with their tracks, artist through-rows and
+    genre links using one bulk INSERT per table and rebuilds their search
+    vectors with one UPDATE per table. Returns (albums, tracks).
+    '''
+    albums, album_artists, tracks, track_artists, genre_links = [], [], [], [], []
+    for data in batch:
+        primary = artists[data['primary_artist']]
+        album = Album(
+            title=data['title'],
+            slug=data.get('slug') or _unique_slug(f"{primary.name} {data['title']}"),
+            primary_artist=primary,
+            release_date=data.get('release_date'),
+            album_type=data['album_type'],
+            label=data.get('label') or None,
+            is_explicit=data['is_explicit'],
+            total_tracks=len(data['tracks']),
+        )
+        albums.append(album)
+        # Listed artists are primary, as with AlbumViewSet.create; the primary artist is always listed.
+        album_artists.extend(
+            AlbumArtist(album=album, artist=artists[slug], role=AlbumArtist.ArtistRole.PRIMARY)
+            for slug in dict.fromkeys([primary.slug] + data['artists'])
+        )
+
+        for item in data['tracks']:
+            track = Track(
+                title=item['title'],
+                slug=item.get('slug') or _unique_slug(f"{primary.name} {item['title']}"),
+                album=album,
+                primary_artist=primary,
+                track_number=item['track_number'],
+                disc_number=item['disc_number'],
+                duration_ms=item['duration_ms'],
+                is_explicit=item['is_explicit'],
+                isrc=item.get('isrc') or None,
+                audio_original=item.get('audio_original') or '',
+                status=(
+                    Track.ProcessingStatus.PROCESSING if transcode and item.get('audio_original')
+                    else Track.ProcessingStatus.PENDING
+                ),
+            )
+            tracks.append(track)
+            # Same roles as TrackViewSet.create: listed artists (and the primary artist) are primary.
+            roles = {slug: TrackArtist.ArtistRole.PRIMARY for slug in [primary.slug] + item['artists']}
+            for slug in item['featured_artists']:
+                roles.setdefault(slug, TrackArtist.ArtistRole.FEATURED)
+            track_artists.extend(TrackArtist(track=track, artist=artists[slug], role=role) for slug, role in roles.items())
+            genre_links.extend(
+                Track.genres.through(track=track, genre_id=genres[slug]) for slug in dict.fromkeys(item['genres'])
+            )
+
+    Album.objects.bulk_create(albums)
+    AlbumArtist.objects.bulk_create(album_artists)
+    Track.objects.bulk_create(tracks)
+    TrackArtist.objects.bulk_create(track_artists)
+    Track.genres.through.objects.bulk_create(genre_links)
+    refresh_search_vectors(Album, [album.pk for album in albums])
+    refresh_search_vectors(Track, [track.pk for track in tracks])
+    return albums, tracks
+
+
+def _credited_slugs(batch):
+    for album in batch:
+        yield album['primary_artist']
+        yield from album['artists']
+        for track in album['tracks']:
+            yield from track['artists'] + track['featured_artists']
+
+
+def enqueue_transcodes(track_ids):
+    'Queues the transcodes of freshly ingested tracks as one Celery group.'
+    if track_ids:
+        group(process_audio_upload.si(track_id) for track_id in track_ids).apply_async()
+
+
+def ingest_albums(albums, user=None, batch_size=None, transcode=True):
+    '''
+    Validates a parsed manifest, then writes it in batches of about
+    `batch_size` tracks (CATALOG_INGEST_BATCH_SIZE), each in its own
+    transaction. The transcodes of every batch are queued as one group once
+    the batch is committed. Returns a summary of what was created.
+    '''
+    albums, artists, genres = validate_manifest(albums, user)
+    batch_size = batch_size or _batch_size()
+    summary = {'albums': 0, 'tracks': 0, 'transcodes': 0, 'album_slugs': []}
+
+    def flush(batch):
+        with transaction.atomic():
+            created_albums, created_tracks = _write_batch(batch, artists, genres, transcode)
+            to_transcode = [str(track.pk) for track in created_tracks if track.audio_original]
+            if transcode:
+                transaction.on_commit(lambda: enqueue_transcodes(to_transcode))
+            # bulk_create sends no signals, so the credited artists' pages are scheduled here.
+            schedule_artist_pages({artists[slug].pk for slug in _credited_slugs(batch)})
+        summary['albums'] += len(created_albums)
+        summary['tracks'] += len(created_tracks)
+        summary['transcodes'] += len(to_transcode) if transcode else 0
+        summary['album_slugs'].extend(album.slug for album in created_albums)
+        logger.info(f'Ingested {len(created_albums)} albums with {len(created_tracks)} tracks.')
+
+    batch, batch_tracks = [], 0
+    for album in albums:
+        batch.append(album)
+        batch_tracks += len(album['tracks'])
+        if batch_tracks >= batch_size:
+            flush(batch)
+            batch, batch_tracks = [], 0
+    if batch:
+        flush(batch)
+    return summary
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from artists.benchmark import CODECS, PIPELINES, SIGNALS, environment, make_master, run_case
+
+
+def _csv(cast=str):
+    return lambda value: [cast(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the audio processing pipelines on synthetic masters against FileSystemStorage, '
+        'reporting wall time, CPU time, peak RSS and bytes written per stage.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pipelines', type=_csv(), default=list(PIPELINES),
+                            help=f"Pipelines to run ({', '.join(PIPELINES)}). Defaults to all.")
+        parser.add_argument('--signals', type=_csv(), default=list(SIGNALS),
+                            help=f"Synthetic signals ({', '.join(SIGNALS)}). Defaults to all.")
+        parser.add_argument('--durations', type=_csv(int), default=[30, 180],
+                            help='Master lengths in seconds. Defaults to 30,180.')
+        parser.add_argument('--sample-rates', type=_csv(int), default=[44100, 48000],
+                            help='Master sample rates. Defaults to 44100,48000.')
+        parser.add_argument('--codecs', type=_csv(), default=['wav', 'flac', 'mp3'],
+                            help=f"Master codecs ({', '.join(CODECS)}). Defaults to wav,flac,mp3.")
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per case. Defaults to 1.')
+        parser.add_argument('--output', default='pipeline-benchmark.json',
+                            help='Where to write the JSON results. Defaults to pipeline-benchmark.json.')
+        parser.add_argument('--baseline', help='A previous results file to compare against.')
+
+    def handle(self, *args, **options):
+        for option, known in (('pipelines', PIPELINES), ('signals', SIGNALS), ('codecs', CODECS)):
+            unknown = set(options[option]) - set(known)
+            if unknown:
+                raise CommandError(f"Unknown {option}: {', '.join(sorted(unknown))}")
+
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = {self._case_key(result): result for result in json.load(f)['results']}
+
+        results = []
+        with tempfile.TemporaryDirectory(prefix='pipeline-masters-') as masters:
+            for kind in options['signals']:
+                for seconds in options['durations']:
+                    for sample_rate in options['sample_rates']:
+                        for codec in options['codecs']:
+                            master = make_master(masters, kind, seconds, sample_rate, codec)
+                            case = {
+                                'signal': kind,
+                                'duration_seconds': seconds,
+                                'sample_rate': sample_rate,
+                                'codec': codec,
+                                'master_bytes': os.path.getsize(master),
+                            }
+                            for pipeline in options['pipelines']:
+                                for run in range(options['repeat']):
+                                    result = {**case, 'run': run, **run_case(pipeline, master, seconds)}
+                                    results.append(result)
+                                    self._report(result, baseline.get(self._case_key(result)))
+                            os.remove(master)
+
+        with open(options['output'], 'w') as f:
+            json.dump(
+                {'created_at': timezone.now().isoformat(), 'environment': environment(), 'results': results},
+                f,
+                indent=2,
+            )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+    @staticmethod
+    def _case_key(result):
+        return (
+            result['pipeline'], result['signal'], result['duration_seconds'], result['sample_rate'],
+            result['codec'], result['run'],
+        )
+
+    def _report(self, result, previous):
+        label = (
+            f"{result['pipeline']:<9} {result['signal']:<5} {result['duration_seconds']:>4}s "
+            f"{result['sample_rate']:>6}Hz {result['codec']:<4}"
+        )
+        if result['error']:
+            self.stdout.write(self.style.ERROR(f"{label} failed: {result['error']}"))
+            return
+
+        line = (
+            f"{label} {result['wall_seconds']:>8.2f}s wall {result['cpu_seconds']:>8.2f}s cpu "
+            f"{result['peak_rss_mb']:>7.1f}MB rss {result['bytes_written'] / 1e6:>8.1f}MB written "
+            f"({result['seconds_per_audio_minute']:.2f}s per audio minute)"
+        )
+        if previous and previous.get('wall_seconds') and not previous.get('error'):
+            change = (result['wall_seconds'] - previous['wall_seconds']) / previous['wall_seconds'] * 100
+            line += f' {change:+.1f}% vs baseline'
+        self.stdout.write(line)
+        for stage in result['stages']:
+            self.stdout.write(
+                f"    {stage['stage']:<9} {stage['wall_seconds']:>8.2f}s wall {stage['cpu_seconds']:>8.2f}s cpu "
+                f"{stage['peak_rss_mb']:>7.1f}MB rss {stage['bytes_written'] / 1e6:>8.1f}MB written"
+            )
@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from artists.ingest import IngestError, ingest_albums, parse_manifest, validate_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        'Ingests a delivery manifest (JSON albums, or CSV with one row per track) in bulk: '
+        'albums, tracks, artist credits and genres are inserted in batches and the masters are queued for transcoding.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='Path to the JSON or CSV manifest.')
+        parser.add_argument('--format', choices=['json', 'csv'], help='Manifest format. Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, help='Tracks written per transaction. Defaults to CATALOG_INGEST_BATCH_SIZE.')
+        parser.add_argument('--no-transcode', action='store_true', help='Do not queue the masters for transcoding.')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the manifest.')
+
+    def handle(self, *args, **options):
+        path = options['manifest']
+        format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+        with open(path, 'rb') as f:
+            try:
+                albums = parse_manifest(f.read(), format)
+            except (ValueError, KeyError, TypeError) as e:
+                raise CommandError(f'Could not read {path}: {e}')
+
+        try:
+            if options['dry_run']:
+                albums, _, _ = validate_manifest(albums)
+                tracks = sum(len(album['tracks']) for album in albums)
+                self.stdout.write(self.style.SUCCESS(f'{len(albums)} albums with {tracks} tracks are ready to ingest.'))
+                return
+            summary = ingest_albums(albums, batch_size=options['batch_size'], transcode=not options['no_transcode'])
+        except IngestError as e:
+            for error in e.errors:
+                self.stderr.write(str(error))
+            raise CommandError(f'{len(e.errors)} problem(s) in {path}; nothing was ingested.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {summary['albums']} albums with {summary['tracks']} tracks; "
+            f"{summary['transcodes']} transcodes queued."
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artists', '0006_delete_artistfollower'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='play_count',
+            field=models.PositiveBigIntegerField(default=0, help_text='Counted plays; popularity is derived from this.'),
+        ),
+    ]
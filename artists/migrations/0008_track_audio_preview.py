@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artists', '0007_track_play_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='audio_preview',
+            field=models.FileField(blank=True, null=True, upload_to='tracks/previews/'),
+        ),
+    ]
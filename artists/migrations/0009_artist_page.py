@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artists', '0008_track_audio_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='page',
+            field=models.JSONField(blank=True, editable=False, help_text='Precomputed artist page (top tracks, latest albums, counts); see artists.pages.', null=True),
+        ),
+    ]
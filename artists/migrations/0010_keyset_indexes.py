@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artists', '0009_artist_page'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='track',
+            name='artists_tra_popular_28ddde_idx',
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['release_date', 'id'], name='album_release_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['name', 'id'], name='artist_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['popularity', 'id'], name='track_popularity_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 09:02
+
+import math
+
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_play_count(apps, schema_editor):
+    '''
+    Carries the plays counted before Track.play_count existed into it. Until
+    then Track.popularity was incremented once per play, so it is the count;
+    popularity is then rescored on the log scale the flush uses, keeping the
+    ranking intact instead of resetting it on the first flush.
+    '''
+    Track = apps.get_model('artists', 'Track')
+    ceiling = getattr(settings, 'TRACK_POPULARITY_CEILING', 1_000_000)
+    pending = Track.objects.filter(play_count=0, popularity__gt=0)
+    # Popularity is bounded to 0..100, so this is at most 100 UPDATEs whatever the catalog size.
+    for plays in list(pending.order_by().values_list('popularity', flat=True).distinct()):
+        score = min(100, round(100 * math.log1p(plays) / math.log1p(ceiling)))
+        pending.filter(popularity=plays).update(play_count=plays, popularity=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artists', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_play_count, migrations.RunPython.noop),
+    ]
@@ -56,6 +56,10 @@ class Artist(BaseModel):
         related_name='managed_artists',
         blank=True
     )
+    page = models.JSONField(
+        null=True, blank=True, editable=False,
+        help_text='Precomputed artist page (top tracks, latest albums, counts); see artists.pages.'
+    )
 
     search_vector = SearchVectorField(null=True, editable=False)
 
@@ -63,6 +67,7 @@ class Artist(BaseModel):
         ordering = ['name']
         indexes = [
             models.Index(fields=['slug']),
+            models.Index(fields=['name', 'id'], name='artist_name_id_idx'),  # keyset pages
             GinIndex(fields=['name'], name='artist_name_gin_idx', opclasses=['gin_trgm_ops']),
             GinIndex(fields=['search_vector'], name='artist_search_vector_idx'),
         ]
@@ -105,6 +110,7 @@ class Album(BaseModel):
         ordering = ['-release_date', 'title']
         indexes = [
             models.Index(fields=['title']),
+            models.Index(fields=['release_date', 'id'], name='album_release_date_id_idx'),  # keyset pages
             GinIndex(fields=['title'], name='album_title_gin_idx', opclasses=['gin_trgm_ops']),
             GinIndex(fields=['search_vector'], name='album_search_vector_idx'),
         ]
@@ -164,12 +170,14 @@ class Track(BaseModel):
     isrc = models.CharField(max_length=12, null=True, blank=True)
     audio_original = models.FileField(upload_to='tracks/original/')
     audio_hls_master = models.FileField(upload_to='tracks/hls/', null=True, blank=True)
+    audio_preview = models.FileField(upload_to='tracks/previews/', null=True, blank=True)
     waveform_json = models.JSONField(null=True, blank=True)
     bitrate_kbps = models.PositiveSmallIntegerField(null=True, blank=True)
     loudness_lufs = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     sample_rate = models.PositiveIntegerField(null=True, blank=True)
     metadata = models.JSONField(default=dict, blank=True)
     popularity = models.PositiveIntegerField(default=0)
+    play_count = models.PositiveBigIntegerField(default=0, help_text='Counted plays; popularity is derived from this.')
     status = models.CharField(
         max_length=20,
         choices=ProcessingStatus.choices,
@@ -185,7 +193,7 @@ class Track(BaseModel):
     class Meta:
         ordering = ['album', 'disc_number', 'track_number']
         indexes = [
-            models.Index(fields=['popularity']),
+            models.Index(fields=['popularity', 'id'], name='track_popularity_id_idx'),  # also serves keyset pages
             models.Index(fields=['album', 'track_number']),
             GinIndex(fields=['title'], name='track_title_gin_idx', opclasses=['gin_trgm_ops']),
             GinIndex(fields=['search_vector'], name='track_search_vector_idx'),
@@ -0,0 +1,137 @@
+import os
+import xml.etree.ElementTree as ET
+
+DASH_NAMESPACE = 'urn:mpeg:dash:schema:mpd:2011'
+DASH_TIMESCALE = 48000
+AAC_LC_CODECS = 'mp4a.40.2'
+
+
+def parse_attributes(value):
+    'Parses an HLS attribute list (KEY=VALUE,KEY="VALUE") into a dict.'
+    attributes = {}
+    for item in value.split(','):
+        if '=' in item:
+            key, _, raw = item.partition('=')
+            attributes[key.strip()] = raw.strip().strip('"')
+    return attributes
+
+
+def _byte_range(value, previous_end):
+    # EXT-X-BYTERANGE is "<length>[@<offset>]"; without an offset it follows the previous range.
+    length, _, offset = value.partition('@')
+    start = int(offset) if offset else previous_end
+    return start, start + int(length) - 1
+
+
+def parse_media_playlist(path):
+    '''
+    Reads an HLS media playlist and returns its initialization section and
+    segments, each as {'uri', 'range'} (range is an inclusive (start, end)
+    byte pair or None) with segments also carrying their 'duration'.
+    '''
+    init = None
+    segments = []
+    duration = None
+    byte_range = None
+    previous_end = 0
+
+    with open(path) as f:
+        for line in (line.strip() for line in f):
+            if line.startswith('#EXT-X-MAP:'):
+                attributes = parse_attributes(line[len('#EXT-X-MAP:'):])
+                init_range = _byte_range(attributes['BYTERANGE'], 0) if 'BYTERANGE' in attributes else None
+                init = {'uri': attributes['URI'], 'range': init_range}
+                if init_range:
+                    previous_end = init_range[1] + 1
+            elif line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line.startswith('#EXT-X-BYTERANGE:'):
+                byte_range = _byte_range(line[len('#EXT-X-BYTERANGE:'):], previous_end)
+                previous_end = byte_range[1] + 1
+            elif line and not line.startswith('#'):
+                segments.append({'uri': line, 'duration': duration, 'range': byte_range})
+                duration = byte_range = None
+
+    return {'init': init, 'segments': segments}
+
+
+def _iso_duration(seconds):
+    return f'PT{seconds:.3f}S'
+
+
+def _timeline(segment_list, durations):
+    # Consecutive segments of equal length collapse into one <S> with a repeat count.
+    timeline = ET.SubElement(segment_list, 'SegmentTimeline')
+    start = 0
+    previous = None
+    for duration in durations:
+        if previous is not None and duration == int(previous.get('d')):
+            previous.set('r', str(int(previous.get('r', '0')) + 1))
+        else:
+            previous = ET.SubElement(timeline, 'S', t=str(start), d=str(duration))
+        start += duration
+
+
+def _range(byte_range):
+    return f'{byte_range[0]}-{byte_range[1]}'
+
+
+def write_dash_manifest(output_dir, bitrates, variant_playlist='playlist_{bitrate}k.m3u8', filename='manifest.mpd'):
+    '''
+    Writes a static DASH manifest addressing the CMAF segments already listed
+    in each variant's HLS playlist, so both protocols share one set of
+    objects. Byte-range playlists (one file per variant) become
+    Initialization/SegmentURL ranges over a single BaseURL.
+    Returns the manifest path.
+    '''
+    mpd = ET.Element('MPD', {
+        'xmlns': DASH_NAMESPACE,
+        'profiles': 'urn:mpeg:dash:profile:isoff-main:2011',
+        'type': 'static',
+        'minBufferTime': 'PT2S',
+    })
+    period = ET.SubElement(mpd, 'Period', id='0', start='PT0S')
+    adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+        'id': '0',
+        'contentType': 'audio',
+        'mimeType': 'audio/mp4',
+        'codecs': AAC_LC_CODECS,
+        'segmentAlignment': 'true',
+        'lang': 'und',
+    })
+
+    total_seconds = 0.0
+    for bitrate in bitrates:
+        playlist = parse_media_playlist(os.path.join(output_dir, variant_playlist.format(bitrate=bitrate)))
+        if playlist['init'] is None:
+            raise ValueError(f'Variant {bitrate}k is not fragmented MP4; DASH needs CMAF segments.')
+
+        representation = ET.SubElement(adaptation_set, 'Representation', {
+            'id': f'{bitrate}k',
+            'bandwidth': str(bitrate * 1000),
+            'audioSamplingRate': str(DASH_TIMESCALE),
+        })
+        single_file = playlist['init']['range'] is not None
+        if single_file:
+            ET.SubElement(representation, 'BaseURL').text = playlist['init']['uri']
+
+        segment_list = ET.SubElement(representation, 'SegmentList', timescale=str(DASH_TIMESCALE))
+        if single_file:
+            ET.SubElement(segment_list, 'Initialization', range=_range(playlist['init']['range']))
+        else:
+            ET.SubElement(segment_list, 'Initialization', sourceURL=playlist['init']['uri'])
+        _timeline(segment_list, [round(s['duration'] * DASH_TIMESCALE) for s in playlist['segments']])
+        for segment in playlist['segments']:
+            if single_file:
+                ET.SubElement(segment_list, 'SegmentURL', mediaRange=_range(segment['range']))
+            else:
+                ET.SubElement(segment_list, 'SegmentURL', media=segment['uri'])
+
+        total_seconds = max(total_seconds, sum(s['duration'] for s in playlist['segments']))
+
+    mpd.set('mediaPresentationDuration', _iso_duration(total_seconds))
+    period.set('duration', _iso_duration(total_seconds))
+
+    manifest_path = os.path.join(output_dir, filename)
+    ET.ElementTree(mpd).write(manifest_path, encoding='utf-8', xml_declaration=True)
+    return manifest_path
@@ -0,0 +1,146 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Album, AlbumArtist, Artist, Track, TrackArtist
+from .storage import signed_url
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the document layout changes; older documents are rebuilt on read.
+PAGE_VERSION = 1
+TOP_TRACKS = 5
+LATEST_ALBUMS = 5
+REBUILD_KEY = 'artists:page-rebuild:{artist_id}'
+
+
+def _rebuild_delay():
+    return getattr(settings, 'ARTIST_PAGE_REBUILD_DELAY', 10)
+
+
+def build_artist_page(artist):
+    '''
+    Computes the artist page document: the top tracks by popularity, the
+    latest albums and the catalog counts. Media is stored as object names
+    (`preview`, `cover`) because URLs are signed per request.
+    '''
+    from .serializers import PageAlbumSerializer, PageTrackSerializer
+
+    top_tracks = (
+        artist.tracks.order_by('-popularity')
+        .select_related('album', 'primary_artist')
+        .prefetch_related('artists', 'genres')[:TOP_TRACKS]
+    )
+    latest_albums = artist.albums.order_by('-release_date').select_related('primary_artist').distinct()[:LATEST_ALBUMS]
+    return {
+        'version': PAGE_VERSION,
+        'built_at': timezone.now().isoformat(),
+        'top_tracks': PageTrackSerializer(top_tracks, many=True).data,
+        'latest_albums': PageAlbumSerializer(latest_albums, many=True).data,
+        'track_count': artist.tracks.count(),
+        'album_count': artist.albums.count(),
+    }
+
+
+def refresh_artist_page(artist):
+    'Rebuilds and stores the page of one artist, without touching any other column.'
+    page = build_artist_page(artist)
+    Artist.objects.filter(pk=artist.pk).update(page=page)
+    artist.page = page
+    return page
+
+
+def artist_page(artist):
+    '''
+    Returns the stored page of an already loaded artist. Only an artist that
+    was never built (or whose document predates PAGE_VERSION) costs queries.
+    '''
+    if not artist.page or artist.page.get('version') != PAGE_VERSION:
+        return refresh_artist_page(artist)
+    return artist.page
+
+
+def _absolute(url, request):
+    return request.build_absolute_uri(url) if request else url
+
+
+def render_tracks(entries, request=None):
+    'Turns stored top tracks into the TrackSerializer shape, signing each preview for this request.'
+    storage = Track._meta.get_field('audio_preview').storage
+    rendered = []
+    for entry in entries:
+        entry = dict(entry)
+        preview = entry.pop('preview', None)
+        entry['preview_url'] = _absolute(signed_url(preview, storage), request) if preview else None
+        rendered.append(entry)
+    return rendered
+
+
+def render_albums(entries, request=None):
+    'Turns stored latest albums into the AlbumSerializer shape.'
+    storage = Album._meta.get_field('cover').storage
+    rendered = []
+    for entry in entries:
+        entry = dict(entry)
+        entry['cover'] = _absolute(storage.url(entry['cover']), request) if entry.get('cover') else None
+        rendered.append(entry)
+    return rendered
+
+
+def artists_of_tracks(track_ids):
+    'Ids of every artist credited on, or primary artist of, the given tracks.'
+    credited = TrackArtist.objects.filter(track_id__in=track_ids).order_by().values_list('artist_id', flat=True)
+    primary = Track.objects.filter(pk__in=track_ids).order_by().values_list('primary_artist_id', flat=True)
+    return set(credited) | set(primary)
+
+
+def artists_of_albums(album_ids):
+    '''
+    Ids of every artist whose page shows one of the given albums, either in
+    the album list or through one of its tracks.
+    '''
+    listed = AlbumArtist.objects.filter(album_id__in=album_ids).order_by().values_list('artist_id', flat=True)
+    primary = Album.objects.filter(pk__in=album_ids).order_by().values_list('primary_artist_id', flat=True)
+    on_tracks = TrackArtist.objects.filter(track__album_id__in=album_ids).order_by().values_list('artist_id', flat=True)
+    return set(listed) | set(primary) | set(on_tracks)
+
+
+def schedule_artist_pages(artist_ids):
+    '''
+    Queues a rebuild of the given artists' pages once the current transaction
+    commits. Changes within ARTIST_PAGE_REBUILD_DELAY seconds of each other
+    share one rebuild per artist; until it runs the previous page is served.
+    '''
+    artist_ids = {str(artist_id) for artist_id in artist_ids if artist_id}
+    if not artist_ids:
+        return
+
+    def enqueue():
+        delay = _rebuild_delay()
+        due = [
+            artist_id for artist_id in sorted(artist_ids)
+            if cache.add(REBUILD_KEY.format(artist_id=artist_id), 1, timeout=delay + 60)
+        ]
+        if due:
+            from .tasks import rebuild_artist_pages
+            rebuild_artist_pages.apply_async((due,), countdown=delay)
+
+    transaction.on_commit(enqueue)
+
+
+def rebuild_pages(artist_ids):
+    '''
+    Rebuilds the pages of the given artists. The pending-rebuild markers are
+    cleared first, so changes made while this runs schedule another pass.
+    Returns the number of pages written.
+    '''
+    cache.delete_many([REBUILD_KEY.format(artist_id=artist_id) for artist_id in artist_ids])
+    rebuilt = 0
+    for artist in Artist.objects.filter(pk__in=artist_ids).defer('page'):
+        refresh_artist_page(artist)
+        rebuilt += 1
+    logger.info(f'Rebuilt {rebuilt} artist pages.')
+    return rebuilt
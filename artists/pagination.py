@@ -0,0 +1,130 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Forward-only keyset pagination on a composite (field, pk) key, taken from
+    the view's `keyset_ordering` (e.g. '-popularity'). Each page continues
+    strictly after the last row of the previous one, so it is one index range
+    scan whatever its depth, and no COUNT(*) is run. Rows with a NULL key come
+    after all others, ordered by pk in the same direction.
+    '''
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def _key(self, queryset, view):
+        ordering = view.keyset_ordering
+        name = ordering.lstrip('-')
+        return queryset.model._meta.get_field(name), ordering.startswith('-')
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([value, pk], cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, field, pk_field):
+        'Returns (value, pk) of the last row already seen, or None on the first page.'
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            return (None if value is None else field.to_python(value)), pk_field.to_python(pk)
+        except (TypeError, ValueError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM)
+        if ordering and ordering != view.keyset_ordering:
+            raise ValidationError({api_settings.ORDERING_PARAM: f'Cursor pages are ordered by {view.keyset_ordering}.'})
+
+        field, descending = self._key(queryset, view)
+        pk_field = queryset.model._meta.pk
+        name, pk = field.name, pk_field.name
+        before, after = ('lt', 'gt') if descending else ('gt', 'lt')
+        sign = '-' if descending else ''
+        by_key = queryset.order_by(f'{sign}{name}', f'{sign}{pk}')
+        nulls = queryset.filter(**{f'{name}__isnull': True}).order_by(f'{sign}{pk}')
+        position = self.decode_cursor(request, field, pk_field)
+        limit = self.page_size + 1
+
+        if position is None:
+            rows = list(by_key.filter(**{f'{name}__isnull': False})[:limit]) if field.null else list(by_key[:limit])
+        elif position[0] is None:
+            rows = list(nulls.filter(**{f'{pk}__{before}': position[1]})[:limit])
+        else:
+            value, last_pk = position
+            # The redundant bound on the field alone lets the planner start the index scan at the cursor.
+            rows = list(
+                by_key.filter(**{f'{name}__{before}e': value})
+                .filter(Q(**{f'{name}__{before}': value}) | Q(**{name: value, f'{pk}__{before}': last_pk}))[:limit]
+            )
+        if field.null and len(rows) < limit and (position is None or position[0] is not None):
+            rows += list(nulls[:limit - len(rows)])
+
+        self.request = request
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            last = self.page[-1]
+            self.next_cursor = self.encode_cursor(field.value_from_object(last), last.pk)
+        return self.page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CatalogPagination(PageNumberPagination):
+    '''
+    Page numbers by default. A request carrying `cursor` (empty for the first
+    page) gets keyset pages instead, which cost the same at any depth.
+    '''
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [{
+            'name': KeysetPagination.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Switches to keyset pages: empty for the first page, then the cursor from `next`.',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,104 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.dispatch import Signal
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('fetch', 'probe', 'analyze', 'encode', 'upload', 'finalize')
+
+# Stages whose output lives in the work directory rather than in the database.
+LOCAL_STAGES = ('fetch', 'analyze', 'encode')
+
+# Sent after each stage is checkpointed, with `key`, `stage` and `seconds` (wall time of the stage).
+stage_completed = Signal()
+
+
+def work_dir_root():
+    return getattr(settings, 'MEDIA_PIPELINE_WORK_DIR', None) or os.path.join(tempfile.gettempdir(), 'audio-pipeline')
+
+
+class Checkpoint:
+    '''
+    Records which processing stages have finished for one object, so a
+    retried task resumes from the last finished stage instead of starting
+    over at the download.
+
+    `state` is a dict stored in one of the object's JSON fields and is
+    updated in place; `save` persists it. Intermediate files are kept in a
+    per-object work directory that outlives the attempt. If that directory is
+    gone (first run, or a retry on another worker) the stages that produced
+    local files run again, unless the upload already finished and nothing
+    local is needed any more.
+    '''
+
+    def __init__(self, state, save, key):
+        self.state = state
+        self._save = save
+        self.key = key
+        self.work_dir = os.path.join(work_dir_root(), key)
+
+        if 'finalize' in state.get('stages', {}):
+            # A finished run being reprocessed starts from scratch.
+            state.clear()
+        for name, default in (('stages', {}), ('variants', {}), ('uploaded', {}), ('data', {})):
+            state.setdefault(name, default)
+
+        if not os.path.isdir(self.work_dir) and 'upload' not in state['stages']:
+            for stage in LOCAL_STAGES:
+                state['stages'].pop(stage, None)
+            state['variants'] = {}
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        state['attempts'] = state.get('attempts', 0) + 1
+        if state['stages']:
+            logger.info(f"Resuming {key} after stage {state.get('stage')} (attempt {state['attempts']})")
+        self._started = time.monotonic()
+
+    @property
+    def data(self):
+        'Values produced by earlier stages that later stages need (paths, probe results, gain).'
+        return self.state['data']
+
+    @property
+    def uploaded(self):
+        'Mapping of output filename to storage name for every object already uploaded.'
+        return self.state['uploaded']
+
+    def path(self, *parts):
+        return os.path.join(self.work_dir, *parts)
+
+    def done(self, stage):
+        return stage in self.state['stages']
+
+    def complete(self, stage):
+        now = time.monotonic()
+        self.state['stages'][stage] = {
+            'completed_at': timezone.now().isoformat(),
+            'seconds': round(now - self._started, 3),
+        }
+        self.state['stage'] = stage
+        self.state.pop('error', None)
+        self._started = now
+        self._save()
+        stage_completed.send(sender=Checkpoint, key=self.key, stage=stage, seconds=self.state['stages'][stage]['seconds'])
+
+    def variant_done(self, bitrate):
+        return str(bitrate) in self.state['variants']
+
+    def complete_variant(self, report):
+        self.state['variants'][str(report['bitrate'])] = report
+        self._save()
+
+    def fail(self, error):
+        failed = next((stage for stage in STAGES if not self.done(stage)), None)
+        self.state['error'] = {'stage': failed, 'message': str(error)[:500]}
+        self._save()
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
@@ -0,0 +1,177 @@
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Case, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Least, Ln, Round
+
+from .models import Track
+from .pages import artists_of_tracks, schedule_artist_pages
+
+logger = logging.getLogger(__name__)
+
+# Plays are counted in sharded Redis hashes (track id -> pending plays). A
+# flush claims each shard with HGETALL+DEL in one MULTI, so increments
+# arriving meanwhile land in a fresh hash and no play is read twice.
+SHARD_KEY = 'artists:plays:{shard}'
+# Held while a flush claims and applies the shards, so overlapping runs skip.
+FLUSH_LOCK_KEY = 'artists:plays:flush-lock'
+FLUSH_LOCK_SECONDS = 10 * 60
+
+# Fallback for caches without Redis: per-process deltas, handed to
+# flush_track_popularity every TRACK_POPULARITY_FLUSH_SECONDS. Plays not yet
+# handed off are lost when the process exits.
+_local_deltas = Counter()
+_local_lock = threading.Lock()
+_local_flushed_at = time.monotonic()
+
+
+def _redis_client():
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client()
+
+
+def _shards():
+    return getattr(settings, 'TRACK_PLAY_COUNTER_SHARDS', 16)
+
+
+def _flush_interval():
+    return getattr(settings, 'TRACK_POPULARITY_FLUSH_SECONDS', 60)
+
+
+def popularity_score(play_count):
+    '''
+    Maps a raw play count onto the 0..100 popularity scale. The scale is
+    logarithmic and reaches 100 at TRACK_POPULARITY_CEILING plays.
+    '''
+    ceiling = getattr(settings, 'TRACK_POPULARITY_CEILING', 1_000_000)
+    return min(100, round(100 * math.log1p(play_count) / math.log1p(ceiling)))
+
+
+def record_play(track_id):
+    '''
+    Counts one play of a track without touching its row. The count reaches
+    Track.play_count and Track.popularity on the next flush.
+    '''
+    client = _redis_client()
+    if client is not None:
+        client.hincrby(SHARD_KEY.format(shard=random.randrange(_shards())), str(track_id), 1)
+        return
+
+    global _local_flushed_at
+    with _local_lock:
+        _local_deltas[str(track_id)] += 1
+        due = time.monotonic() - _local_flushed_at >= _flush_interval()
+        if due:
+            _local_flushed_at = time.monotonic()
+    if due:
+        deltas = _drain_local()
+        if deltas:
+            from .tasks import flush_track_popularity
+            flush_track_popularity.delay(dict(deltas))
+
+
+def _claim_redis(client):
+    'Atomically takes every pending play out of Redis and returns the summed deltas.'
+    deltas = Counter()
+    for shard in range(_shards()):
+        key = SHARD_KEY.format(shard=shard)
+        pipe = client.pipeline(transaction=True)
+        pipe.hgetall(key)
+        pipe.delete(key)
+        counts, _ = pipe.execute()
+        for track_id, count in counts.items():
+            deltas[track_id.decode() if isinstance(track_id, bytes) else track_id] += int(count)
+    return deltas
+
+
+def _restore_redis(client, deltas):
+    'Puts claimed plays back after a failed apply, so the next flush retries them.'
+    pipe = client.pipeline(transaction=False)
+    for track_id, count in deltas.items():
+        pipe.hincrby(SHARD_KEY.format(shard=random.randrange(_shards())), track_id, count)
+    pipe.execute()
+
+
+def _drain_local():
+    with _local_lock:
+        deltas = Counter(_local_deltas)
+        _local_deltas.clear()
+    return deltas
+
+
+def apply_play_counts(deltas, batch_size=None):
+    '''
+    Adds `deltas` (track id -> plays) to Track.play_count and recomputes
+    popularity from the new count, one UPDATE per batch of tracks. Artists
+    whose tracks change popularity get their pages rebuilt.
+    Returns the number of tracks updated.
+    '''
+    batch_size = batch_size or getattr(settings, 'TRACK_POPULARITY_FLUSH_BATCH', 1000)
+    ceiling = getattr(settings, 'TRACK_POPULARITY_CEILING', 1_000_000)
+    items = list(deltas.items())
+    updated = 0
+    moved = []
+    for start in range(0, len(items), batch_size):
+        batch = dict(items[start:start + batch_size])
+        # Popularity moves in whole points on a log scale, so most flushes change no page.
+        moved.extend(
+            track_id for track_id, play_count, current in
+            Track.objects.filter(pk__in=batch).order_by().values_list('pk', 'play_count', 'popularity')
+            if popularity_score(play_count + batch[str(track_id)]) != current
+        )
+        play_count = F('play_count') + Case(
+            *[When(pk=track_id, then=Value(count)) for track_id, count in batch.items()],
+            output_field=BigIntegerField(),
+        )
+        # Same curve as popularity_score, evaluated in the UPDATE against the new count.
+        popularity = Least(
+            Value(100),
+            Cast(Round(Ln(play_count + 1) * Value(100 / math.log1p(ceiling))), IntegerField()),
+            output_field=IntegerField(),
+        )
+        updated += Track.objects.filter(pk__in=batch).update(play_count=play_count, popularity=popularity)
+    if moved:
+        schedule_artist_pages(artists_of_tracks(moved))
+    return updated
+
+
+def _apply_redis(client):
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_SECONDS):
+        logger.info('Play counts are already being flushed; skipping this run.')
+        return Counter(), 0
+    try:
+        deltas = _claim_redis(client)
+        if not deltas:
+            return deltas, 0
+        try:
+            return deltas, apply_play_counts(deltas)
+        except Exception:
+            _restore_redis(client, deltas)
+            raise
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def flush_play_counts(deltas=None):
+    '''
+    Applies every pending play to the Track table, or only `deltas` when a
+    process without Redis hands over its own counts. Returns the number of
+    tracks updated.
+    '''
+    client = _redis_client() if deltas is None else None
+    if client is not None:
+        deltas, updated = _apply_redis(client)
+    else:
+        deltas = Counter(deltas) if deltas is not None else _drain_local()
+        updated = apply_play_counts(deltas) if deltas else 0
+    if deltas:
+        logger.info(f'Applied {sum(deltas.values())} plays to {updated} tracks.')
+    return updated
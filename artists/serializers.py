@@ -6,6 +6,8 @@ from .models import (
     Genre,
     Track,
 )
+from .pages import artist_page, render_albums, render_tracks
+from .storage import signed_url
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -34,23 +36,33 @@ class ArtistSerializer(serializers.ModelSerializer):
 
 
 class ArtistDetailSerializer(ArtistSerializer):
+    '''
+    Serves the top tracks, latest albums and counts from the precomputed
+    Artist.page document (artists.pages), so a page costs one row lookup.
+    '''
     top_tracks = serializers.SerializerMethodField()
     latest_albums = serializers.SerializerMethodField()
+    track_count = serializers.SerializerMethodField()
+    album_count = serializers.SerializerMethodField()
 
     class Meta(ArtistSerializer.Meta):
-        fields = ArtistSerializer.Meta.fields + ['bio', 'country', 'top_tracks', 'latest_albums']
+        fields = ArtistSerializer.Meta.fields + [
+            'bio', 'country', 'top_tracks', 'latest_albums', 'track_count', 'album_count',
+        ]
 
     def get_top_tracks(self, obj):
         '''Returns the top 5 tracks by popularity.'''
-        top_tracks = obj.tracks.order_by('-popularity')[:5]
-        return TrackSerializer(top_tracks, many=True, context=self.context).data
+        return render_tracks(artist_page(obj)['top_tracks'], self.context.get('request'))
 
     def get_latest_albums(self, obj):
-        '''Returns the latest 5 albums by release date.'''
-        # Note: This gets albums where the artist is a collaborator, not just primary.
-        # The model might need adjustment if only primary artist's albums are desired.
-        latest_albums = obj.albums.order_by('-release_date').distinct()[:5]
-        return AlbumSerializer(latest_albums, many=True, context=self.context).data
+        '''Returns the latest 5 albums by release date, including collaborations.'''
+        return render_albums(artist_page(obj)['latest_albums'], self.context.get('request'))
+
+    def get_track_count(self, obj):
+        return artist_page(obj)['track_count']
+
+    def get_album_count(self, obj):
+        return artist_page(obj)['album_count']
 
 
 class ArtistWriteSerializer(serializers.ModelSerializer):
@@ -101,16 +113,60 @@ class TrackWriteSerializer(serializers.ModelSerializer):
         ]
 
 
+class TrackIngestSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200)
+    slug = serializers.SlugField(max_length=255, required=False)
+    track_number = serializers.IntegerField(min_value=1, max_value=32767)
+    disc_number = serializers.IntegerField(min_value=1, max_value=32767, default=1)
+    duration_ms = serializers.IntegerField(min_value=1)
+    is_explicit = serializers.BooleanField(default=False)
+    isrc = serializers.CharField(max_length=12, required=False, allow_null=True, allow_blank=True)
+    artists = serializers.ListField(child=serializers.SlugField(), default=list)
+    featured_artists = serializers.ListField(child=serializers.SlugField(), default=list)
+    genres = serializers.ListField(child=serializers.SlugField(), default=list)
+    audio_original = serializers.CharField(
+        max_length=100, required=False, allow_blank=True, help_text='Storage name of an uploaded master'
+    )
+
+
+class AlbumIngestSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200)
+    slug = serializers.SlugField(max_length=255, required=False)
+    primary_artist = serializers.SlugField()
+    artists = serializers.ListField(child=serializers.SlugField(), default=list)
+    release_date = serializers.DateField(required=False, allow_null=True)
+    album_type = serializers.ChoiceField(choices=Album.AlbumType.choices, default=Album.AlbumType.ALBUM)
+    label = serializers.CharField(max_length=120, required=False, allow_null=True, allow_blank=True)
+    is_explicit = serializers.BooleanField(default=False)
+    tracks = TrackIngestSerializer(many=True, allow_empty=False)
+
+    def validate_tracks(self, value):
+        positions = [(track['disc_number'], track['track_number']) for track in value]
+        if len(positions) != len(set(positions)):
+            raise serializers.ValidationError('Each disc and track number may only appear once.')
+        return value
+
+
+class IngestManifestSerializer(serializers.Serializer):
+    albums = AlbumIngestSerializer(many=True, allow_empty=False)
+
+
 class UploadInitSerializer(serializers.Serializer):
     filename = serializers.CharField(max_length=255)
     file_size = serializers.IntegerField(min_value=1)
     mime_type = serializers.CharField(max_length=100)
 
 
+class UploadPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField(max_length=100)
+
+
 class UploadCompleteSerializer(serializers.Serializer):
     upload_id = serializers.UUIDField()
     object_name = serializers.CharField(max_length=1024)
     track_id = serializers.UUIDField()
+    parts = UploadPartSerializer(many=True, required=False, help_text='ETag of every part, for multipart uploads')
 
     def validate_track_id(self, value):
         if not Track.objects.filter(pk=value).exists():
@@ -118,6 +174,10 @@ class UploadCompleteSerializer(serializers.Serializer):
         return value
 
 
+class UploadResumeSerializer(serializers.Serializer):
+    upload_id = serializers.UUIDField()
+
+
 class SearchResultSerializer(serializers.Serializer):
     type = serializers.CharField(read_only=True)
     score = serializers.FloatField(read_only=True)
@@ -159,6 +219,7 @@ class TrackSerializer(serializers.ModelSerializer):
     primary_artist = serializers.StringRelatedField()
     artists = serializers.StringRelatedField(many=True)
     genres = serializers.StringRelatedField(many=True)
+    preview_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Track
@@ -174,4 +235,26 @@ class TrackSerializer(serializers.ModelSerializer):
             'duration_ms',
             'is_explicit',
             'popularity',
+            'preview_url',
         ]
+
+    def get_preview_url(self, obj):
+        '''URL of the preview clip cut at ingest (one immutable object), or None.'''
+        if not obj.audio_preview:
+            return None
+        url = signed_url(obj.audio_preview.name, obj.audio_preview.storage)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class PageTrackSerializer(TrackSerializer):
+    '''TrackSerializer as stored in Artist.page: the preview is kept as an object name and signed when served.'''
+    preview = serializers.CharField(source='audio_preview.name', allow_null=True, default=None)
+
+    class Meta(TrackSerializer.Meta):
+        fields = [field for field in TrackSerializer.Meta.fields if field != 'preview_url'] + ['preview']
+
+
+class PageAlbumSerializer(AlbumSerializer):
+    '''AlbumSerializer as stored in Artist.page, with the cover kept as an object name.'''
+    cover = serializers.CharField(source='cover.name', allow_null=True, default=None)
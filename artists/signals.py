@@ -1,5 +1,100 @@
-from django.db.models import F
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Artist
+from .models import Album, AlbumArtist, Artist, Track, TrackArtist
+from .pages import artists_of_albums, artists_of_tracks, schedule_artist_pages
+
+
+# Track columns that artist pages render; saves touching none of them (pipeline
+# checkpoints, status, metadata) leave the pages alone.
+PAGE_TRACK_FIELDS = (
+    'title', 'slug', 'album_id', 'primary_artist_id', 'track_number',
+    'duration_ms', 'is_explicit', 'popularity', 'audio_preview',
+)
+_UNLOADED = object()
+
+
+def _page_values(instance):
+    # Read from __dict__ so deferred columns are never loaded; files compare by object name.
+    values = {}
+    for name in PAGE_TRACK_FIELDS:
+        value = instance.__dict__.get(name, _UNLOADED)
+        values[name] = getattr(value, 'name', value)
+    return values
+
+
+@receiver(post_init, sender=Track, dispatch_uid='track_loaded_artist_pages')
+def remember_page_values(sender, instance, **kwargs):
+    instance._page_values = _page_values(instance)
+
+
+@receiver(post_save, sender=Track, dispatch_uid='track_saved_artist_pages')
+@receiver(pre_delete, sender=Track, dispatch_uid='track_deleted_artist_pages')
+def refresh_pages_for_track(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    '''
+    Rebuilds the pages that can show this track. Deletions are handled
+    before the delete, while the artist credits still exist. Saves that
+    change none of PAGE_TRACK_FIELDS since the track was loaded or last
+    saved schedule nothing.
+    '''
+    if signal is post_save:
+        saved = [
+            name for name in PAGE_TRACK_FIELDS
+            if update_fields is None or name in update_fields or name.removesuffix('_id') in update_fields
+        ]
+        values, previous = _page_values(instance), instance._page_values
+        changed = [name for name in saved if values[name] != previous[name]]
+        previous.update({name: values[name] for name in saved})
+        if not created and not changed:
+            return
+    schedule_artist_pages(artists_of_tracks([instance.pk]) | {instance.primary_artist_id})
+
+
+@receiver(post_save, sender=Album, dispatch_uid='album_saved_artist_pages')
+@receiver(pre_delete, sender=Album, dispatch_uid='album_deleted_artist_pages')
+def refresh_pages_for_album(sender, instance, **kwargs):
+    schedule_artist_pages(artists_of_albums([instance.pk]) | {instance.primary_artist_id})
+
+
+@receiver(post_save, sender=TrackArtist, dispatch_uid='track_artist_saved_artist_pages')
+@receiver(post_delete, sender=TrackArtist, dispatch_uid='track_artist_deleted_artist_pages')
+def refresh_pages_for_track_credit(sender, instance, **kwargs):
+    # The other credited artists list this artist's name on the shared track.
+    schedule_artist_pages(artists_of_tracks([instance.track_id]) | {instance.artist_id})
+
+
+@receiver(post_save, sender=AlbumArtist, dispatch_uid='album_artist_saved_artist_pages')
+@receiver(post_delete, sender=AlbumArtist, dispatch_uid='album_artist_deleted_artist_pages')
+def refresh_pages_for_album_credit(sender, instance, **kwargs):
+    schedule_artist_pages([instance.artist_id])
+
+
+@receiver(m2m_changed, sender=Track.artists.through, dispatch_uid='track_artists_changed_artist_pages')
+@receiver(m2m_changed, sender=Album.artists.through, dispatch_uid='album_artists_changed_artist_pages')
+def refresh_pages_for_credits(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    .add(), .remove() and .set() on the credit relations bulk-write the
+    through rows, which sends m2m_changed instead of post_save.
+    '''
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    is_track = sender is Track.artists.through
+    artists_of = artists_of_tracks if is_track else artists_of_albums
+    if reverse:
+        # instance is an artist; pk_set holds tracks or albums (None when clearing all of them).
+        related = pk_set if pk_set is not None else (instance.tracks if is_track else instance.albums).values_list('pk', flat=True)
+        affected = artists_of(list(related)) | {instance.pk}
+    else:
+        affected = artists_of([instance.pk]) | set(pk_set or ())
+    schedule_artist_pages(affected)
+
+
+@receiver(post_save, sender=Artist, dispatch_uid='artist_saved_artist_pages')
+def refresh_pages_for_artist(sender, instance, created, update_fields=None, **kwargs):
+    '''
+    The artist's name appears on its own tracks and on those it shares with
+    other artists. Saves that only touch counters leave the pages alone.
+    '''
+    if created or (update_fields and 'name' not in update_fields):
+        return
+    schedule_artist_pages(artists_of_tracks(TrackArtist.objects.filter(artist=instance).values('track_id')))
@@ -0,0 +1,377 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COPY_BUFFER_SIZE = 1024 * 1024
+
+MEDIA_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.mpd': 'application/dash+xml',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'audio/mp4',
+    '.m4a': 'audio/mp4',
+}
+
+# For objects whose key changes with their content, so caches never need to revalidate.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_lock = threading.Lock()
+_s3_client = None
+_upload_pool = None
+
+
+def _reset_after_fork():
+    # Neither boto3 clients nor thread pools survive a fork (Celery prefork, gunicorn).
+    global _lock, _s3_client, _upload_pool
+    _lock = threading.Lock()
+    _s3_client = None
+    _upload_pool = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _upload_concurrency():
+    return getattr(settings, 'MEDIA_UPLOAD_CONCURRENCY', 16)
+
+
+def get_s3_client():
+    '''
+    Returns the process-wide boto3 S3 client. Clients are thread-safe, so every
+    upload thread shares one connection pool and one set of resolved credentials.
+    '''
+    global _s3_client
+    if _s3_client is None:
+        with _lock:
+            if _s3_client is None:
+                _s3_client = boto3.session.Session().client(
+                    's3',
+                    endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                    config=Config(
+                        signature_version='s3v4',
+                        max_pool_connections=_upload_concurrency(),
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                    ),
+                )
+    return _s3_client
+
+
+def presigned_url(key, expires_in=None, bucket_name=None):
+    '''
+    Returns a presigned GET URL for `key`, shared by every caller within the
+    same reuse window. The cache key combines the object key with the window
+    ("expiry bucket"), so concurrent play starts for a hot track reuse one
+    signature, which also keeps the URL cacheable downstream. A URL is only
+    handed out while at least `expires_in - MEDIA_PRESIGNED_URL_REUSE`
+    seconds of validity remain.
+    '''
+    expires_in = expires_in or getattr(settings, 'MEDIA_PRESIGNED_URL_EXPIRY', 3600)
+    reuse = min(getattr(settings, 'MEDIA_PRESIGNED_URL_REUSE', 900), expires_in // 2)
+    bucket_name = bucket_name or settings.AWS_STORAGE_BUCKET_NAME
+
+    now = time.time()
+    window = int(now // reuse) if reuse else None
+    digest = hashlib.sha1(f'{bucket_name}/{key}'.encode()).hexdigest()
+    cache_key = f'presigned:{digest}:{expires_in}:{window}'
+
+    if window is not None:
+        url = cache.get(cache_key)
+        if url:
+            return url
+
+    url = get_s3_client().generate_presigned_url(
+        'get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=expires_in
+    )
+    if window is not None:
+        cache.set(cache_key, url, timeout=max(1, int((window + 1) * reuse - now)))
+    return url
+
+
+def signed_url(name, storage):
+    '''
+    Returns the URL of a stored object, drawing S3 signatures from the
+    presigned URL cache instead of signing on every call. The key is built
+    the way the storage builds it, so AWS_LOCATION is honoured.
+    '''
+    bucket_name = getattr(storage, 'bucket_name', None)
+    if bucket_name:
+        return presigned_url(object_key(name, storage), bucket_name=bucket_name)
+    return storage.url(name)
+
+
+def object_key(name, storage):
+    'The S3 key `storage` stores `name` under, including its location prefix.'
+    if hasattr(storage, '_normalize_name'):
+        return storage._normalize_name(name)
+    return _s3_key(name, storage)
+
+
+def get_upload_pool():
+    '''
+    Returns the thread pool shared by every bulk upload in this process.
+    '''
+    global _upload_pool
+    if _upload_pool is None:
+        with _lock:
+            if _upload_pool is None:
+                _upload_pool = ThreadPoolExecutor(
+                    max_workers=_upload_concurrency(),
+                    thread_name_prefix='media-upload',
+                )
+    return _upload_pool
+
+
+def _buffer_size(buffer_size=None):
+    return buffer_size or getattr(settings, 'MEDIA_COPY_BUFFER_SIZE', DEFAULT_COPY_BUFFER_SIZE)
+
+
+def local_path(name, storage=None):
+    '''
+    Returns the filesystem path of `name` if the storage backend keeps files
+    on local disk, or None for remote backends such as S3.
+    '''
+    storage = storage or default_storage
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return None
+    return path if os.path.exists(path) else None
+
+
+def hash_file(path, digest, buffer_size=None):
+    '''
+    Feeds the file at `path` into `digest` (a hashlib object) one buffer at a
+    time. Returns the number of bytes read.
+    '''
+    buffer_size = _buffer_size(buffer_size)
+    read = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(buffer_size), b''):
+            digest.update(chunk)
+            read += len(chunk)
+    return read
+
+
+def copy_to_local(name, destination_path, storage=None, buffer_size=None, digest=None):
+    '''
+    Streams `name` from storage into `destination_path` one buffer at a time,
+    so memory use stays at `buffer_size` regardless of the file size. Each
+    chunk is also fed to `digest` when given, hashing the file on the way in.
+    Returns the number of bytes written.
+    '''
+    storage = storage or default_storage
+    buffer_size = _buffer_size(buffer_size)
+    written = 0
+
+    with storage.open(name, 'rb') as source, open(destination_path, 'wb') as destination:
+        # S3File buffers the whole object on first read(); read the body directly instead.
+        s3_object = getattr(source, 'obj', None)
+        if s3_object is not None:
+            chunks = s3_object.get()['Body'].iter_chunks(chunk_size=buffer_size)
+        else:
+            chunks = iter(lambda: source.read(buffer_size), b'')
+
+        for chunk in chunks:
+            destination.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            written += len(chunk)
+
+    logger.debug(f'Copied {written} bytes of {name} to {destination_path}')
+    return written
+
+
+def fetch_source(name, destination_path, storage=None, buffer_size=None, digest=None):
+    '''
+    Returns a local path ffmpeg can read `name` from. Files on local storage are
+    used in place; remote files are streamed to `destination_path` first.
+    When `digest` is given it ends up holding the hash of the file's bytes.
+    '''
+    path = local_path(name, storage)
+    if path:
+        if digest is not None:
+            hash_file(path, digest, buffer_size)
+        return path
+    copy_to_local(name, destination_path, storage, buffer_size, digest)
+    return destination_path
+
+
+def _content_type(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return MEDIA_CONTENT_TYPES.get(extension) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def upload_file(path, name, storage=None, cache_control=None):
+    '''
+    Streams a local file to `name` in storage, overwriting any existing object so
+    the key stays exactly `name` (playlists reference segments by filename).
+    `cache_control` overrides the Cache-Control header of S3 objects.
+    Returns the storage name.
+    '''
+    storage = storage or default_storage
+    bucket_name = getattr(storage, 'bucket_name', None)
+
+    if bucket_name:
+        location = getattr(storage, 'location', '')
+        extra_args = dict(getattr(settings, 'AWS_S3_OBJECT_PARAMETERS', {}))
+        extra_args['ContentType'] = _content_type(path)
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        # upload_file reads from disk in parts, never the whole file at once.
+        get_s3_client().upload_file(
+            path, bucket_name, posixpath.join(location, name) if location else name, ExtraArgs=extra_args
+        )
+        return name
+
+    if storage.exists(name):
+        storage.delete(name)
+    with open(path, 'rb') as f:
+        return storage.save(name, File(f, name=os.path.basename(path)))
+
+
+def _upload_with_retry(path, name, storage, retries):
+    for attempt in range(1, retries + 1):
+        try:
+            return upload_file(path, name, storage)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.warning(f'Upload of {name} failed (attempt {attempt}/{retries}): {e}')
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+
+def upload_directory(local_dir, prefix, storage=None, publish_last=('master.m3u8',), uploaded=None):
+    '''
+    Uploads every file in `local_dir` under `prefix` concurrently on the shared
+    upload pool, retrying each object independently. Files named in
+    `publish_last` are only uploaded once everything else has landed, so a
+    reader never sees a manifest that points at missing segments.
+
+    `uploaded` is an optional mapping of files that already landed on an
+    earlier attempt; they are skipped, and new uploads are added to it as they
+    finish, so it still records partial progress when an upload fails.
+    Returns the dict mapping each filename to its storage name.
+    '''
+    storage = storage or default_storage
+    retries = getattr(settings, 'MEDIA_UPLOAD_RETRIES', 3)
+    uploaded = {} if uploaded is None else uploaded
+    filenames = sorted(
+        f for f in os.listdir(local_dir) if os.path.isfile(os.path.join(local_dir, f)) and f not in uploaded
+    )
+    deferred = [f for f in filenames if f in publish_last]
+
+    def submit(batch):
+        pool = get_upload_pool()
+        futures = {
+            filename: pool.submit(
+                _upload_with_retry, os.path.join(local_dir, filename), posixpath.join(prefix, filename), storage, retries
+            )
+            for filename in batch
+        }
+        errors = []
+        for filename, future in futures.items():
+            try:
+                uploaded[filename] = future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    started = time.monotonic()
+    submit([f for f in filenames if f not in publish_last])
+    submit(deferred)
+    logger.info(f'Uploaded {len(filenames)} files to {prefix} in {time.monotonic() - started:.2f}s')
+    return uploaded
+
+
+def _s3_key(name, storage):
+    location = getattr(storage, 'location', '') or ''
+    return posixpath.join(location, name) if location else name
+
+
+def list_objects(prefix, storage=None, page_size=1000):
+    '''
+    Yields the objects under `prefix` a page at a time, as lists of
+    (storage name, last modified) with timezone-aware datetimes. S3 is read
+    with ListObjectsV2, one request per page, so no listing is ever held in
+    memory whole; local storage is walked on disk.
+    '''
+    storage = storage or default_storage
+    bucket_name = getattr(storage, 'bucket_name', None)
+    if bucket_name:
+        location = getattr(storage, 'location', '') or ''
+        strip = len(location.rstrip('/')) + 1 if location else 0
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=bucket_name, Prefix=_s3_key(prefix, storage), PaginationConfig={'PageSize': page_size}
+        )
+        for page in pages:
+            objects = [(obj['Key'][strip:], obj['LastModified']) for obj in page.get('Contents', [])]
+            if objects:
+                yield objects
+        return
+
+    root = storage.path('')
+    page = []
+    for directory, _, filenames in os.walk(storage.path(prefix)):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                modified = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+            except OSError:
+                continue
+            page.append((os.path.relpath(path, root).replace(os.sep, '/'), modified))
+            if len(page) == page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+def delete_objects(names, storage=None):
+    '''
+    Deletes `names` from storage, up to 1000 objects per S3 DeleteObjects
+    request. Returns the number of objects deleted; failures are logged and
+    left for the next run.
+    '''
+    storage = storage or default_storage
+    names = list(names)
+    bucket_name = getattr(storage, 'bucket_name', None)
+    if not bucket_name:
+        deleted = 0
+        for name in names:
+            try:
+                storage.delete(name)
+                deleted += 1
+            except OSError as e:
+                logger.warning(f'Could not delete {name}: {e}')
+        return deleted
+
+    deleted = 0
+    for start in range(0, len(names), 1000):
+        batch = names[start:start + 1000]
+        response = get_s3_client().delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': _s3_key(name, storage)} for name in batch], 'Quiet': True},
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            logger.warning(f"Could not delete {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+        deleted += len(batch) - len(errors)
+    return deleted
@@ -1,38 +1,48 @@
+import logging
 import os
-import subprocess
-import tempfile
 
 import ffmpeg
 from celery import shared_task
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 
+from streaming.assets import apply_asset, content_prefix, find_asset, new_digest, record_asset
+from streaming.models import MasterAsset
+from streaming.resolution import invalidate_stream
+
+from .analysis import analyze_audio, pcm_input_options
 from .models import Track
+from .pages import rebuild_pages
+from .pipeline import Checkpoint
+from .popularity import flush_play_counts
+from .storage import IMMUTABLE_CACHE_CONTROL, fetch_source, upload_directory, upload_file
+from .transcoding import (
+    encode_preview,
+    transcode_hls_merged,
+    transcode_hls_variants,
+    write_master_playlist,
+)
 
+logger = logging.getLogger(__name__)
 
-def generate_waveform(input_path, output_path):
-    """
-    Generates waveform data from an audio file.
-    """
-    command = [
-        'ffmpeg',
-        '-i', input_path,
-        '-filter_complex', '[0:a]aformat=channel_layouts=mono,compand=gain=-6,showwavespic=s=600x120:colors=White',
-        '-frames:v', '1',
-        output_path
-    ]
-    subprocess.run(command, check=True, capture_output=True)
 
+MAX_RETRIES = 3
 
-@shared_task(bind=True)
+
+@shared_task(bind=True, queue='media')
 def process_audio_upload(self, track_id):
     """
-    Celery task to process an uploaded audio file:
-    1. Probes for metadata.
-    2. Transcodes to HLS with multiple bitrates.
-    3. Generates a waveform image.
-    4. Updates the Track model with the new data.
+    Celery task to process an uploaded audio file, as resumable stages:
+    1. fetch: hashes the master and reuses existing outputs for identical content.
+    2. probe: reads container metadata.
+    3. analyze: decodes once to measure loudness, peaks, duration and waveform,
+       and finds the loudest window for the preview clip.
+    4. encode: transcodes to loudness-normalized HLS, one checkpoint per bitrate,
+       and cuts the preview clip from the same decoded PCM.
+    5. upload: publishes the HLS files and the preview, remembering each object that landed.
+    6. finalize: updates the Track model with the new data.
+    Progress is checkpointed in track.metadata['pipeline'], so a retry picks
+    up after the last finished stage.
     """
     try:
         track = Track.objects.get(pk=track_id)
@@ -40,106 +50,180 @@ def process_audio_upload(self, track_id):
         return f'Track {track_id} not found.'
 
     track.status = Track.ProcessingStatus.PROCESSING
+    checkpoint = Checkpoint(track.metadata.setdefault('pipeline', {}), track.save, f'track-{track.pk}')
     track.save()
 
-    temp_dir = tempfile.mkdtemp()
-    original_audio_path = os.path.join(temp_dir, 'original_audio')
-    hls_output_dir = os.path.join(temp_dir, 'hls')
-    os.makedirs(hls_output_dir, exist_ok=True)
+    data = checkpoint.data
+    hls_output_dir = checkpoint.path('hls')
+    decoded_audio_path = checkpoint.path('decoded.pcm')
+    preview_path = checkpoint.path('preview.m4a')
+    preview_seconds = getattr(settings, 'CATALOG_PREVIEW_SECONDS', 30)
+    hls_variants_config = getattr(settings, 'CATALOG_HLS_VARIANTS', [64, 128, 256])
 
     try:
-        # 1. Download original file from storage
-        with default_storage.open(track.audio_original.name, 'rb') as f:
-            with open(original_audio_path, 'wb') as temp_f:
-                temp_f.write(f.read())
-
-        # 2. Probe for metadata
-        probe = ffmpeg.probe(original_audio_path)
-        audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
-        if not audio_stream:
-            raise ValueError('No audio stream found in the file.')
-
-        track.duration_ms = int(float(audio_stream['duration']) * 1000)
-        track.bitrate_kbps = int(audio_stream['bit_rate']) // 1000
-        track.sample_rate = int(audio_stream['sample_rate'])
-
-        # TODO: Add loudness analysis (requires loudnorm filter and two-pass encoding)
-
-        # 3. Transcode to HLS
-        hls_variants_config = getattr(settings, 'CATALOG_HLS_VARIANTS', [64, 128, 256])
-
-        ffmpeg_input = ffmpeg.input(original_audio_path)
-        hls_outputs = []
-        stream_map = ''
-
-        for i, bitrate in enumerate(hls_variants_config):
-            output_playlist = os.path.join(hls_output_dir, f'{bitrate}k.m3u8')
-            hls_outputs.append(
-                ffmpeg_input.audio.output(
-                    output_playlist,
-                    acodec='aac',
-                    audio_bitrate=f'{bitrate}k',
-                    hls_time=10,
-                    hls_playlist_type='vod',
-                    hls_segment_filename=os.path.join(hls_output_dir, f'{bitrate}k_%03d.ts')
-                )
+        # 1. Fetch original file from storage (read in place when stored locally),
+        # hashing it on the way in
+        if not checkpoint.done('fetch'):
+            digest = new_digest()
+            data['source_path'] = fetch_source(
+                track.audio_original.name, checkpoint.path('original_audio'), default_storage, digest=digest
             )
-            stream_map += f'v:{i},a:{i} '
-
-        # Run all HLS transcoding commands
-        ffmpeg.merge_outputs(*hls_outputs).run(capture_stdout=True, capture_stderr=True)
-
-        # Create master playlist
-        master_playlist_content = '#EXTM3U\n'
-        for i, bitrate in enumerate(hls_variants_config):
-            master_playlist_content += f'#EXT-X-STREAM-INF:BANDWIDTH={bitrate * 1000},RESOLUTION=,NAME="{bitrate}k"\n'
-            master_playlist_content += f'{bitrate}k.m3u8\n'
-
-        master_playlist_path = os.path.join(hls_output_dir, 'master.m3u8')
-        with open(master_playlist_path, 'w') as f:
-            f.write(master_playlist_content)
-
-        # 4. Upload HLS files to storage
-        track_storage_path = f'tracks/{track.slug}/hls'
-        for filename in os.listdir(hls_output_dir):
-            file_path = os.path.join(hls_output_dir, filename)
-            with open(file_path, 'rb') as f:
-                content = ContentFile(f.read())
-                default_storage.save(os.path.join(track_storage_path, filename), content)
-
-        track.audio_hls_master.name = os.path.join(track_storage_path, 'master.m3u8')
-
-        # 5. Generate and upload waveform
-        waveform_temp_path = os.path.join(temp_dir, 'waveform.png')
-        generate_waveform(original_audio_path, waveform_temp_path)
-
-        waveform_storage_path = f'tracks/{track.slug}/waveform.png'
-        with open(waveform_temp_path, 'rb') as f:
-            content = ContentFile(f.read())
-            # For now, let's just save the path to a field. The spec said JSON.
-            # This is a placeholder for actual JSON waveform data.
-            # Storing the image path for now.
-            track.waveform_json = {'image_path': default_storage.save(waveform_storage_path, content)}
+            data['content_sha256'] = digest.hexdigest()
+            track.metadata['content_sha256'] = data['content_sha256']
+
+            asset = find_asset(data['content_sha256'], MasterAsset.Profile.CATALOG, hls_variants_config)
+            if asset is not None:
+                # Identical master already transcoded: point at its outputs and skip the pipeline.
+                apply_asset(track, asset)
+                track.audio_hls_master.name = asset.hls_master
+                track.status = Track.ProcessingStatus.COMPLETED
+                checkpoint.complete('finalize')
+                checkpoint.cleanup()
+                invalidate_stream(track.slug)
+                logger.info(f"Track {track_id} reuses transcodes of master {data['content_sha256'][:12]}")
+                return f'Successfully processed track {track_id}'
+            checkpoint.complete('fetch')
+
+        original_audio_path = data['source_path']
+        content_sha256 = data['content_sha256']
+
+        # 2. Probe for metadata (reads container headers only)
+        if not checkpoint.done('probe'):
+            probe = ffmpeg.probe(original_audio_path)
+            audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+            if not audio_stream:
+                raise ValueError('No audio stream found in the file.')
+
+            track.bitrate_kbps = int(audio_stream['bit_rate']) // 1000
+            track.sample_rate = int(audio_stream['sample_rate'])
+            data['channels'] = audio_stream.get('channels')
+            data['probe_duration'] = audio_stream.get('duration')
+            checkpoint.complete('probe')
+
+        # 3. Analyze: the single decode of the master. It measures loudness, peaks,
+        # duration and waveform while writing the PCM the encoders read from.
+        if not checkpoint.done('analyze'):
+            analysis = analyze_audio(original_audio_path, data['channels'], decoded_audio_path)
+
+            track.duration_ms = analysis['duration_ms'] or int(float(data['probe_duration']) * 1000)
+            track.loudness_lufs = analysis['integrated_lufs']
+            track.waveform_json = analysis['waveform']
+            track.metadata['analysis'] = {
+                'true_peak_dbtp': analysis['true_peak_dbtp'],
+                'sample_peak_dbfs': analysis['sample_peak_dbfs'],
+                'gain_db': analysis['gain_db'],
+            }
+            data['input_options'] = pcm_input_options(analysis)
+            data['gain_db'] = analysis['gain_db'] if getattr(settings, 'CATALOG_LOUDNESS_NORMALIZE', True) else 0.0
+            data['preview_start_ms'] = analysis.get('preview_start_ms', 0)
+            checkpoint.complete('analyze')
+
+        # 4. Transcode to HLS from the decoded PCM, skipping variants a previous
+        # attempt already encoded
+        transcode_mode = getattr(settings, 'CATALOG_TRANSCODE_MODE', 'parallel')
+        if not checkpoint.done('encode'):
+            os.makedirs(hls_output_dir, exist_ok=True)
+            pending = [bitrate for bitrate in hls_variants_config if not checkpoint.variant_done(bitrate)]
+            if pending and transcode_mode == 'merged':
+                seconds = transcode_hls_merged(
+                    decoded_audio_path, hls_output_dir, pending, data['input_options'], data['gain_db']
+                )
+                for bitrate in pending:
+                    checkpoint.complete_variant({'bitrate': bitrate, 'seconds': seconds})
+            elif pending:
+                # Encode each bitrate as its own job so the track finishes in
+                # roughly the time of its slowest variant.
+                transcode_hls_variants(
+                    decoded_audio_path, hls_output_dir, pending, data['input_options'], data['gain_db'],
+                    on_variant=checkpoint.complete_variant,
+                )
 
+            # Create master playlist
+            write_master_playlist(hls_output_dir, hls_variants_config)
 
-        # 6. Finalize track
+            # Preview clip: a short low-bitrate file from the loudest window, for browsing surfaces
+            if preview_seconds:
+                preview_bitrate = getattr(settings, 'CATALOG_PREVIEW_BITRATE', 64)
+                seconds = min(preview_seconds, track.duration_ms / 1000) if track.duration_ms else preview_seconds
+                encode_preview(
+                    decoded_audio_path, preview_path, data['preview_start_ms'], seconds, preview_bitrate,
+                    data['input_options'], data['gain_db'],
+                )
+                track.metadata['preview'] = {
+                    'start_ms': data['preview_start_ms'],
+                    'duration_ms': int(seconds * 1000),
+                    'bitrate_kbps': preview_bitrate,
+                }
+            track.metadata['transcode'] = {
+                'mode': transcode_mode,
+                'analysis_seconds': checkpoint.state['stages']['analyze']['seconds'],
+                'variants': [checkpoint.state['variants'][str(bitrate)] for bitrate in hls_variants_config],
+            }
+            checkpoint.complete('encode')
+            track.metadata['transcode']['total_seconds'] = checkpoint.state['stages']['encode']['seconds']
+            logger.info(f"Transcoded track {track_id} ({transcode_mode}) in {track.metadata['transcode']['total_seconds']}s")
+
+        # 5. Upload HLS files under content-addressed keys (master playlist goes up
+        # last); objects that landed on an earlier attempt are not sent again
+        storage_prefix = content_prefix(content_sha256, MasterAsset.Profile.CATALOG)
+        if not checkpoint.done('upload'):
+            upload_directory(hls_output_dir, f'{storage_prefix}/hls', default_storage, uploaded=checkpoint.uploaded)
+            if preview_seconds and 'preview.m4a' not in checkpoint.uploaded:
+                # Content-addressed, so it can be cached forever.
+                checkpoint.uploaded['preview.m4a'] = upload_file(
+                    preview_path, f'{storage_prefix}/preview.m4a', default_storage, cache_control=IMMUTABLE_CACHE_CONTROL
+                )
+            checkpoint.complete('upload')
+
+        # 6. Finalize track (analysis, playlist and status in one write)
+        track.audio_hls_master.name = checkpoint.uploaded['master.m3u8']
+        track.audio_preview.name = checkpoint.uploaded.get('preview.m4a')
+        record_asset(
+            content_sha256,
+            MasterAsset.Profile.CATALOG,
+            os.path.getsize(original_audio_path) if os.path.exists(original_audio_path) else 0,
+            storage_prefix,
+            track.audio_hls_master.name,
+            hls_variants_config,
+            fields={
+                'bitrate_kbps': track.bitrate_kbps,
+                'sample_rate': track.sample_rate,
+                'duration_ms': track.duration_ms,
+                'loudness_lufs': track.loudness_lufs,
+                'waveform_json': track.waveform_json,
+                'audio_preview': track.audio_preview.name,
+                'metadata': {
+                    key: track.metadata[key] for key in ('analysis', 'transcode', 'preview') if key in track.metadata
+                },
+            },
+        )
         track.status = Track.ProcessingStatus.COMPLETED
-        track.save()
+        checkpoint.complete('finalize')
 
     except Exception as e:
         track.status = Track.ProcessingStatus.FAILED
-        track.save()
-        # Clean up temp dir
-        if os.path.exists(temp_dir):
-            import shutil
-            shutil.rmtree(temp_dir)
+        checkpoint.fail(e)
+        invalidate_stream(track.slug)
+        if self.request.retries >= MAX_RETRIES:
+            checkpoint.cleanup()
         # Reraise exception to let Celery know the task failed
-        raise self.retry(exc=e, countdown=60, max_retries=3)
-
-    finally:
-        # Clean up temp dir
-        if os.path.exists(temp_dir):
-            import shutil
-            shutil.rmtree(temp_dir)
+        raise self.retry(exc=e, countdown=60, max_retries=MAX_RETRIES)
 
+    checkpoint.cleanup()
+    invalidate_stream(track.slug)
     return f'Successfully processed track {track_id}'
+
+
+@shared_task(queue='batch')
+def flush_track_popularity(deltas=None):
+    '''
+    Collapses the buffered play counters into Track.play_count and
+    Track.popularity. Processes without Redis pass their own `deltas`.
+    '''
+    return flush_play_counts(deltas)
+
+
+@shared_task(queue='batch')
+def rebuild_artist_pages(artist_ids):
+    'Rebuilds the precomputed pages of artists whose tracks, albums or popularity changed.'
+    return rebuild_pages(artist_ids)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from artists.analysis import AudioAnalyzer, analyze_audio, pcm_input_options
+
+SAMPLE_RATE = 48000
+
+
+def sine(seconds, amplitude_db=0.0, frequency=1000, phase=0.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (10 ** (amplitude_db / 20) * np.sin(2 * np.pi * frequency * t + phase)).astype(np.float32)
+
+
+def interleave(*channels):
+    return np.stack(channels, axis=1).ravel()
+
+
+class AudioAnalyzerTest(SimpleTestCase):
+    def test_reference_tone_loudness(self):
+        """
+        A 1kHz tone at -23 dBFS on both channels of a stereo stream reads -23 LUFS (EBU Tech 3341).
+        """
+        tone = sine(10, amplitude_db=-23)
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=2)
+        analyzer.feed(interleave(tone, tone))
+        result = analyzer.finish()
+
+        self.assertAlmostEqual(result['integrated_lufs'], -23.0, delta=0.1)
+        self.assertAlmostEqual(result['sample_peak_dbfs'], -23.0, delta=0.1)
+        self.assertEqual(result['duration_ms'], 10000)
+
+    def test_results_do_not_depend_on_chunking(self):
+        signal = interleave(sine(3, -12, 440), sine(3, -18, 220))
+
+        whole = AudioAnalyzer(SAMPLE_RATE, channels=2)
+        whole.feed(signal)
+        chunked = AudioAnalyzer(SAMPLE_RATE, channels=2)
+        for start in range(0, len(signal), 2 * 3001):
+            chunked.feed(signal[start:start + 2 * 3001])
+
+        self.assertEqual(whole.finish(), chunked.finish())
+
+    def test_true_peak_detects_intersample_overs(self):
+        """
+        A quarter-sample-rate tone sampled 45 degrees off its crest peaks 3 dB above its samples.
+        """
+        tone = sine(1, frequency=SAMPLE_RATE / 4, phase=np.pi / 4)
+        tone /= np.abs(tone).max()
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        analyzer.feed(tone)
+        result = analyzer.finish()
+
+        self.assertAlmostEqual(result['sample_peak_dbfs'], 0.0, delta=0.01)
+        self.assertAlmostEqual(result['true_peak_dbtp'], 3.0, delta=0.2)
+
+    def test_silence_has_no_loudness_and_no_gain(self):
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        analyzer.feed(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        result = analyzer.finish()
+
+        self.assertIsNone(result['integrated_lufs'])
+        self.assertIsNone(result['true_peak_dbtp'])
+        self.assertEqual(result['gain_db'], 0.0)
+
+    @override_settings(CATALOG_LOUDNESS_TARGET_LUFS=-14.0, CATALOG_TRUE_PEAK_CEILING_DBTP=-1.0)
+    def test_gain_is_limited_by_true_peak_ceiling(self):
+        quiet = sine(5, amplitude_db=-30)
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        analyzer.feed(quiet)
+        self.assertAlmostEqual(analyzer.finish()['gain_db'], 19.0, delta=0.2)
+
+        peaky = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        peaky.feed(np.concatenate([sine(5, amplitude_db=-30), sine(0.01, amplitude_db=-3)]))
+        self.assertAlmostEqual(peaky.finish()['gain_db'], 2.0, delta=0.2)
+
+    def test_loudest_window_finds_the_chorus(self):
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        analyzer.feed(np.concatenate([sine(4, amplitude_db=-40), sine(2, amplitude_db=-10), sine(4, amplitude_db=-40)]))
+
+        self.assertAlmostEqual(analyzer.loudest_window(2), 4000, delta=100)
+        self.assertEqual(analyzer.loudest_window(30), 0)
+
+    @override_settings(CATALOG_PREVIEW_SECONDS=1)
+    def test_preview_start_is_reported(self):
+        analyzer = AudioAnalyzer(SAMPLE_RATE, channels=1)
+        analyzer.feed(np.concatenate([sine(2, amplitude_db=-40), sine(1, amplitude_db=-6)]))
+
+        self.assertAlmostEqual(analyzer.finish()['preview_start_ms'], 2000, delta=100)
+
+
+class AnalyzeAudioTest(SimpleTestCase):
+    def test_single_decode_writes_pcm_for_encoders(self):
+        tone = interleave(sine(1, -20), sine(1, -20))
+        chunks = [tone[:40000], tone[40000:]]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pcm_path = os.path.join(temp_dir, 'decoded.pcm')
+            with patch('artists.analysis.decode_pcm', return_value=iter(chunks)) as mock_decode:
+                result = analyze_audio('master.flac', channels=6, pcm_output_path=pcm_path)
+            written = np.fromfile(pcm_path, dtype='<f4')
+
+        mock_decode.assert_called_once_with('master.flac', sample_rate=SAMPLE_RATE, channels=2)
+        np.testing.assert_array_equal(written, tone)
+        self.assertEqual(result['channels'], 2)
+        self.assertEqual(pcm_input_options(result), {'format': 'f32le', 'ar': SAMPLE_RATE, 'ac': 2})
+        self.assertEqual(result['waveform']['duration_ms'], 1000)
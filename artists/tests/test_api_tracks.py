@@ -1,7 +1,13 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from storages.backends.s3 import S3Storage
 
+from artists.models import Track
 from .factories import TrackFactory, ArtistFactory, UserFactory
 
 
@@ -21,6 +27,15 @@ class TrackAPITest(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
+        self.assertIsNone(response.data['results'][0]['preview_url'])
+
+    def test_track_exposes_its_preview_clip(self):
+        self.track.audio_preview.name = 'content/ab/abc/catalog/preview.m4a'
+        self.track.save()
+
+        response = self.client.get(reverse('track-list'))
+
+        self.assertTrue(response.data['results'][0]['preview_url'].endswith('/content/ab/abc/catalog/preview.m4a'))
 
     def test_manager_can_update_their_artists_track(self):
         self.client.force_authenticate(user=self.manager_user)
@@ -39,3 +54,33 @@ class TrackAPITest(APITestCase):
         data = {'is_explicit': True}
         response = self.client.patch(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='media',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class StreamManifestAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.track = TrackFactory(status='completed')
+        self.track.audio_hls_master.name = 'content/ab/abc/catalog/hls/master.m3u8'
+        self.track.save()
+        self.url = reverse('stream-manifest', kwargs={'track_slug': self.track.slug})
+
+    @patch('artists.storage.get_s3_client')
+    def test_concurrent_play_starts_share_one_signature(self, mock_client):
+        mock_client.return_value.generate_presigned_url.return_value = 'https://s3/master.m3u8?sig=1'
+        self.client.force_authenticate(user=UserFactory())
+
+        storage = S3Storage(bucket_name='media', location='prod')
+
+        with patch.object(Track._meta.get_field('audio_hls_master'), 'storage', storage):
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['manifest_url'], second.data['manifest_url'])
+        mock_client.return_value.generate_presigned_url.assert_called_once_with(
+            'get_object', Params={'Bucket': 'media', 'Key': 'prod/content/ab/abc/catalog/hls/master.m3u8'}, ExpiresIn=3600
+        )
@@ -1,6 +1,7 @@
 import uuid
 from unittest.mock import patch
 
+from django.test import override_settings
 from django.urls import reverse
 from django.contrib.auth.models import Group
 from rest_framework import status
@@ -19,7 +20,8 @@ class UploadAPITest(APITestCase):
         self.artist.managers.add(self.artist_manager)
         self.track = TrackFactory(primary_artist=self.artist)
 
-    @patch('boto3.client')
+    @override_settings(AWS_STORAGE_BUCKET_NAME='test-bucket')
+    @patch('artists.views.get_s3_client')
     def test_upload_init_success(self, mock_boto_client):
         """
         Tests that the upload init view returns a presigned URL structure.
@@ -68,3 +70,129 @@ class UploadAPITest(APITestCase):
         self.assertEqual(self.track.status, 'processing')
 
         mock_task_delay.assert_called_once_with(str(self.track.id))
+
+
+class FakeS3:
+    'The multipart calls of an S3 client, keeping uploaded parts in memory.'
+
+    def __init__(self):
+        self.parts = {}
+        self.completed = []
+        self.aborted = []
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        return {'UploadId': 's3-upload-1'}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Key']}?partNumber={Params['PartNumber']}&uploadId={Params['UploadId']}"
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        # One part per page, to exercise pagination.
+        numbers = sorted(number for number in self.parts if number > PartNumberMarker)
+        page = numbers[:1]
+        response = {
+            'Parts': [{'PartNumber': n, 'ETag': f'"{self.parts[n][0]}"', 'Size': self.parts[n][1]} for n in page],
+            'IsTruncated': len(numbers) > 1,
+        }
+        if response['IsTruncated']:
+            response['NextPartNumberMarker'] = page[-1]
+        return response
+
+    def complete_multipart_upload(self, **kwargs):
+        self.completed.append(kwargs)
+
+    def abort_multipart_upload(self, **kwargs):
+        self.aborted.append(kwargs)
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='test-bucket', MEDIA_UPLOAD_PART_SIZE=5 * 1024 * 1024, MEDIA_UPLOAD_MAX_BYTES=50 * 1024 * 1024
+)
+class MultipartUploadAPITest(APITestCase):
+    MB = 1024 * 1024
+
+    def setUp(self):
+        self.artist_manager = UserFactory()
+        manager_group, _ = Group.objects.get_or_create(name='artist_manager')
+        self.artist_manager.groups.add(manager_group)
+        self.artist = ArtistFactory()
+        self.artist.managers.add(self.artist_manager)
+        self.track = TrackFactory(primary_artist=self.artist)
+
+        self.s3 = FakeS3()
+        patcher = patch('artists.uploads.get_s3_client', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(user=self.artist_manager)
+
+    def _init(self, file_size=12 * 1024 * 1024):
+        data = {'filename': 'master.flac', 'file_size': file_size, 'mime_type': 'audio/flac'}
+        return self.client.post(reverse('upload-audio-init'), data, format='json')
+
+    def _complete(self, upload, parts):
+        data = {
+            'upload_id': upload['upload_id'],
+            'object_name': upload['object_name'],
+            'track_id': str(self.track.id),
+            'parts': parts,
+        }
+        return self.client.post(reverse('upload-audio-complete'), data, format='json')
+
+    def test_large_file_gets_one_url_per_part(self):
+        response = self._init()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['multipart'])
+        self.assertEqual((response.data['part_size'], response.data['part_count']), (5 * self.MB, 3))
+        self.assertEqual([part['part_number'] for part in response.data['parts']], [1, 2, 3])
+        self.assertNotIn('s3_upload_id', response.data)
+
+    def test_files_over_the_limit_are_rejected(self):
+        response = self._init(file_size=51 * self.MB)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resume_only_hands_out_the_missing_parts(self):
+        upload = self._init().data
+        self.s3.parts = {1: ('etag-1', 5 * self.MB), 3: ('etag-3', 2 * self.MB)}
+
+        response = self.client.post(reverse('upload-audio-resume'), {'upload_id': upload['upload_id']}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([part['part_number'] for part in response.data['uploaded_parts']], [1, 3])
+        self.assertEqual([part['part_number'] for part in response.data['parts']], [2])
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+        response = self.client.post(reverse('upload-audio-resume'), {'upload_id': upload['upload_id']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch('artists.views.process_audio_upload.delay')
+    def test_complete_verifies_etags_before_completing(self, mock_task_delay):
+        upload = self._init().data
+        self.s3.parts = {1: ('etag-1', 5 * self.MB), 2: ('etag-2', 5 * self.MB), 3: ('etag-3', 2 * self.MB)}
+        parts = [{'part_number': n, 'etag': f'"etag-{n}"'} for n in (1, 2, 3)]
+
+        response = self._complete(upload, parts[:2] + [{'part_number': 3, 'etag': 'stale'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.s3.completed, [])
+
+        response = self._complete(upload, parts)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(
+            self.s3.completed[0]['MultipartUpload']['Parts'][2], {'PartNumber': 3, 'ETag': '"etag-3"'}
+        )
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.audio_original.name, upload['object_name'])
+        mock_task_delay.assert_called_once_with(str(self.track.id))
+        # The session is gone once completed.
+        self.assertEqual(self._complete(upload, parts).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_complete_rejects_missing_parts(self):
+        upload = self._init().data
+        self.s3.parts = {1: ('etag-1', 5 * self.MB)}
+
+        response = self._complete(upload, [{'part_number': 1, 'etag': 'etag-1'}])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Parts not uploaded: [2, 3]', response.data['parts'][0])
@@ -0,0 +1,96 @@
+import datetime
+from collections import Counter
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from artists.models import Artist, Track
+from artists.pages import PAGE_VERSION
+from artists.popularity import apply_play_counts, popularity_score
+from .factories import AlbumFactory, ArtistFactory, TrackFactory
+
+
+class ArtistPageTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.artist = ArtistFactory()
+        self.older = AlbumFactory(primary_artist=self.artist, release_date=datetime.date(2020, 1, 1))
+        self.newer = AlbumFactory(primary_artist=self.artist, release_date=datetime.date(2024, 1, 1))
+        self.older.artists.add(self.artist)
+        self.newer.artists.add(self.artist)
+        self.tracks = [TrackFactory(album=self.older, popularity=popularity) for popularity in (10, 70, 40)]
+        for track in self.tracks:
+            track.artists.add(self.artist)
+        self.tracks[1].audio_preview.name = 'content/ab/preview.m4a'
+        self.tracks[1].save()
+        self.url = reverse('artist-detail', kwargs={'slug': self.artist.slug})
+
+    def test_page_is_built_once_and_served_from_the_artist_row(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data, first.data)
+        self.assertEqual([track['popularity'] for track in response.data['top_tracks']], [70, 40, 10])
+        self.assertEqual([album['slug'] for album in response.data['latest_albums']], [self.newer.slug, self.older.slug])
+        self.assertEqual((response.data['track_count'], response.data['album_count']), (3, 2))
+        self.assertIn('preview.m4a', response.data['top_tracks'][0]['preview_url'])
+        self.assertTrue(response.data['top_tracks'][0]['preview_url'].startswith('http://testserver/'))
+        self.assertEqual(Artist.objects.get(pk=self.artist.pk).page['version'], PAGE_VERSION)
+
+    def test_track_changes_rebuild_the_page(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_track = TrackFactory(album=self.newer, popularity=90)
+            new_track.artists.add(self.artist)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['top_tracks'][0]['slug'], new_track.slug)
+        self.assertEqual(response.data['track_count'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_track.delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['track_count'], 3)
+
+    @patch('artists.signals.schedule_artist_pages')
+    def test_saves_outside_the_page_schedule_nothing(self, mock_schedule):
+        track = Track.objects.get(pk=self.tracks[0].pk)
+
+        track.status = Track.ProcessingStatus.PROCESSING
+        track.metadata = {'pipeline': {'done': ['probe']}}
+        track.save()
+        track.save(update_fields=['status', 'updated_at'])
+        mock_schedule.assert_not_called()
+
+        track.title = 'Renamed'
+        track.save()
+        track.save()
+        mock_schedule.assert_called_once()
+
+    def test_popularity_changes_rebuild_the_page(self):
+        self.client.get(self.url)
+        quiet = self.tracks[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_play_counts(Counter({str(quiet.pk): 1_000_000}))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['top_tracks'][0]['slug'], quiet.slug)
+        self.assertEqual(response.data['top_tracks'][0]['popularity'], 100)
+
+    def test_unchanged_popularity_schedules_nothing(self):
+        track = self.tracks[1]
+        Track.objects.filter(pk=track.pk).update(play_count=1000, popularity=popularity_score(1000))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_play_counts(Counter({str(track.pk): 1}))
+
+        self.assertEqual(callbacks, [])
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import wave
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from artists.benchmark import StageRecorder, run_case, write_wav
+from artists.models import Track
+from artists.pipeline import Checkpoint
+
+
+class SyntheticMasterTest(TestCase):
+    def test_wav_has_the_requested_format(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for kind in ('sweep', 'noise'):
+                path = write_wav(os.path.join(directory, f'{kind}.wav'), kind, 12, 8000)
+
+                with wave.open(path) as wav:
+                    self.assertEqual((wav.getnchannels(), wav.getframerate(), wav.getnframes()), (2, 8000, 96000))
+                    samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+                self.assertLessEqual(np.abs(samples).max(), 32767 * 0.51)
+                self.assertGreater(np.abs(samples).max(), 32767 * 0.45)
+
+
+class StageRecorderTest(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        override = override_settings(MEDIA_PIPELINE_WORK_DIR=self.work_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_each_stage_of_the_run_is_measured(self):
+        with StageRecorder('track-1', [self.work_dir.name]) as recorder:
+            checkpoint = Checkpoint({}, lambda: None, 'track-1')
+            checkpoint.complete('fetch')
+            with open(checkpoint.path('decoded.pcm'), 'wb') as f:
+                f.write(b'\0' * 4096)
+            checkpoint.complete('analyze')
+            Checkpoint({}, lambda: None, 'track-2').complete('fetch')
+
+        self.assertEqual([stage['stage'] for stage in recorder.stages], ['fetch', 'analyze'])
+        self.assertEqual([stage['bytes_written'] for stage in recorder.stages], [0, 4096])
+        self.assertTrue(all(stage['cpu_seconds'] >= 0 and stage['peak_rss_mb'] > 0 for stage in recorder.stages))
+
+    def test_runs_are_rolled_back(self):
+        def fake_pipeline(track_id):
+            checkpoint = Checkpoint({}, lambda: None, f'track-{track_id}')
+            checkpoint.complete('fetch')
+            checkpoint.complete('finalize')
+
+        with tempfile.TemporaryDirectory() as directory, patch('artists.tasks.process_audio_upload', fake_pipeline):
+            master = write_wav(os.path.join(directory, 'sweep.wav'), 'sweep', 1, 8000)
+            result = run_case('catalog', master, 1)
+
+        self.assertIsNone(result['error'])
+        self.assertEqual([stage['stage'] for stage in result['stages']], ['fetch', 'finalize'])
+        self.assertEqual(result['seconds_per_audio_minute'], round(result['wall_seconds'] * 60, 3))
+        self.assertFalse(Track.objects.exists())
@@ -0,0 +1,180 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from artists.ingest import parse_manifest
+from artists.models import Album, AlbumArtist, Genre, Track, TrackArtist
+from artists.uploads import upload_prefix
+from .factories import ArtistFactory, TrackFactory, UserFactory
+
+CSV_MANIFEST = '''album_title,primary_artist,album_type,release_date,title,track_number,duration_ms,featured_artists,genres
+Night Drive,nova,ep,2024-05-01,Intro,1,60000,,synthwave
+Night Drive,nova,ep,2024-05-01,Highway,2,200000,echo,synthwave;ambient
+Other Side,echo,single,,Other Side,1,180000,,
+'''
+
+
+class CatalogIngestAPITest(APITestCase):
+    def setUp(self):
+        self.manager = UserFactory()
+        manager_group, _ = Group.objects.get_or_create(name='artist_manager')
+        self.manager.groups.add(manager_group)
+        self.nova = ArtistFactory(slug='nova')
+        self.echo = ArtistFactory(slug='echo')
+        self.nova.managers.add(self.manager)
+        self.echo.managers.add(self.manager)
+        Genre.objects.create(name='synthwave', slug='synthwave')
+        Genre.objects.create(name='ambient', slug='ambient')
+        self.url = reverse('catalog-ingest')
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.master = default_storage.save(f'{upload_prefix(self.manager)}a/intro.wav', ContentFile(b'RIFF'))
+        self.manifest = {'albums': [{
+            'title': 'Night Drive',
+            'slug': 'night-drive',
+            'primary_artist': 'nova',
+            'album_type': 'ep',
+            'tracks': [
+                {'title': 'Intro', 'track_number': 1, 'duration_ms': 60000, 'isrc': 'USAAA2400001',
+                 'audio_original': self.master, 'genres': ['synthwave']},
+                {'title': 'Highway', 'track_number': 2, 'duration_ms': 200000, 'featured_artists': ['echo'],
+                 'genres': ['synthwave', 'ambient']},
+            ],
+        }]}
+
+    @patch('artists.ingest.enqueue_transcodes')
+    def test_json_manifest_creates_catalog_and_queues_transcodes(self, mock_enqueue):
+        self.client.force_authenticate(user=self.manager)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.manifest, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual((response.data['albums'], response.data['tracks'], response.data['transcodes']), (1, 2, 1))
+        album = Album.objects.get(slug='night-drive')
+        self.assertEqual(album.total_tracks, 2)
+        self.assertTrue(AlbumArtist.objects.filter(album=album, artist=self.nova).exists())
+        intro, highway = album.tracks.order_by('track_number')
+        self.assertEqual(intro.status, Track.ProcessingStatus.PROCESSING)
+        self.assertEqual(highway.status, Track.ProcessingStatus.PENDING)
+        self.assertEqual(
+            TrackArtist.objects.get(track=highway, artist=self.echo).role, TrackArtist.ArtistRole.FEATURED
+        )
+        self.assertEqual(set(highway.genres.values_list('slug', flat=True)), {'synthwave', 'ambient'})
+        mock_enqueue.assert_called_once_with([str(intro.pk)])
+
+    @patch('artists.ingest.enqueue_transcodes')
+    def test_csv_upload_groups_rows_into_albums(self, mock_enqueue):
+        self.client.force_authenticate(user=self.manager)
+        upload = SimpleUploadedFile('delivery.csv', CSV_MANIFEST.encode(), content_type='text/csv')
+
+        response = self.client.post(self.url, {'manifest': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual((response.data['albums'], response.data['tracks']), (2, 3))
+        night_drive = Album.objects.get(title='Night Drive')
+        self.assertEqual(night_drive.tracks.count(), 2)
+        self.assertEqual(str(night_drive.release_date), '2024-05-01')
+
+    @patch('artists.ingest.enqueue_transcodes')
+    def test_invalid_manifest_writes_nothing(self, mock_enqueue):
+        TrackFactory(isrc='USAAA2400001')
+        self.manifest['albums'][0]['tracks'][1]['artists'] = ['ghost']
+        self.client.force_authenticate(user=self.manager)
+
+        response = self.client.post(self.url, self.manifest, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Unknown artists: ghost', response.data['errors'])
+        self.assertIn('Existing ISRCs: USAAA2400001', response.data['errors'])
+        self.assertFalse(Album.objects.filter(slug='night-drive').exists())
+        mock_enqueue.assert_not_called()
+
+    @patch('artists.ingest.enqueue_transcodes')
+    def test_masters_must_exist_and_belong_to_the_caller(self, mock_enqueue):
+        other = default_storage.save(f'{upload_prefix(UserFactory())}b/stolen.wav', ContentFile(b'RIFF'))
+        tracks = self.manifest['albums'][0]['tracks']
+        tracks[0]['audio_original'] = other
+        tracks[1]['audio_original'] = f'{upload_prefix(self.manager)}missing/highway.wav'
+        self.client.force_authenticate(user=self.manager)
+
+        response = self.client.post(self.url, self.manifest, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f'Masters not uploaded by you: {other}', response.data['errors'])
+        self.assertIn(f'Masters not found in storage: {tracks[1]["audio_original"]}', response.data['errors'])
+        self.assertFalse(Album.objects.filter(slug='night-drive').exists())
+
+    def test_manager_cannot_ingest_for_other_artists(self):
+        self.nova.managers.remove(self.manager)
+        self.client.force_authenticate(user=self.manager)
+
+        response = self.client.post(self.url, self.manifest, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('You do not manage: nova', response.data['errors'])
+
+    def test_regular_user_is_forbidden(self):
+        self.client.force_authenticate(user=UserFactory())
+
+        response = self.client.post(self.url, self.manifest, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IngestCatalogCommandTest(APITestCase):
+    def setUp(self):
+        ArtistFactory(slug='nova')
+        ArtistFactory(slug='echo')
+        Genre.objects.create(name='synthwave', slug='synthwave')
+        Genre.objects.create(name='ambient', slug='ambient')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'delivery.csv')
+        with open(self.path, 'w') as f:
+            f.write(CSV_MANIFEST)
+
+    def test_parse_manifest_accepts_a_single_album(self):
+        albums = parse_manifest(json.dumps({'title': 'Solo', 'primary_artist': 'nova', 'tracks': []}))
+
+        self.assertEqual([album['title'] for album in albums], ['Solo'])
+
+    def test_dry_run_only_validates(self):
+        out = StringIO()
+
+        call_command('ingest_catalog', self.path, '--dry-run', stdout=out)
+
+        self.assertIn('2 albums with 3 tracks are ready to ingest.', out.getvalue())
+        self.assertFalse(Album.objects.exists())
+
+    def test_command_ingests_in_batches(self):
+        out = StringIO()
+
+        call_command('ingest_catalog', self.path, '--batch-size', '1', '--no-transcode', stdout=out)
+
+        self.assertIn('Ingested 2 albums with 3 tracks; 0 transcodes queued.', out.getvalue())
+        self.assertEqual(Track.objects.count(), 3)
+
+    def test_command_reports_errors(self):
+        with open(self.path, 'a') as f:
+            f.write('Lost,ghost,single,,Lost,1,1000,,\n')
+
+        with self.assertRaises(CommandError):
+            call_command('ingest_catalog', self.path, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Album.objects.exists())
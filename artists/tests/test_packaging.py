@@ -0,0 +1,81 @@
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+from django.test import SimpleTestCase
+
+from artists.packaging import DASH_NAMESPACE, parse_media_playlist, write_dash_manifest
+
+NS = {'mpd': DASH_NAMESPACE}
+
+SEGMENTED_PLAYLIST = '''#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXT-X-MAP:URI="init_64k.mp4"
+#EXTINF:4.000000,
+segment_64k_000.m4s
+#EXTINF:4.000000,
+segment_64k_001.m4s
+#EXTINF:1.500000,
+segment_64k_002.m4s
+#EXT-X-ENDLIST
+'''
+
+SINGLE_FILE_PLAYLIST = '''#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-MAP:URI="segment_128k.mp4",BYTERANGE="820@0"
+#EXTINF:4.000000,
+#EXT-X-BYTERANGE:64000@820
+segment_128k.mp4
+#EXTINF:2.000000,
+#EXT-X-BYTERANGE:32000
+segment_128k.mp4
+#EXT-X-ENDLIST
+'''
+
+
+class DashManifestTest(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        for name, content in (('playlist_64k.m3u8', SEGMENTED_PLAYLIST), ('playlist_128k.m3u8', SINGLE_FILE_PLAYLIST)):
+            with open(os.path.join(self.temp_dir.name, name), 'w') as f:
+                f.write(content)
+
+    def test_parse_byte_range_playlist(self):
+        playlist = parse_media_playlist(os.path.join(self.temp_dir.name, 'playlist_128k.m3u8'))
+
+        self.assertEqual(playlist['init'], {'uri': 'segment_128k.mp4', 'range': (0, 819)})
+        self.assertEqual([s['range'] for s in playlist['segments']], [(820, 64819), (64820, 96819)])
+        self.assertEqual([s['duration'] for s in playlist['segments']], [4.0, 2.0])
+
+    def test_manifest_addresses_the_hls_segments(self):
+        path = write_dash_manifest(self.temp_dir.name, [64, 128])
+        root = ET.parse(path).getroot()
+
+        self.assertEqual(root.get('mediaPresentationDuration'), 'PT9.500S')
+        segmented, single_file = root.findall('.//mpd:Representation', NS)
+
+        self.assertEqual(segmented.find('.//mpd:Initialization', NS).get('sourceURL'), 'init_64k.mp4')
+        self.assertEqual(
+            [s.get('media') for s in segmented.findall('.//mpd:SegmentURL', NS)],
+            ['segment_64k_000.m4s', 'segment_64k_001.m4s', 'segment_64k_002.m4s'],
+        )
+        timeline = segmented.findall('.//mpd:S', NS)
+        self.assertEqual([(s.get('t'), s.get('d'), s.get('r')) for s in timeline], [('0', '192000', '1'), ('384000', '72000', None)])
+
+        self.assertEqual(single_file.find('mpd:BaseURL', NS).text, 'segment_128k.mp4')
+        self.assertEqual(single_file.find('.//mpd:Initialization', NS).get('range'), '0-819')
+        self.assertEqual(
+            [s.get('mediaRange') for s in single_file.findall('.//mpd:SegmentURL', NS)],
+            ['820-64819', '64820-96819'],
+        )
+
+    def test_mpeg_ts_variants_are_rejected(self):
+        with open(os.path.join(self.temp_dir.name, 'playlist_256k.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXTINF:4.0,\nsegment_256k_000.ts\n#EXT-X-ENDLIST\n')
+
+        with self.assertRaises(ValueError):
+            write_dash_manifest(self.temp_dir.name, [256])
@@ -0,0 +1,73 @@
+import datetime
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from artists.models import Album, Artist, Track
+from artists.pagination import KeysetPagination
+from .factories import AlbumFactory, ArtistFactory, TrackFactory
+
+
+@patch.object(KeysetPagination, 'page_size', 3)
+class KeysetPaginationTest(APITestCase):
+    def walk(self, url):
+        'Follows `next` links from the first cursor page; returns the slugs in order and the pages fetched.'
+        slugs, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+            self.assertNotIn('count', response.data)
+            slugs += [item['slug'] for item in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return slugs, pages
+
+    def test_tracks_are_walked_by_popularity_then_id_without_counting(self):
+        album = AlbumFactory()
+        for popularity in (50, 50, 50, 50, 10, 90, 0):
+            TrackFactory(album=album, popularity=popularity)
+        expected = list(Track.objects.order_by('-popularity', '-id').values_list('slug', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            slugs, pages = self.walk(reverse('track-list') + '?cursor=')
+
+        self.assertEqual(slugs, expected)
+        self.assertEqual(pages, 3)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_albums_without_release_date_come_last(self):
+        artist = ArtistFactory()
+        for release_date in (datetime.date(2024, 1, 1), None, datetime.date(2020, 1, 1), None, None, datetime.date(2022, 1, 1), None):
+            AlbumFactory(primary_artist=artist, release_date=release_date)
+        dated = Album.objects.filter(release_date__isnull=False).order_by('-release_date', '-id')
+        undated = Album.objects.filter(release_date__isnull=True).order_by('-id')
+        expected = [album.slug for album in list(dated) + list(undated)]
+
+        slugs, pages = self.walk(reverse('album-list') + '?cursor=')
+
+        self.assertEqual(slugs, expected)
+        self.assertEqual(pages, 3)
+
+    def test_filters_apply_and_page_numbers_remain_the_default(self):
+        for name in ('Delta', 'Alpha', 'Charlie', 'Bravo', 'Alpha'):
+            ArtistFactory(name=name)
+        ArtistFactory(name='Echo', is_verified=True)
+        expected = list(Artist.objects.filter(is_verified=False).order_by('name', 'id').values_list('slug', flat=True))
+
+        slugs, _ = self.walk(reverse('artist-list') + '?cursor=&is_verified=false')
+        response = self.client.get(reverse('artist-list'))
+
+        self.assertEqual(slugs, expected)
+        self.assertEqual(response.data['count'], 6)
+
+    def test_bad_cursor_and_conflicting_ordering_are_rejected(self):
+        url = reverse('track-list')
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.client.get(url, {'cursor': '', 'ordering': 'title'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
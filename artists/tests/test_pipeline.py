@@ -0,0 +1,74 @@
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+from django.test import SimpleTestCase, override_settings
+
+from artists.pipeline import Checkpoint
+
+
+class CheckpointTest(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        override = override_settings(MEDIA_PIPELINE_WORK_DIR=self.temp_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.save = MagicMock()
+
+    def test_completed_stages_are_skipped_on_the_next_attempt(self):
+        state = {}
+        checkpoint = Checkpoint(state, self.save, 'track-1')
+        checkpoint.complete('fetch')
+        checkpoint.complete_variant({'bitrate': 64, 'seconds': 1.0})
+        checkpoint.fail(RuntimeError('boom'))
+
+        self.assertEqual(state['error'], {'stage': 'probe', 'message': 'boom'})
+
+        resumed = Checkpoint(state, self.save, 'track-1')
+        self.assertTrue(resumed.done('fetch'))
+        self.assertFalse(resumed.done('probe'))
+        self.assertTrue(resumed.variant_done(64))
+        self.assertFalse(resumed.variant_done(128))
+        self.assertEqual(state['attempts'], 2)
+        self.assertEqual(self.save.call_count, 3)
+
+    def test_local_stages_rerun_when_the_work_dir_is_gone(self):
+        state = {}
+        checkpoint = Checkpoint(state, self.save, 'track-1')
+        for stage in ('fetch', 'probe', 'analyze'):
+            checkpoint.complete(stage)
+        checkpoint.complete_variant({'bitrate': 64, 'seconds': 1.0})
+        checkpoint.cleanup()
+
+        resumed = Checkpoint(state, self.save, 'track-1')
+
+        self.assertFalse(resumed.done('fetch'))
+        self.assertTrue(resumed.done('probe'))
+        self.assertFalse(resumed.done('analyze'))
+        self.assertFalse(resumed.variant_done(64))
+        self.assertTrue(os.path.isdir(resumed.work_dir))
+
+    def test_finished_upload_survives_a_lost_work_dir(self):
+        state = {}
+        checkpoint = Checkpoint(state, self.save, 'track-1')
+        for stage in ('fetch', 'probe', 'analyze', 'encode', 'upload'):
+            checkpoint.complete(stage)
+        checkpoint.uploaded['master.m3u8'] = 'content/ab/abc/catalog/hls/master.m3u8'
+        checkpoint.cleanup()
+
+        resumed = Checkpoint(state, self.save, 'track-1')
+
+        self.assertTrue(resumed.done('encode'))
+        self.assertEqual(resumed.uploaded['master.m3u8'], 'content/ab/abc/catalog/hls/master.m3u8')
+
+    def test_finished_run_starts_over(self):
+        state = {}
+        checkpoint = Checkpoint(state, self.save, 'track-1')
+        for stage in ('fetch', 'probe', 'analyze', 'encode', 'upload', 'finalize'):
+            checkpoint.complete(stage)
+
+        resumed = Checkpoint(state, self.save, 'track-1')
+
+        self.assertFalse(resumed.done('fetch'))
+        self.assertEqual(state['attempts'], 1)
@@ -0,0 +1,217 @@
+from collections import Counter
+from importlib import import_module
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from artists.popularity import (
+    FLUSH_LOCK_KEY,
+    SHARD_KEY,
+    apply_play_counts,
+    flush_play_counts,
+    popularity_score,
+    record_play,
+)
+from artists.models import Track
+from artists.tasks import flush_track_popularity
+from .factories import TrackFactory
+
+
+class FakeRedis:
+    'Hash commands used by the play counter, returning bytes like redis-py.'
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hincrby(self, key, field, amount):
+        hash_ = self.hashes.setdefault(key, {})
+        hash_[field.encode()] = str(int(hash_.get(field.encode(), 0)) + amount).encode()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    'Queues commands and runs them back to back on execute, like a MULTI block.'
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((getattr(self.redis, name), args))
+
+    def execute(self):
+        return [command(*args) for command, args in self.commands]
+
+
+class PopularityScoreTest(TestCase):
+    @override_settings(TRACK_POPULARITY_CEILING=1000)
+    def test_score_is_log_scaled_and_capped(self):
+        self.assertEqual(popularity_score(0), 0)
+        self.assertEqual(popularity_score(30), 50)
+        self.assertEqual(popularity_score(1000), 100)
+        self.assertEqual(popularity_score(10 ** 9), 100)
+
+
+@override_settings(TRACK_POPULARITY_CEILING=1000, TRACK_PLAY_COUNTER_SHARDS=4)
+class PlayCounterTest(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = patch('artists.popularity._redis_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.track = TrackFactory()
+        self.other = TrackFactory()
+
+    def test_plays_do_not_touch_the_track_row(self):
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                record_play(self.track.pk)
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.play_count, 0)
+        shards = [SHARD_KEY.format(shard=shard) for shard in range(4)]
+        self.assertEqual(sum(int(self.redis.hgetall(key).get(str(self.track.pk).encode(), 0)) for key in shards), 3)
+
+    def test_flush_applies_counts_and_normalized_popularity(self):
+        for _ in range(30):
+            record_play(self.track.pk)
+        record_play(self.other.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_play_counts(), 2)
+
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]), 1)
+
+        self.track.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.track.play_count, self.track.popularity), (30, popularity_score(30)))
+        self.assertEqual((self.other.play_count, self.other.popularity), (1, popularity_score(1)))
+        self.assertEqual(self.redis.hashes, {})
+
+    def test_flush_adds_to_existing_counts_and_stays_within_constraint(self):
+        self.track.play_count = 5000
+        self.track.popularity = 100
+        self.track.save()
+        record_play(self.track.pk)
+
+        flush_track_popularity()
+
+        self.track.refresh_from_db()
+        self.assertEqual((self.track.play_count, self.track.popularity), (5001, 100))
+
+    def test_overlapping_flush_is_skipped(self):
+        record_play(self.track.pk)
+        cache.add(FLUSH_LOCK_KEY, 1)
+        self.addCleanup(cache.delete, FLUSH_LOCK_KEY)
+
+        self.assertEqual(flush_play_counts(), 0)
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.play_count, 0)
+        self.assertNotEqual(self.redis.hashes, {})
+
+    def test_failed_apply_puts_the_plays_back(self):
+        for _ in range(3):
+            record_play(self.track.pk)
+
+        with patch('artists.popularity.apply_play_counts', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                flush_play_counts()
+        flush_play_counts()
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.play_count, 3)
+        self.assertEqual(self.redis.hashes, {})
+
+    def test_a_flush_does_not_reapply_claimed_plays(self):
+        record_play(self.track.pk)
+
+        flush_play_counts()
+        flush_play_counts()
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.play_count, 1)
+
+    def test_batches_are_one_update_each(self):
+        tracks = TrackFactory.create_batch(3)
+
+        with CaptureQueriesContext(connection) as queries:
+            apply_play_counts(Counter({str(track.pk): 2 for track in tracks}), batch_size=2)
+
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+
+        for track in tracks:
+            track.refresh_from_db()
+            self.assertEqual(track.play_count, 2)
+
+
+class LocalPlayCounterTest(TestCase):
+    # The test settings use the file cache, so plays are held in process.
+
+    def test_local_deltas_are_flushed(self):
+        track = TrackFactory()
+        record_play(track.pk)
+        record_play(track.pk)
+
+        flush_play_counts()
+
+        track.refresh_from_db()
+        self.assertEqual(track.play_count, 2)
+
+    @override_settings(TRACK_POPULARITY_FLUSH_SECONDS=0)
+    @patch('artists.tasks.flush_track_popularity.delay')
+    def test_due_deltas_are_handed_to_the_task(self, mock_delay):
+        track = TrackFactory()
+
+        with self.assertNumQueries(0):
+            record_play(track.pk)
+
+        mock_delay.assert_called_once_with({str(track.pk): 1})
+        flush_track_popularity(*mock_delay.call_args.args)
+        track.refresh_from_db()
+        self.assertEqual(track.play_count, 1)
+
+
+@override_settings(TRACK_POPULARITY_CEILING=1000)
+class PlayCountBackfillTest(TestCase):
+    migration = import_module('artists.migrations.0011_backfill_track_play_count')
+
+    def test_old_popularity_becomes_the_play_count(self):
+        played = TrackFactory()
+        counted = TrackFactory()
+        Track.objects.filter(pk=played.pk).update(popularity=30)
+        Track.objects.filter(pk=counted.pk).update(play_count=500, popularity=90)
+
+        self.migration.backfill_play_count(apps, None)
+
+        played.refresh_from_db()
+        counted.refresh_from_db()
+        self.assertEqual((played.play_count, played.popularity), (30, popularity_score(30)))
+        self.assertEqual((counted.play_count, counted.popularity), (500, 90))
+
+    def test_first_flush_keeps_backfilled_tracks_ahead(self):
+        played = TrackFactory()
+        fresh = TrackFactory()
+        Track.objects.filter(pk=played.pk).update(popularity=30)
+        self.migration.backfill_play_count(apps, None)
+
+        apply_play_counts(Counter({str(played.pk): 1, str(fresh.pk): 1}))
+
+        played.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(played.play_count, 31)
+        self.assertGreater(played.popularity, fresh.popularity)
@@ -0,0 +1,248 @@
+import io
+import os
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.test import SimpleTestCase, override_settings
+from storages.backends.s3 import S3Storage
+
+from artists.storage import (
+    copy_to_local,
+    fetch_source,
+    get_s3_client,
+    local_path,
+    presigned_url,
+    signed_url,
+    upload_directory,
+    upload_file,
+)
+
+
+class RecordingFile(File):
+    'A file wrapper that remembers the largest read it served.'
+    def __init__(self, data):
+        super().__init__(io.BytesIO(data), name='master.flac')
+        self.largest_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.largest_read = max(self.largest_read, len(chunk))
+        return chunk
+
+
+class RemoteStorage(Storage):
+    'A storage backend without local paths, like S3.'
+    def __init__(self, source):
+        self.source = source
+
+    def _open(self, name, mode='rb'):
+        return self.source
+
+
+class MediaStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.data = os.urandom(10_000)
+
+    def test_local_storage_is_read_in_place(self):
+        storage = FileSystemStorage(location=self.temp_dir.name)
+        name = storage.save('masters/master.flac', ContentFile(self.data))
+        destination = os.path.join(self.temp_dir.name, 'copy')
+
+        path = fetch_source(name, destination, storage)
+
+        self.assertEqual(path, storage.path(name))
+        self.assertFalse(os.path.exists(destination))
+
+    def test_remote_storage_has_no_local_path(self):
+        self.assertIsNone(local_path('master.flac', RemoteStorage(RecordingFile(self.data))))
+
+    def test_remote_copy_is_chunked(self):
+        source = RecordingFile(self.data)
+        destination = os.path.join(self.temp_dir.name, 'copy')
+
+        path = fetch_source('master.flac', destination, RemoteStorage(source), buffer_size=1024)
+
+        self.assertEqual(path, destination)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertLessEqual(source.largest_read, 1024)
+
+    def test_s3_objects_are_streamed_from_the_body(self):
+        source = RecordingFile(b'')
+        source.obj = MagicMock()
+        source.obj.get.return_value = {'Body': MagicMock(iter_chunks=MagicMock(return_value=iter([b'ab', b'cd'])))}
+        destination = os.path.join(self.temp_dir.name, 'copy')
+
+        written = copy_to_local('master.flac', destination, RemoteStorage(source), buffer_size=2)
+
+        self.assertEqual(written, 4)
+        source.obj.get.return_value['Body'].iter_chunks.assert_called_once_with(chunk_size=2)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), b'abcd')
+
+
+class BulkUploadTest(SimpleTestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.local_dir = os.path.join(self.temp_dir.name, 'hls')
+        os.makedirs(self.local_dir)
+        for filename in ['master.m3u8', '64k.m3u8', '64k_000.ts', '64k_001.ts']:
+            with open(os.path.join(self.local_dir, filename), 'wb') as f:
+                f.write(filename.encode())
+        self.storage = FileSystemStorage(location=os.path.join(self.temp_dir.name, 'media'))
+
+    def test_uploads_every_file_under_prefix(self):
+        uploaded = upload_directory(self.local_dir, 'tracks/song/hls', self.storage)
+
+        self.assertEqual(uploaded['master.m3u8'], 'tracks/song/hls/master.m3u8')
+        self.assertEqual(len(uploaded), 4)
+        with self.storage.open('tracks/song/hls/64k_001.ts') as f:
+            self.assertEqual(f.read(), b'64k_001.ts')
+
+    def test_master_playlist_is_uploaded_last(self):
+        order = []
+        lock = threading.Lock()
+
+        def record(path, name, storage=None):
+            with lock:
+                order.append(os.path.basename(name))
+            return name
+
+        with patch('artists.storage.upload_file', side_effect=record):
+            upload_directory(self.local_dir, 'tracks/song/hls', self.storage)
+
+        self.assertEqual(order[-1], 'master.m3u8')
+        self.assertEqual(len(order), 4)
+
+    @patch('artists.storage.time.sleep')
+    def test_failed_objects_are_retried(self, mock_sleep):
+        attempts = {}
+        lock = threading.Lock()
+
+        def flaky(path, name, storage=None):
+            with lock:
+                attempts[name] = attempts.get(name, 0) + 1
+                if name.endswith('64k_000.ts') and attempts[name] == 1:
+                    raise ConnectionError('connection reset')
+            return name
+
+        with patch('artists.storage.upload_file', side_effect=flaky):
+            uploaded = upload_directory(self.local_dir, 'tracks/song/hls', self.storage)
+
+        self.assertEqual(attempts['tracks/song/hls/64k_000.ts'], 2)
+        self.assertEqual(attempts['tracks/song/hls/64k_001.ts'], 1)
+        self.assertEqual(len(uploaded), 4)
+
+    def test_partial_progress_is_recorded_and_skipped_on_retry(self):
+        def fail_one_segment(path, name, storage=None):
+            if name.endswith('64k_001.ts'):
+                raise ConnectionError('connection reset')
+            return name
+
+        uploaded = {}
+        with patch('artists.storage.upload_file', side_effect=fail_one_segment), \
+                patch('artists.storage.time.sleep'):
+            with self.assertRaises(ConnectionError):
+                upload_directory(self.local_dir, 'tracks/song/hls', self.storage, uploaded=uploaded)
+
+        # The manifest is held back until every segment has landed.
+        self.assertEqual(set(uploaded), {'64k.m3u8', '64k_000.ts'})
+
+        with patch('artists.storage.upload_file', side_effect=lambda path, name, storage=None: name) as mock_upload:
+            upload_directory(self.local_dir, 'tracks/song/hls', self.storage, uploaded=uploaded)
+
+        self.assertEqual(
+            sorted(call.args[1] for call in mock_upload.call_args_list),
+            ['tracks/song/hls/64k_001.ts', 'tracks/song/hls/master.m3u8'],
+        )
+        self.assertEqual(len(uploaded), 4)
+
+    def test_reupload_keeps_the_same_name(self):
+        path = os.path.join(self.local_dir, '64k_000.ts')
+        upload_file(path, 'tracks/song/hls/64k_000.ts', self.storage)
+
+        self.assertEqual(upload_file(path, 'tracks/song/hls/64k_000.ts', self.storage), 'tracks/song/hls/64k_000.ts')
+
+    def test_s3_uploads_stream_from_disk_through_shared_client(self):
+        s3_storage = MagicMock(bucket_name='media', location='')
+        path = os.path.join(self.local_dir, '64k_000.ts')
+
+        with patch('artists.storage.get_s3_client') as mock_client:
+            upload_file(path, 'tracks/song/hls/64k_000.ts', s3_storage)
+
+        args, kwargs = mock_client.return_value.upload_file.call_args
+        self.assertEqual(args, (path, 'media', 'tracks/song/hls/64k_000.ts'))
+        self.assertEqual(kwargs['ExtraArgs']['ContentType'], 'video/mp2t')
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='media',
+    MEDIA_PRESIGNED_URL_EXPIRY=3600,
+    MEDIA_PRESIGNED_URL_REUSE=900,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class PresignedUrlCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = patch('artists.storage.get_s3_client')
+        self.mock_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        signatures = iter(range(100))
+        self.mock_client.return_value.generate_presigned_url.side_effect = (
+            lambda method, Params, ExpiresIn: f"https://s3/{Params['Key']}?sig={next(signatures)}"
+        )
+
+    @patch('artists.storage.time.time', return_value=9000.0)
+    def test_requests_in_one_window_share_a_signature(self, mock_time):
+        first = presigned_url('tracks/hot/hls/master.m3u8')
+        mock_time.return_value = 9899.0
+        second = presigned_url('tracks/hot/hls/master.m3u8')
+
+        self.assertEqual(first, second)
+        self.mock_client.return_value.generate_presigned_url.assert_called_once_with(
+            'get_object', Params={'Bucket': 'media', 'Key': 'tracks/hot/hls/master.m3u8'}, ExpiresIn=3600
+        )
+
+    @patch('artists.storage.time.time', return_value=9000.0)
+    def test_next_window_signs_again(self, mock_time):
+        first = presigned_url('tracks/hot/hls/master.m3u8')
+        mock_time.return_value = 9900.0
+        second = presigned_url('tracks/hot/hls/master.m3u8')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.mock_client.return_value.generate_presigned_url.call_count, 2)
+
+    def test_objects_are_cached_separately(self):
+        presigned_url('tracks/a/hls/master.m3u8')
+        presigned_url('tracks/b/hls/master.m3u8')
+
+        self.assertEqual(self.mock_client.return_value.generate_presigned_url.call_count, 2)
+
+    def test_signed_urls_include_the_storage_location(self):
+        url = signed_url('tracks/previews/a.m4a', S3Storage(bucket_name='media', location='prod'))
+
+        self.assertTrue(url.startswith('https://s3/prod/tracks/previews/a.m4a?'))
+
+    @override_settings(MEDIA_PRESIGNED_URL_REUSE=0)
+    def test_reuse_can_be_disabled(self):
+        presigned_url('tracks/hot/hls/master.m3u8')
+        presigned_url('tracks/hot/hls/master.m3u8')
+
+        self.assertEqual(self.mock_client.return_value.generate_presigned_url.call_count, 2)
+
+
+class S3ClientTest(SimpleTestCase):
+    def test_client_is_built_once_per_process(self):
+        with patch('artists.storage._s3_client', None), patch('artists.storage.boto3.session.Session') as mock_session:
+            first = get_s3_client()
+            second = get_s3_client()
+
+        self.assertIs(first, second)
+        mock_session.assert_called_once()
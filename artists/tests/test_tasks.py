@@ -1,6 +1,9 @@
+import hashlib
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -8,10 +11,29 @@ from .factories import TrackFactory
 from .test_utils import create_silent_wav
 from artists.tasks import process_audio_upload
 from artists.models import Track
+from streaming.models import MasterAsset
+
+
+ANALYSIS = {
+    'duration_ms': 1000,
+    'integrated_lufs': -20.0,
+    'true_peak_dbtp': -6.0,
+    'sample_peak_dbfs': -6.2,
+    'gain_db': 5.0,
+    'waveform': {'levels': []},
+    'channels': 1,
+    'sample_rate': 48000,
+    'preview_start_ms': 200,
+}
 
 
 class TaskProcessingTest(TestCase):
     def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        override = override_settings(MEDIA_PIPELINE_WORK_DIR=self.work_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
         self.silent_wav_data = create_silent_wav(duration_ms=1000).read()
         self.track = TrackFactory(
             audio_original=SimpleUploadedFile(
@@ -43,7 +65,7 @@ class TaskProcessingTest(TestCase):
         self.assertIsNotNone(self.track.audio_hls_master.name)
         # Check that HLS files and waveform were saved
         self.assertGreater(mock_storage_save.call_count, 0)
-        self.assertEqual(self.track.waveform_json['image_path'], 'mock/path/to/file')
+        self.assertEqual(self.track.waveform_json['levels'][0]['points'], 200)
 
 
     @patch('artists.tasks.ffmpeg.probe', side_effect=Exception('FFMPEG probe error'))
@@ -61,8 +83,10 @@ class TaskProcessingTest(TestCase):
         self.track.refresh_from_db()
         self.assertEqual(self.track.status, Track.ProcessingStatus.FAILED)
 
+    @override_settings(CATALOG_TRANSCODE_MODE='merged')
+    @patch('artists.tasks.analyze_audio', return_value=ANALYSIS)
     @patch('artists.tasks.ffmpeg.merge_outputs')
-    def test_process_audio_failure_on_transcode(self, mock_ffmpeg_merge):
+    def test_process_audio_failure_on_transcode(self, mock_ffmpeg_merge, mock_analyze):
         """
         Tests that the track status is set to FAILED if transcoding fails.
         """
@@ -78,3 +102,143 @@ class TaskProcessingTest(TestCase):
 
         self.track.refresh_from_db()
         self.assertEqual(self.track.status, Track.ProcessingStatus.FAILED)
+
+    @patch('artists.tasks.transcode_hls_variants', side_effect=Exception('FFMPEG variant encode error'))
+    @patch('artists.tasks.analyze_audio', return_value=ANALYSIS)
+    @patch('artists.tasks.ffmpeg.probe')
+    def test_process_audio_failure_on_parallel_variant(self, mock_ffmpeg_probe, mock_analyze, mock_transcode):
+        """
+        Tests that a failing variant encode in parallel mode marks the track as FAILED.
+        """
+        mock_ffmpeg_probe.return_value = {
+            'streams': [{'codec_type': 'audio', 'duration': '1.0', 'bit_rate': '705600', 'sample_rate': '44100'}]
+        }
+
+        with patch('artists.tasks.default_storage.open') as mock_storage_open:
+            mock_storage_open.return_value.__enter__.return_value = ContentFile(self.silent_wav_data)
+            try:
+                process_audio_upload(self.track.id)
+            except Exception:
+                pass
+
+        mock_analyze.assert_called_once()
+        self.assertEqual(mock_transcode.call_args.args[4], ANALYSIS['gain_db'])
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.status, Track.ProcessingStatus.FAILED)
+
+    @patch('artists.tasks.analyze_audio')
+    @patch('artists.tasks.ffmpeg.probe')
+    def test_duplicate_master_reuses_existing_outputs(self, mock_ffmpeg_probe, mock_analyze):
+        """
+        Tests that a master whose hash is already indexed skips probing and
+        transcoding and points at the shared outputs.
+        """
+        sha256 = hashlib.sha256(self.silent_wav_data).hexdigest()
+        asset = MasterAsset.objects.create(
+            sha256=sha256,
+            profile=MasterAsset.Profile.CATALOG,
+            storage_prefix=f'content/{sha256[:2]}/{sha256}/catalog',
+            hls_master=f'content/{sha256[:2]}/{sha256}/catalog/hls/master.m3u8',
+            variants=[64, 128, 256],
+            fields={'duration_ms': 1000, 'sample_rate': 44100, 'metadata': {'analysis': {'gain_db': 5.0}}},
+        )
+
+        process_audio_upload(self.track.id)
+
+        mock_ffmpeg_probe.assert_not_called()
+        mock_analyze.assert_not_called()
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.status, Track.ProcessingStatus.COMPLETED)
+        self.assertEqual(self.track.audio_hls_master.name, asset.hls_master)
+        self.assertEqual(self.track.duration_ms, 1000)
+        self.assertEqual(self.track.metadata['content_sha256'], sha256)
+        asset.refresh_from_db()
+        self.assertEqual(asset.reuse_count, 1)
+
+    @override_settings(CATALOG_HLS_VARIANTS=[96, 160])
+    @patch('artists.tasks.ffmpeg.probe', side_effect=Exception('FFMPEG probe error'))
+    def test_duplicate_master_with_other_variants_is_reprocessed(self, mock_ffmpeg_probe):
+        """
+        Tests that an indexed master encoded at different bitrates is not reused.
+        """
+        sha256 = hashlib.sha256(self.silent_wav_data).hexdigest()
+        MasterAsset.objects.create(
+            sha256=sha256,
+            profile=MasterAsset.Profile.CATALOG,
+            storage_prefix='content/x',
+            hls_master='content/x/hls/master.m3u8',
+            variants=[64, 128, 256],
+        )
+
+        try:
+            process_audio_upload(self.track.id)
+        except Exception:
+            pass
+
+        mock_ffmpeg_probe.assert_called_once()
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.status, Track.ProcessingStatus.FAILED)
+
+    @patch('artists.tasks.upload_file', side_effect=lambda path, name, storage=None, cache_control=None: name)
+    @patch('artists.tasks.encode_preview')
+    @patch('artists.tasks.upload_directory')
+    @patch('artists.tasks.transcode_hls_variants')
+    @patch('artists.tasks.analyze_audio', return_value=ANALYSIS)
+    @patch('artists.tasks.ffmpeg.probe')
+    def test_retry_after_failed_upload_resumes_without_reencoding(
+        self, mock_ffmpeg_probe, mock_analyze, mock_transcode, mock_upload, mock_preview, mock_upload_file
+    ):
+        """
+        Tests that a retry after an upload failure skips the finished stages
+        and only uploads what had not landed yet.
+        """
+        mock_ffmpeg_probe.return_value = {
+            'streams': [{'codec_type': 'audio', 'duration': '1.0', 'bit_rate': '705600', 'sample_rate': '44100', 'channels': 1}]
+        }
+
+        def encode(source_path, output_dir, bitrates, input_options, gain_db, on_variant=None):
+            for bitrate in bitrates:
+                with open(os.path.join(output_dir, f'{bitrate}k.m3u8'), 'w') as f:
+                    f.write('#EXTM3U')
+                on_variant({'bitrate': bitrate, 'seconds': 0.1})
+
+        def flaky_upload(local_dir, prefix, storage=None, uploaded=None):
+            uploaded['64k.m3u8'] = f'{prefix}/64k.m3u8'
+            raise ConnectionError('connection reset')
+
+        def upload(local_dir, prefix, storage=None, uploaded=None):
+            for filename in os.listdir(local_dir):
+                uploaded.setdefault(filename, f'{prefix}/{filename}')
+            return uploaded
+
+        mock_transcode.side_effect = encode
+        mock_upload.side_effect = flaky_upload
+        with self.assertRaises(ConnectionError):
+            process_audio_upload(self.track.id)
+
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.status, Track.ProcessingStatus.FAILED)
+        self.assertEqual(self.track.metadata['pipeline']['stage'], 'encode')
+        self.assertEqual(self.track.metadata['pipeline']['error']['stage'], 'upload')
+
+        mock_upload.side_effect = upload
+        process_audio_upload(self.track.id)
+
+        self.assertEqual(mock_ffmpeg_probe.call_count, 1)
+        self.assertEqual(mock_analyze.call_count, 1)
+        self.assertEqual(mock_transcode.call_count, 1)
+        self.assertEqual(mock_upload.call_count, 2)
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.status, Track.ProcessingStatus.COMPLETED)
+        self.assertTrue(self.track.audio_hls_master.name.endswith('/hls/master.m3u8'))
+        self.assertEqual(self.track.metadata['pipeline']['attempts'], 2)
+        self.assertEqual(len(self.track.metadata['transcode']['variants']), 3)
+        self.assertEqual(os.listdir(self.work_dir.name), [])
+
+        # The preview is cut once, from the loudest window, and stored as one immutable object.
+        mock_preview.assert_called_once()
+        self.assertEqual(mock_preview.call_args.args[2:5], (200, 1.0, 64))
+        mock_upload_file.assert_called_once()
+        self.assertIn('immutable', mock_upload_file.call_args.kwargs['cache_control'])
+        self.assertTrue(self.track.audio_preview.name.endswith('/preview.m4a'))
+        self.assertEqual(self.track.metadata['preview']['duration_ms'], 1000)
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from artists.transcoding import run_variant_jobs, transcode_hls_variants, write_master_playlist
+
+
+class ParallelTranscodeTest(SimpleTestCase):
+    def test_variants_run_concurrently_and_report_timings(self):
+        """
+        Variant encodes should overlap, so the batch takes about as long as the slowest one.
+        """
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_encode(source_path, output_dir, bitrate, *args):
+            with lock:
+                active.append(bitrate)
+                peak.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.remove(bitrate)
+            return {'bitrate': bitrate, 'seconds': 0.2}
+
+        with patch('artists.transcoding.encode_hls_variant', side_effect=fake_encode):
+            started = time.monotonic()
+            reports = transcode_hls_variants('decoded.pcm', '/tmp', [64, 128, 256], max_workers=3)
+            elapsed = time.monotonic() - started
+
+        self.assertEqual([r['bitrate'] for r in reports], [64, 128, 256])
+        self.assertTrue(all('seconds' in r for r in reports))
+        self.assertEqual(max(peak), 3)
+        self.assertLess(elapsed, 0.5)
+
+    @override_settings(CATALOG_TRANSCODE_CONCURRENCY=1)
+    def test_concurrency_cap_is_respected(self):
+        """
+        The configured cap bounds how many encoders run at once.
+        """
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_encode(source_path, output_dir, bitrate, *args):
+            with lock:
+                active.append(bitrate)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(bitrate)
+            return {'bitrate': bitrate, 'seconds': 0.05}
+
+        with patch('artists.transcoding.encode_hls_variant', side_effect=fake_encode):
+            transcode_hls_variants('decoded.pcm', '/tmp', [64, 128, 256])
+
+        self.assertEqual(max(peak), 1)
+
+    def test_variant_failure_propagates(self):
+        with patch('artists.transcoding.encode_hls_variant', side_effect=RuntimeError('encoder crashed')):
+            with self.assertRaises(RuntimeError):
+                transcode_hls_variants('decoded.pcm', '/tmp', [64, 128])
+
+    def test_finished_variants_are_reported_before_a_failure_is_raised(self):
+        def job(bitrate):
+            if bitrate == 128:
+                raise RuntimeError('encoder crashed')
+            time.sleep(0.05)
+            return {'bitrate': bitrate, 'seconds': 0.05}
+
+        finished = []
+        with self.assertRaises(RuntimeError):
+            run_variant_jobs(job, [64, 128, 256], max_workers=3, on_variant=finished.append)
+
+        self.assertEqual(sorted(r['bitrate'] for r in finished), [64, 256])
+
+    def test_write_master_playlist(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = write_master_playlist(output_dir, [64, 128])
+            with open(path) as f:
+                content = f.read()
+
+        self.assertEqual(os.path.basename(path), 'master.m3u8')
+        self.assertTrue(content.startswith('#EXTM3U\n'))
+        self.assertIn('BANDWIDTH=64000', content)
+        self.assertIn('128k.m3u8', content)
+
+    def test_write_master_playlist_with_custom_variant_names(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            with open(write_master_playlist(output_dir, [64], variant_playlist='playlist_{bitrate}k.m3u8')) as f:
+                content = f.read()
+
+        self.assertIn('\nplaylist_64k.m3u8\n', content)
+
+    def test_gain_and_pcm_options_reach_every_encoder(self):
+        with patch('artists.transcoding.encode_hls_variant', return_value={'bitrate': 64, 'seconds': 0}) as mock_encode:
+            transcode_hls_variants('decoded.pcm', '/tmp', [64, 128], {'format': 'f32le'}, -3.5)
+
+        for call in mock_encode.call_args_list:
+            self.assertEqual(call.args[3:], ({'format': 'f32le'}, -3.5))
@@ -0,0 +1,80 @@
+import io
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from artists.waveform import WaveformAccumulator, decode_level, decode_pcm
+
+
+def sine(seconds, amplitude=0.5, sample_rate=11025, frequency=440):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+class WaveformAccumulatorTest(SimpleTestCase):
+    def test_levels_have_requested_resolution(self):
+        accumulator = WaveformAccumulator()
+        accumulator.feed(sine(30))
+        payload = accumulator.finish(levels=(200, 1000, 4000))
+
+        self.assertEqual([level['points'] for level in payload['levels']], [200, 1000, 4000])
+        self.assertEqual(payload['duration_ms'], 30000)
+        self.assertEqual(len(decode_level(payload['levels'][2])['max']), 4000)
+
+    def test_peaks_and_rms_match_signal(self):
+        accumulator = WaveformAccumulator()
+        accumulator.feed(sine(5))
+        level = decode_level(accumulator.finish(levels=(200,))['levels'][0])
+
+        self.assertAlmostEqual(float(level['max'].mean()), 0.5, delta=0.02)
+        self.assertAlmostEqual(float(level['min'].mean()), -0.5, delta=0.02)
+        self.assertAlmostEqual(float(level['rms'].mean()), 0.5 / np.sqrt(2), delta=0.02)
+
+    def test_result_does_not_depend_on_chunking(self):
+        signal = np.random.default_rng(0).uniform(-1, 1, 50_000).astype(np.float32)
+
+        whole = WaveformAccumulator()
+        whole.feed(signal)
+
+        chunked = WaveformAccumulator()
+        for start in range(0, len(signal), 777):
+            chunked.feed(signal[start:start + 777])
+
+        self.assertEqual(whole.finish(), chunked.finish())
+
+    def test_short_audio_clamps_points(self):
+        accumulator = WaveformAccumulator()
+        accumulator.feed(sine(0.1))
+        payload = accumulator.finish(levels=(200, 4000))
+
+        # 1102 samples in 5ms (55 sample) blocks, the last one partial.
+        self.assertEqual([level['points'] for level in payload['levels']], [21, 21])
+
+    def test_empty_audio(self):
+        payload = WaveformAccumulator().finish(levels=(200,))
+        self.assertEqual(payload['duration_ms'], 0)
+        self.assertEqual(payload['levels'][0]['points'], 1)
+
+
+class DecodePcmTest(SimpleTestCase):
+    def _process(self, data, returncode=0):
+        process = MagicMock()
+        process.stdout = io.BytesIO(data)
+        process.stderr = io.BytesIO(b'')
+        process.wait.return_value = returncode
+        return process
+
+    def test_reassembles_samples_across_buffers(self):
+        samples = np.arange(10, dtype='<f4')
+        with patch('artists.waveform.subprocess.Popen', return_value=self._process(samples.tobytes())):
+            chunks = list(decode_pcm('master.flac', buffer_size=12))
+
+        np.testing.assert_array_equal(np.concatenate(chunks), samples)
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunks))
+
+    def test_ffmpeg_failure_raises(self):
+        with patch('artists.waveform.subprocess.Popen', return_value=self._process(b'', returncode=1)):
+            with self.assertRaises(subprocess.CalledProcessError):
+                list(decode_pcm('broken.flac'))
@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ffmpeg
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HLS_SEGMENT_SECONDS = 10
+
+
+def _source(source_path, input_options=None, gain_db=0.0):
+    stream = ffmpeg.input(source_path, **(input_options or {})).audio
+    if gain_db:
+        stream = stream.filter('volume', f'{gain_db}dB')
+    return stream
+
+
+def _hls_output(stream, output_dir, bitrate):
+    return stream.output(
+        os.path.join(output_dir, f'{bitrate}k.m3u8'),
+        acodec='aac',
+        audio_bitrate=f'{bitrate}k',
+        hls_time=HLS_SEGMENT_SECONDS,
+        hls_playlist_type='vod',
+        hls_segment_filename=os.path.join(output_dir, f'{bitrate}k_%03d.ts')
+    )
+
+
+def encode_hls_variant(source_path, output_dir, bitrate, input_options=None, gain_db=0.0):
+    '''
+    Encodes a single HLS variant in its own ffmpeg process, applying the
+    loudness normalization gain on the way.
+    Returns a timing report for the variant.
+    '''
+    started = time.monotonic()
+    _hls_output(_source(source_path, input_options, gain_db), output_dir, bitrate).overwrite_output().run(
+        capture_stdout=True, capture_stderr=True
+    )
+    return {'bitrate': bitrate, 'seconds': round(time.monotonic() - started, 3)}
+
+
+def encode_preview(source_path, output_path, start_ms, seconds, bitrate, input_options=None, gain_db=0.0):
+    '''
+    Cuts a `seconds`-long clip starting at `start_ms` into a single AAC file
+    (faded in and out, moov atom first so it plays while downloading).
+    Seeking in the raw PCM written by analyze_audio is exact and decodes nothing.
+    Returns a timing report.
+    '''
+    started = time.monotonic()
+    options = dict(input_options or {}, ss=start_ms / 1000, t=seconds)
+    fade = min(1.0, seconds / 4)
+    (
+        _source(source_path, options, gain_db)
+        .filter('afade', t='in', d=fade)
+        .filter('afade', t='out', st=max(0.0, seconds - fade), d=fade)
+        .output(output_path, acodec='aac', audio_bitrate=f'{bitrate}k', movflags='+faststart')
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return {'bitrate': bitrate, 'seconds': round(time.monotonic() - started, 3)}
+
+
+def run_variant_jobs(job, bitrates, max_workers=None, on_variant=None):
+    '''
+    Runs `job(bitrate)` for every bitrate over a bounded pool. Each worker
+    thread only waits on its ffmpeg child, so the pool caps the number of
+    concurrent encoder processes (Celery's prefork children cannot fork a
+    multiprocessing pool of their own).
+
+    `on_variant(report)` is called from the calling thread as each job
+    finishes. Every job is allowed to finish before the first failure is
+    re-raised, so callers can checkpoint the variants that did succeed.
+    Returns the reports in the order of `bitrates`.
+    '''
+    if max_workers is None:
+        max_workers = getattr(settings, 'CATALOG_TRANSCODE_CONCURRENCY', 3)
+    max_workers = max(1, min(max_workers, len(bitrates)))
+
+    reports = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hls-encode') as pool:
+        futures = {pool.submit(job, bitrate): bitrate for bitrate in bitrates}
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            reports[futures[future]] = report
+            logger.info(f"Encoded {report['bitrate']}k variant in {report['seconds']}s")
+            if on_variant:
+                on_variant(report)
+
+    if errors:
+        raise errors[0]
+    return [reports[bitrate] for bitrate in bitrates]
+
+
+def transcode_hls_variants(source_path, output_dir, bitrates, input_options=None, gain_db=0.0, max_workers=None,
+                           on_variant=None):
+    '''
+    Encodes each variant as its own ffmpeg process, fanned out with
+    run_variant_jobs. Returns the per-variant timing reports in the order of
+    `bitrates`.
+    '''
+    return run_variant_jobs(
+        lambda bitrate: encode_hls_variant(source_path, output_dir, bitrate, input_options, gain_db),
+        bitrates,
+        max_workers=max_workers,
+        on_variant=on_variant,
+    )
+
+
+def transcode_hls_merged(source_path, output_dir, bitrates, input_options=None, gain_db=0.0):
+    '''
+    Encodes every variant in a single ffmpeg invocation.
+    '''
+    started = time.monotonic()
+    stream = _source(source_path, input_options, gain_db)
+    # A filtered stream feeding several outputs has to be split explicitly.
+    streams = stream.filter_multi_output('asplit', len(bitrates)) if gain_db else None
+    hls_outputs = [
+        _hls_output(streams[i] if streams else stream, output_dir, bitrate)
+        for i, bitrate in enumerate(bitrates)
+    ]
+    ffmpeg.merge_outputs(*hls_outputs).run(capture_stdout=True, capture_stderr=True)
+    return round(time.monotonic() - started, 3)
+
+
+def write_master_playlist(output_dir, bitrates, variant_playlist='{bitrate}k.m3u8'):
+    '''
+    Writes the HLS master playlist referencing each variant playlist, named
+    after the `variant_playlist` pattern.
+    '''
+    master_playlist_content = '#EXTM3U\n'
+    for bitrate in bitrates:
+        master_playlist_content += f'#EXT-X-STREAM-INF:BANDWIDTH={bitrate * 1000},RESOLUTION=,NAME="{bitrate}k"\n'
+        master_playlist_content += variant_playlist.format(bitrate=bitrate) + '\n'
+
+    master_playlist_path = os.path.join(output_dir, 'master.m3u8')
+    with open(master_playlist_path, 'w') as f:
+        f.write(master_playlist_content)
+    return master_playlist_path
@@ -0,0 +1,174 @@
+import logging
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .storage import get_s3_client
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'upload:multipart:{upload_id}'
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3's minimum for every part but the last
+MAX_PARTS = 10000
+
+
+class UploadError(Exception):
+    'The client sent a multipart upload that cannot be completed as described.'
+
+
+def upload_prefix(user):
+    'Storage prefix of the masters `user` uploads directly; ingest only accepts theirs.'
+    return f'uploads/original/{user.pk}/'
+
+
+def max_upload_bytes():
+    return getattr(settings, 'MEDIA_UPLOAD_MAX_BYTES', 2 * 1024 ** 3)
+
+
+def part_size_for(file_size):
+    '''
+    Returns the part size for a file: MEDIA_UPLOAD_PART_SIZE, grown (in whole
+    MiB) when the file would otherwise need more than S3's 10,000 parts.
+    '''
+    part_size = max(getattr(settings, 'MEDIA_UPLOAD_PART_SIZE', 16 * 1024 * 1024), MIN_PART_SIZE)
+    if math.ceil(file_size / part_size) > MAX_PARTS:
+        part_size = math.ceil(file_size / MAX_PARTS / (1024 * 1024)) * 1024 * 1024
+    return part_size
+
+
+def _session_ttl():
+    return getattr(settings, 'MEDIA_UPLOAD_SESSION_TTL', 24 * 60 * 60)
+
+
+def _bucket():
+    return settings.AWS_STORAGE_BUCKET_NAME
+
+
+def part_urls(session, part_numbers):
+    'Returns a presigned PUT URL for each part number.'
+    client = get_s3_client()
+    expires_in = getattr(settings, 'MEDIA_PRESIGNED_URL_EXPIRY', 3600)
+    return [
+        {
+            'part_number': number,
+            'url': client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': _bucket(),
+                    'Key': session['object_name'],
+                    'UploadId': session['s3_upload_id'],
+                    'PartNumber': number,
+                },
+                ExpiresIn=expires_in,
+            ),
+        }
+        for number in part_numbers
+    ]
+
+
+def start_multipart_upload(user, object_name, file_size, mime_type):
+    '''
+    Opens an S3 multipart upload for `object_name` and remembers it for
+    MEDIA_UPLOAD_SESSION_TTL, so the upload can be resumed and completed by
+    the same user. Returns the upload id, the part layout and a presigned
+    URL per part; the client PUTs the parts in parallel, in any order.
+    '''
+    part_size = part_size_for(file_size)
+    response = get_s3_client().create_multipart_upload(Bucket=_bucket(), Key=object_name, ContentType=mime_type)
+    session = {
+        'upload_id': str(uuid.uuid4()),
+        's3_upload_id': response['UploadId'],
+        'object_name': object_name,
+        'user_id': str(user.pk),
+        'file_size': file_size,
+        'part_size': part_size,
+        'part_count': math.ceil(file_size / part_size),
+    }
+    cache.set(SESSION_KEY.format(upload_id=session['upload_id']), session, timeout=_session_ttl())
+    public = ('upload_id', 'object_name', 'file_size', 'part_size', 'part_count')
+    return {
+        **{field: session[field] for field in public},
+        'parts': part_urls(session, range(1, session['part_count'] + 1)),
+    }
+
+
+def get_session(upload_id, user):
+    'Returns the multipart session `upload_id` opened by `user`, or None.'
+    session = cache.get(SESSION_KEY.format(upload_id=upload_id))
+    if session is None or session['user_id'] != str(user.pk):
+        return None
+    return session
+
+
+def uploaded_parts(session):
+    'Returns {part number: {etag, size}} for the parts S3 already holds, following pagination.'
+    client = get_s3_client()
+    parts = {}
+    marker = 0
+    while True:
+        response = client.list_parts(
+            Bucket=_bucket(), Key=session['object_name'], UploadId=session['s3_upload_id'], PartNumberMarker=marker,
+        )
+        for part in response.get('Parts', []):
+            parts[part['PartNumber']] = {'etag': part['ETag'].strip('"'), 'size': part['Size']}
+        if not response.get('IsTruncated'):
+            return parts
+        marker = response['NextPartNumberMarker']
+
+
+def resume_multipart_upload(session):
+    '''
+    Returns what a client needs to carry on after an interruption: the parts
+    already stored and fresh presigned URLs for the missing ones only.
+    '''
+    cache.touch(SESSION_KEY.format(upload_id=session['upload_id']), _session_ttl())
+    stored = uploaded_parts(session)
+    missing = [number for number in range(1, session['part_count'] + 1) if number not in stored]
+    return {
+        'upload_id': session['upload_id'],
+        'object_name': session['object_name'],
+        'part_size': session['part_size'],
+        'part_count': session['part_count'],
+        'uploaded_parts': [{'part_number': number, **part} for number, part in sorted(stored.items())],
+        'parts': part_urls(session, missing),
+    }
+
+
+def complete_multipart_upload(session, parts):
+    '''
+    Completes the multipart upload after checking that every part is stored,
+    that the client's ETags (from each part's PUT response) match what S3
+    holds and that the total size is within MEDIA_UPLOAD_MAX_BYTES. Raises
+    UploadError otherwise; an oversized upload is aborted.
+    '''
+    stored = uploaded_parts(session)
+    expected = range(1, session['part_count'] + 1)
+    missing = [number for number in expected if number not in stored]
+    if missing:
+        raise UploadError(f'Parts not uploaded: {missing[:20]}')
+
+    claimed = {part['part_number']: part['etag'].strip('"') for part in parts}
+    if set(claimed) != set(expected):
+        raise UploadError(f"Expected ETags for parts 1 to {session['part_count']}.")
+    mismatched = [number for number in expected if claimed[number] != stored[number]['etag']]
+    if mismatched:
+        raise UploadError(f'ETag mismatch for parts: {mismatched[:20]}')
+
+    client = get_s3_client()
+    size = sum(stored[number]['size'] for number in expected)
+    if size > max_upload_bytes():
+        client.abort_multipart_upload(Bucket=_bucket(), Key=session['object_name'], UploadId=session['s3_upload_id'])
+        cache.delete(SESSION_KEY.format(upload_id=session['upload_id']))
+        raise UploadError(f'Upload is {size} bytes, more than the {max_upload_bytes()} allowed.')
+
+    client.complete_multipart_upload(
+        Bucket=_bucket(),
+        Key=session['object_name'],
+        UploadId=session['s3_upload_id'],
+        MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': f'"{claimed[number]}"'} for number in expected]},
+    )
+    cache.delete(SESSION_KEY.format(upload_id=session['upload_id']))
+    logger.info(f"Completed multipart upload of {session['object_name']} ({session['part_count']} parts, {size} bytes)")
+    return size
@@ -11,7 +11,9 @@ router.register(r'tracks', views.TrackViewSet, basename='track')
 
 urlpatterns = [
     path('search/', views.SearchView.as_view(), name='catalog-search'),
+    path('ingest/', views.CatalogIngestView.as_view(), name='catalog-ingest'),
     path('uploads/audio/init/', views.UploadInitView.as_view(), name='upload-audio-init'),
+    path('uploads/audio/resume/', views.UploadResumeView.as_view(), name='upload-audio-resume'),
     path('uploads/audio/complete/', views.UploadCompleteView.as_view(), name='upload-audio-complete'),
     path('streams/<slug:track_slug>/manifest/', views.StreamManifestView.as_view(), name='stream-manifest'),
     path('', include(router.urls)),
@@ -1,4 +1,4 @@
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
@@ -13,7 +13,6 @@ from .models import (
 )
 import uuid
 
-import boto3
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.contrib.postgres.search import TrigramSimilarity
@@ -21,6 +20,8 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 
+from streaming.resolution import resolve_stream
+
 from .permissions import (
     IsAdminUserOrReadOnly,
     IsArtistOwnerOrStaff,
@@ -38,8 +39,22 @@ from .serializers import (
     TrackWriteSerializer,
     UploadCompleteSerializer,
     UploadInitSerializer,
+    UploadResumeSerializer,
 )
+from .ingest import IngestError, ingest_albums, parse_manifest
+from .pagination import CatalogPagination
+from .storage import get_s3_client, signed_url
 from .tasks import process_audio_upload
+from .uploads import (
+    UploadError,
+    complete_multipart_upload,
+    get_session,
+    max_upload_bytes,
+    part_size_for,
+    resume_multipart_upload,
+    start_multipart_upload,
+    upload_prefix,
+)
 
 
 class GenreViewSet(viewsets.ModelViewSet):
@@ -78,6 +93,8 @@ class ArtistViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'bio']
     ordering_fields = ['name', 'followers_count', 'monthly_listeners']
     ordering = ['name']
+    pagination_class = CatalogPagination
+    keyset_ordering = 'name'
     lookup_field = 'slug'
 
     def get_serializer_class(self):
@@ -89,8 +106,9 @@ class ArtistViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        if self.action == 'retrieve':
-            return qs.prefetch_related('tracks', 'albums')
+        if self.action != 'retrieve':
+            # Only the detail view serves the precomputed page.
+            return qs.defer('page')
         return qs
 
 
@@ -129,6 +147,8 @@ class AlbumViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'primary_artist__name', 'artists__name']
     ordering_fields = ['release_date', 'title']
     ordering = ['-release_date']
+    pagination_class = CatalogPagination
+    keyset_ordering = '-release_date'
     lookup_field = 'slug'
 
 
@@ -163,6 +183,8 @@ class TrackViewSet(viewsets.ModelViewSet):
     search_fields = ['title', 'primary_artist__name', 'album__title']
     ordering_fields = ['popularity', 'title', 'duration_ms']
     ordering = ['-popularity']
+    pagination_class = CatalogPagination
+    keyset_ordering = '-popularity'
     lookup_field = 'slug'
 
 
@@ -219,7 +241,50 @@ class SearchView(APIView, PageNumberPagination):
         return self.get_paginated_response(serializer.data)
 
 
+class CatalogIngestView(APIView):
+    '''
+    Ingests whole albums from a delivery manifest in bulk: a JSON body, or a
+    `manifest` file upload in JSON or CSV (one row per track). Tracks that
+    name an uploaded master are transcoded in the background.
+    '''
+    throttle_scope = 'ingest'
+    permission_classes = [IsAuthenticated, IsStaffOrArtistManager]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('manifest')
+        try:
+            if upload is not None:
+                is_csv = upload.name.lower().endswith('.csv') or upload.content_type == 'text/csv'
+                albums = parse_manifest(upload.read(), 'csv' if is_csv else 'json')
+            else:
+                albums = parse_manifest(request.data)
+        except (ValueError, KeyError, TypeError) as e:
+            return Response({'detail': f'Could not read the manifest: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(albums, list):
+            return Response({'detail': 'Expected a list of albums.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_tracks = getattr(settings, 'CATALOG_INGEST_MAX_TRACKS', 5000)
+        track_count = sum(len(album.get('tracks') or []) for album in albums if isinstance(album, dict))
+        if track_count > max_tracks:
+            return Response(
+                {'detail': f'At most {max_tracks} tracks per request; use the ingest_catalog command for larger deliveries.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            summary = ingest_albums(albums, user=request.user)
+        except IngestError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_201_CREATED)
+
+
 class UploadInitView(APIView):
+    '''
+    Starts a direct upload to object storage. Files that fit in one part get
+    a single presigned POST; larger ones get a multipart upload with a
+    presigned URL per part, uploaded in parallel and resumable through
+    UploadResumeView.
+    '''
     throttle_scope = 'upload'
     permission_classes = [IsAuthenticated, IsStaffOrArtistManager]
 
@@ -227,34 +292,40 @@ class UploadInitView(APIView):
         serializer = UploadInitSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # TODO: Add validation for file size and type from settings
-        # For now, we proceed directly.
+        file_size = serializer.validated_data['file_size']
+        if file_size > max_upload_bytes():
+            return Response(
+                {'file_size': [f'Files larger than {max_upload_bytes()} bytes are not accepted.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         file_name = serializer.validated_data['filename']
         # Use a temporary upload location
-        object_name = f'uploads/original/{uuid.uuid4()}/{file_name}'
-
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            config=boto3.session.Config(signature_version='s3v4')
-        )
+        object_name = f'{upload_prefix(request.user)}{uuid.uuid4()}/{file_name}'
+        part_size = part_size_for(file_size)
 
         try:
-            # TODO: Make content length range configurable
-            response = s3_client.generate_presigned_post(
+            if file_size > part_size:
+                response = start_multipart_upload(
+                    request.user, object_name, file_size, serializer.validated_data['mime_type']
+                )
+                response['multipart'] = True
+                return Response(response, status=status.HTTP_200_OK)
+
+            response = get_s3_client().generate_presigned_post(
                 Bucket=settings.AWS_STORAGE_BUCKET_NAME,
                 Key=object_name,
                 Fields={'Content-Type': serializer.validated_data['mime_type']},
                 Conditions=[
                     {'Content-Type': serializer.validated_data['mime_type']},
-                    ['content-length-range', 1, 30 * 1024 * 1024]  # 30MB limit
+                    ['content-length-range', 1, part_size]
                 ],
                 ExpiresIn=3600  # 1 hour
             )
             # Add upload_id for tracking
             response['upload_id'] = str(uuid.uuid4())
             response['object_name'] = object_name
+            response['multipart'] = False
 
         except ClientError:
             return Response({'detail': 'Could not generate pre-signed URL.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -262,6 +333,28 @@ class UploadInitView(APIView):
         return Response(response, status=status.HTTP_200_OK)
 
 
+class UploadResumeView(APIView):
+    '''
+    Lists the parts of a multipart upload that already landed and returns
+    fresh presigned URLs for the missing ones, so an interrupted upload only
+    re-sends what is missing.
+    '''
+    throttle_scope = 'upload'
+    permission_classes = [IsAuthenticated, IsStaffOrArtistManager]
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadResumeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        session = get_session(serializer.validated_data['upload_id'], request.user)
+        if session is None:
+            return Response({'detail': 'Upload not found or expired.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return Response(resume_multipart_upload(session), status=status.HTTP_200_OK)
+        except ClientError:
+            return Response({'detail': 'Could not read the upload.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class UploadCompleteView(APIView):
     throttle_scope = 'upload'
     permission_classes = [IsAuthenticated, IsStaffOrArtistManager]
@@ -272,6 +365,13 @@ class UploadCompleteView(APIView):
 
         track_id = serializer.validated_data['track_id']
         object_name = serializer.validated_data['object_name']
+        session = get_session(serializer.validated_data['upload_id'], request.user)
+        if session is not None and session['object_name'] != object_name:
+            return Response({'object_name': ['Does not match the upload.']}, status=status.HTTP_400_BAD_REQUEST)
+        if session is None and 'parts' in serializer.validated_data:
+            return Response({'detail': 'Upload not found or expired.'}, status=status.HTTP_404_NOT_FOUND)
+        if session is not None and 'parts' not in serializer.validated_data:
+            return Response({'parts': ['Required for multipart uploads.']}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             track = Track.objects.get(pk=track_id)
@@ -283,6 +383,14 @@ class UploadCompleteView(APIView):
         if not obj_perm.has_object_permission(request, self, track):
             self.permission_denied(request, message='You do not have permission to modify this track.')
 
+        if session is not None:
+            try:
+                complete_multipart_upload(session, serializer.validated_data['parts'])
+            except UploadError as e:
+                return Response({'parts': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+            except ClientError:
+                return Response({'detail': 'Could not complete the upload.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
         # Associate the uploaded file with the track object
         track.audio_original.name = object_name
         track.status = Track.ProcessingStatus.PROCESSING
@@ -302,22 +410,16 @@ class StreamManifestView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, track_slug, *args, **kwargs):
-        track = get_object_or_404(Track, slug=track_slug, status=Track.ProcessingStatus.COMPLETED)
+        resolution = resolve_stream(track_slug)
+        if resolution is None or resolution['track_status'] != Track.ProcessingStatus.COMPLETED:
+            raise Http404
 
-        if not track.audio_hls_master or not track.audio_hls_master.name:
+        if not resolution['track_hls_master']:
             return Response({'detail': 'HLS manifest is not available for this track.'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            s3_client = boto3.client(
-                's3',
-                endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-                config=boto3.session.Config(signature_version='s3v4')
-            )
-            url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': track.audio_hls_master.name},
-                ExpiresIn=3600  # URL is valid for 1 hour
-            )
+            # Hot tracks share one cached signature per reuse window.
+            url = signed_url(resolution['track_hls_master'], Track._meta.get_field('audio_hls_master').storage)
         except ClientError:
             return Response(
                 {'detail': 'Could not generate streaming URL.'},
@@ -0,0 +1,131 @@
+import base64
+import subprocess
+
+import numpy as np
+from django.conf import settings
+
+WAVEFORM_SAMPLE_RATE = 11025
+WAVEFORM_LEVELS = (200, 1000, 4000)
+WAVEFORM_VERSION = 1
+
+# Peaks are kept per 5ms block while decoding; zoom levels are reduced from those blocks.
+BLOCKS_PER_SECOND = 200
+
+
+def decode_pcm(input_path, sample_rate=WAVEFORM_SAMPLE_RATE, channels=1, buffer_size=None):
+    '''
+    Decodes `input_path` through an ffmpeg pipe and yields float32 sample
+    arrays of at most `buffer_size` bytes, interleaved when channels > 1.
+    Nothing beyond a single buffer is ever held in memory.
+    '''
+    buffer_size = buffer_size or getattr(settings, 'MEDIA_COPY_BUFFER_SIZE', 1024 * 1024)
+    frame_bytes = 4 * channels
+    buffer_size -= buffer_size % frame_bytes
+    command = [
+        'ffmpeg', '-v', 'error', '-i', str(input_path),
+        '-vn', '-ac', str(channels), '-ar', str(sample_rate),
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-',
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        pending = b''
+        while True:
+            data = process.stdout.read(buffer_size)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % frame_bytes
+            pending = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype='<f4')
+        stderr = process.stderr.read()
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+
+
+def _encode(values, scale):
+    quantized = np.clip(np.rint(values * scale), -scale, scale).astype(np.int8)
+    return base64.b64encode(quantized.tobytes()).decode('ascii')
+
+
+class WaveformAccumulator:
+    '''
+    Builds multi-resolution min/max/RMS peaks from mono PCM fed chunk by
+    chunk. Each chunk is reduced to fixed-size blocks with strided numpy
+    reductions, so the full signal is never materialised.
+    '''
+
+    def __init__(self, sample_rate=WAVEFORM_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.block_size = max(1, sample_rate // BLOCKS_PER_SECOND)
+        self.total_samples = 0
+        self._pending = np.empty(0, dtype=np.float32)
+        self._mins = []
+        self._maxs = []
+        self._sumsq = []
+        self._counts = []
+
+    def _reduce(self, blocks, count):
+        self._mins.append(blocks.min(axis=1))
+        self._maxs.append(blocks.max(axis=1))
+        self._sumsq.append(np.square(blocks, dtype=np.float64).sum(axis=1))
+        self._counts.append(np.full(len(blocks), count, dtype=np.int64))
+
+    def feed(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        self.total_samples += len(samples)
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+
+        whole = len(samples) - len(samples) % self.block_size
+        if whole:
+            self._reduce(samples[:whole].reshape(-1, self.block_size), self.block_size)
+        self._pending = samples[whole:].copy()
+
+    def finish(self, levels=WAVEFORM_LEVELS):
+        '''
+        Returns the JSON-serialisable waveform payload. Each level holds
+        base64-encoded int8 arrays (min/max in -127..127, RMS in 0..127).
+        '''
+        if len(self._pending):
+            self._reduce(self._pending.reshape(1, -1), len(self._pending))
+            self._pending = np.empty(0, dtype=np.float32)
+
+        if self._mins:
+            mins, maxs = np.concatenate(self._mins), np.concatenate(self._maxs)
+            sumsq, counts = np.concatenate(self._sumsq), np.concatenate(self._counts)
+        else:
+            mins = maxs = sumsq = np.zeros(1)
+            counts = np.ones(1, dtype=np.int64)
+
+        payload = {
+            'version': WAVEFORM_VERSION,
+            'encoding': 'int8-base64',
+            'sample_rate': self.sample_rate,
+            'duration_ms': int(self.total_samples * 1000 / self.sample_rate),
+            'levels': [],
+        }
+        for points in levels:
+            points = min(points, len(mins))
+            starts = np.linspace(0, len(mins), points, endpoint=False).astype(np.int64)
+            rms = np.sqrt(np.add.reduceat(sumsq, starts) / np.add.reduceat(counts, starts))
+            payload['levels'].append({
+                'points': points,
+                'min': _encode(np.minimum.reduceat(mins, starts), 127),
+                'max': _encode(np.maximum.reduceat(maxs, starts), 127),
+                'rms': _encode(rms, 127),
+            })
+        return payload
+
+
+def decode_level(level):
+    '''
+    Decodes one payload level back into float arrays in -1..1.
+    '''
+    return {
+        key: np.frombuffer(base64.b64decode(level[key]), dtype=np.int8).astype(np.float32) / 127
+        for key in ('min', 'max', 'rms')
+    }
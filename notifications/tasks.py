@@ -23,7 +23,7 @@ class ProviderClient:
 provider_client = ProviderClient()
 
 
-@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+@shared_task(bind=True, max_retries=5, default_retry_delay=60, queue='realtime')
 def deliver_notification(self, notification_id):
     # load notification
     try:
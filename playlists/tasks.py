@@ -10,7 +10,7 @@ import requests
 
 logger = logging.getLogger(__name__)
 
-@shared_task
+@shared_task(queue='realtime')
 def rebalance_positions(playlist_id):
     """
     Rebalances the position of tracks in a playlist to ensure a consistent gap.
@@ -35,7 +35,7 @@ def rebalance_positions(playlist_id):
         return False
 
 
-@shared_task
+@shared_task(queue='media')
 def generate_playlist_collage(playlist_id):
     """
     Generates a 2x2 collage from the album covers of the first 4 tracks
@@ -0,0 +1,24 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+
+from .signals import get_search_vector_kwargs
+
+# The columns each model's search_vector is built from, as in search.signals.
+SEARCH_VECTOR_FIELDS = {
+    'artists.Artist': ('name', 'bio'),
+    'artists.Album': ('title', 'label'),
+    'artists.Track': ('title', 'isrc'),
+    'playlists.Playlist': ('title', 'description'),
+}
+
+
+def refresh_search_vectors(model, pks):
+    '''
+    Rebuilds the search_vector of the given rows in one UPDATE, for rows
+    written with bulk_create (which sends no post_save). A no-op off
+    PostgreSQL, like the signal handlers.
+    '''
+    if 'postgres' not in connection.vendor or not pks:
+        return 0
+    fields = SEARCH_VECTOR_FIELDS[model._meta.label]
+    return model.objects.filter(pk__in=pks).update(search_vector=SearchVector(*fields, **get_search_vector_kwargs()))
@@ -8,7 +8,7 @@ from playlists.models import Playlist
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
-@shared_task
+@shared_task(queue='batch')
 def compute_trending_window():
     """
     Computes trending content using a time-decay scoring algorithm.
@@ -48,7 +48,7 @@ def compute_trending_window():
 
 from social.models import SocialInteraction
 
-@shared_task
+@shared_task(queue='batch')
 def compute_recommendations_batch():
     """
     Computes recommendations for all users based on liked tracks.
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import AudioFile, AudioQuality, StreamingSession, PlaybackSettings
+
+from artists.models import Track
+from .models import AudioFile, AudioFingerprint, AudioQuality, MasterAsset, StreamingSession, PlaybackSettings
+from .tasks import process_audio_file
 
 class AudioQualityInline(admin.TabularInline):
     model = AudioQuality
@@ -7,11 +10,26 @@ class AudioQualityInline(admin.TabularInline):
 
 @admin.register(AudioFile)
 class AudioFileAdmin(admin.ModelAdmin):
-    list_display = ('track_title', 'status', 'bitrate_kbps', 'sample_rate', 'channels')
+    list_display = ('track_title', 'status', 'pipeline_stage', 'bitrate_kbps', 'sample_rate', 'channels')
     list_filter = ('status', 'bitrate_kbps', 'sample_rate')
     search_fields = ('track__title', 'track__primary_artist__name')
     autocomplete_fields = ['track']
+    readonly_fields = ('pipeline_state',)
     inlines = [AudioQualityInline]
+    actions = ['process_anyway']
+
+    def process_anyway(self, request, queryset):
+        'Re-queues uploads held as near-duplicates, skipping the duplicate check.'
+        count = 0
+        for audio_file in queryset.exclude(status=Track.ProcessingStatus.COMPLETED):
+            process_audio_file.delay(audio_file.pk, allow_duplicate=True)
+            count += 1
+        self.message_user(request, f'{count} audio file(s) queued for processing.')
+    process_anyway.short_description = 'Process anyway (ignore near-duplicate match)'
+
+    def pipeline_stage(self, obj):
+        return obj.pipeline_state.get('stage', '-')
+    pipeline_stage.short_description = 'Last finished stage'
 
     def track_title(self, obj):
         return obj.track.title
@@ -25,6 +43,21 @@ class AudioQualityAdmin(admin.ModelAdmin):
     search_fields = ('audio_file__track__title',)
     autocomplete_fields = ['audio_file']
 
+@admin.register(MasterAsset)
+class MasterAssetAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'profile', 'size_bytes', 'reuse_count', 'created_at')
+    list_filter = ('profile',)
+    search_fields = ('sha256', 'storage_prefix')
+    readonly_fields = ('sha256', 'profile', 'storage_prefix')
+
+@admin.register(AudioFingerprint)
+class AudioFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('audio_file', 'duplicate_of', 'match_score', 'landmark_count', 'duration_ms', 'created_at')
+    list_filter = (('duplicate_of', admin.EmptyFieldListFilter),)
+    search_fields = ('audio_file__track__title', 'duplicate_of__track__title')
+    raw_id_fields = ('audio_file', 'duplicate_of')
+    readonly_fields = ('version', 'landmark_count', 'duration_ms', 'match_score')
+
 @admin.register(StreamingSession)
 class StreamingSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'track', 'started_at', 'last_position_ms', 'ended_at')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StreamingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "streaming"
+
+    def ready(self):
+        # Import signals so they are connected when the app is ready.
+        import streaming.signals
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+from decimal import Decimal
+
+from django.db.models import F
+
+from .models import MasterAsset
+
+logger = logging.getLogger(__name__)
+
+
+def new_digest():
+    return hashlib.sha256()
+
+
+def content_prefix(sha256, profile):
+    '''
+    Returns the storage prefix for transcodes of the master with this hash.
+    Keys depend only on the content, so duplicate uploads share one set of segments.
+    '''
+    return f'content/{sha256[:2]}/{sha256}/{profile}'
+
+
+def find_asset(sha256, profile, variants, packaging=MasterAsset.Packaging.TS):
+    '''
+    Returns the MasterAsset for this hash, pipeline and packaging if its
+    outputs include every bitrate in `variants`, counting the reuse. Returns
+    None on a miss.
+    '''
+    asset = MasterAsset.objects.filter(sha256=sha256, profile=profile, packaging=packaging).first()
+    if asset is None:
+        return None
+    if not set(variants) <= set(asset.variants):
+        logger.info(f'Master {sha256[:12]} was encoded at {asset.variants}, re-encoding at {list(variants)}')
+        return None
+    MasterAsset.objects.filter(pk=asset.pk).update(reuse_count=F('reuse_count') + 1)
+    return asset
+
+
+def record_asset(sha256, profile, size_bytes, storage_prefix, hls_master, variants, fields, qualities=None, dash_master='',
+                 packaging=MasterAsset.Packaging.TS):
+    '''
+    Indexes the outputs of a finished transcode so later uploads of the same
+    master can reuse them.
+    '''
+    # Values re-read from DecimalFields are not JSON serializable.
+    fields = {name: float(value) if isinstance(value, Decimal) else value for name, value in fields.items()}
+    asset, _ = MasterAsset.objects.update_or_create(
+        sha256=sha256,
+        profile=profile,
+        packaging=packaging,
+        defaults={
+            'size_bytes': size_bytes,
+            'storage_prefix': storage_prefix,
+            'hls_master': hls_master,
+            'dash_master': dash_master,
+            'variants': list(variants),
+            'qualities': qualities or [],
+            'fields': fields,
+        },
+    )
+    return asset
+
+
+def apply_asset(instance, asset):
+    '''
+    Copies the technical metadata recorded on `asset` onto a Track or
+    AudioFile. The caller sets the manifests and saves.
+    '''
+    for name, value in asset.fields.items():
+        if name == 'metadata':
+            instance.metadata.update(value)
+        else:
+            setattr(instance, name, value)
+    instance.metadata['content_sha256'] = asset.sha256
+    instance.metadata['reused_from_asset'] = str(asset.pk)
@@ -0,0 +1,118 @@
+import logging
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from artists.fingerprint import FINGERPRINT_SAMPLE_RATE, Fingerprinter
+from artists.waveform import decode_pcm
+from .models import AudioFingerprint, FingerprintLandmark
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_BATCH = 500
+INSERT_BATCH = 2000
+# Hashes shared by more stored landmarks than this say nothing about any one master.
+MAX_HASH_OCCURRENCES = 200
+
+
+def fingerprinting_enabled():
+    return getattr(settings, 'STREAMING_FINGERPRINT', True)
+
+
+def fingerprint_file(input_path):
+    'Decodes `input_path` straight to 8kHz mono and fingerprints it (used by the backfill).'
+    fingerprinter = Fingerprinter(FINGERPRINT_SAMPLE_RATE, channels=1)
+    for samples in decode_pcm(input_path, sample_rate=FINGERPRINT_SAMPLE_RATE, channels=1):
+        fingerprinter.feed(samples)
+    return fingerprinter.finish()
+
+
+def find_matches(landmarks, exclude=None):
+    '''
+    Returns the stored fingerprints sharing time-aligned landmarks with
+    `landmarks`, best first, as dicts with the audio file, the number of
+    aligned landmarks and the aligned share of the query (`score`).
+    Candidates come from the hash index only (never a scan of the catalog),
+    then each is scored by the largest group of hits agreeing on one time
+    offset: a shared hash here and there does not count, but a re-encode or
+    a trimmed copy does.
+    '''
+    if not landmarks:
+        return []
+    offsets_by_hash = defaultdict(list)
+    for hash_, offset in landmarks:
+        offsets_by_hash[hash_].append(offset)
+
+    alignments = Counter()
+    hashes = list(offsets_by_hash)
+    for start in range(0, len(hashes), LOOKUP_BATCH):
+        rows = FingerprintLandmark.objects.filter(hash__in=hashes[start:start + LOOKUP_BATCH])
+        if exclude is not None:
+            rows = rows.exclude(fingerprint__audio_file_id=exclude)
+        hits = defaultdict(list)
+        for fingerprint_id, hash_, offset in rows.values_list('fingerprint_id', 'hash', 'offset'):
+            hits[hash_].append((fingerprint_id, offset))
+        for hash_, stored in hits.items():
+            if len(stored) > MAX_HASH_OCCURRENCES:
+                continue
+            for fingerprint_id, offset in stored:
+                for query_offset in offsets_by_hash[hash_]:
+                    alignments[fingerprint_id, offset - query_offset] += 1
+
+    best = {}
+    for (fingerprint_id, _), aligned in alignments.items():
+        best[fingerprint_id] = max(best.get(fingerprint_id, 0), aligned)
+    min_matches = getattr(settings, 'STREAMING_FINGERPRINT_MIN_MATCHES', 20)
+    min_score = getattr(settings, 'STREAMING_FINGERPRINT_MIN_SCORE', 0.1)
+    candidates = [pk for pk, aligned in best.items() if aligned >= min_matches and aligned / len(landmarks) >= min_score]
+    matches = [
+        {
+            'fingerprint': fingerprint,
+            'audio_file': fingerprint.audio_file_id,
+            'aligned': best[fingerprint.pk],
+            'score': round(best[fingerprint.pk] / len(landmarks), 4),
+        }
+        for fingerprint in AudioFingerprint.objects.filter(pk__in=candidates).select_related('audio_file')
+    ]
+    return sorted(matches, key=lambda match: -match['aligned'])
+
+
+def store_fingerprint(audio_file, fingerprint):
+    '''
+    Replaces the stored fingerprint of `audio_file` and flags duplicates,
+    always pointing from the newer master to the older one: `audio_file` is
+    marked as a duplicate of its best older match, and newer unflagged
+    matches (fingerprinted first, e.g. during a backfill) are marked as
+    duplicates of `audio_file`. Returns the AudioFingerprint.
+    '''
+    matches = find_matches(fingerprint['landmarks'], exclude=audio_file.pk)
+    older = [match for match in matches if match['fingerprint'].audio_file.created_at < audio_file.created_at]
+    newer = [
+        match for match in matches
+        if match not in older and match['fingerprint'].duplicate_of_id is None
+    ]
+    duplicate_of, score = (older[0]['audio_file'], older[0]['score']) if older else (None, None)
+    with transaction.atomic():
+        AudioFingerprint.objects.filter(audio_file=audio_file).delete()
+        stored = AudioFingerprint.objects.create(
+            audio_file=audio_file,
+            version=fingerprint['version'],
+            duration_ms=fingerprint['duration_ms'],
+            landmark_count=len(fingerprint['landmarks']),
+            duplicate_of_id=duplicate_of,
+            match_score=score,
+        )
+        FingerprintLandmark.objects.bulk_create(
+            (FingerprintLandmark(fingerprint=stored, hash=hash_, offset=offset)
+             for hash_, offset in fingerprint['landmarks']),
+            batch_size=INSERT_BATCH,
+        )
+        for match in newer:
+            AudioFingerprint.objects.filter(pk=match['fingerprint'].pk).update(
+                duplicate_of=audio_file,
+                match_score=round(match['aligned'] / max(match['fingerprint'].landmark_count, 1), 4),
+            )
+    if duplicate_of:
+        logger.info(f'AudioFile {audio_file.pk} matches AudioFile {duplicate_of} ({score:.0%} of landmarks aligned).')
+    return stored
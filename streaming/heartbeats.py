@@ -0,0 +1,116 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, When
+
+from .models import StreamingSession
+
+logger = logging.getLogger(__name__)
+
+# One hash per live session ({'user', 'position'}) plus a set of sessions
+# whose position has changed since the last flush.
+SESSION_KEY = 'streaming:session:{session_id}'
+DIRTY_KEY = 'streaming:sessions:dirty'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def heartbeat_client():
+    '''
+    Returns the raw Redis client used to buffer heartbeats, or None when
+    buffering is disabled or the cache backend is not django-redis (tests,
+    local development), in which case heartbeats are saved directly.
+    '''
+    if not getattr(settings, 'STREAMING_HEARTBEAT_BUFFER', True):
+        return None
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client()
+
+
+def _ttl():
+    return getattr(settings, 'STREAMING_HEARTBEAT_TTL', 24 * 60 * 60)
+
+
+def track_session(client, session):
+    'Registers the owner of a session so heartbeats can be authorised from Redis.'
+    key = SESSION_KEY.format(session_id=session.pk)
+    client.hset(key, mapping={'user': str(session.user_id), 'position': session.last_position_ms})
+    client.expire(key, _ttl())
+
+
+def buffer_position(client, session_id, user_id, position_ms):
+    '''
+    Stores the latest position of a session in Redis. Returns False if the
+    session is not tracked or belongs to someone else, so the caller can
+    fall back to the database.
+    '''
+    key = SESSION_KEY.format(session_id=session_id)
+    if _decode(client.hget(key, 'user')) != str(user_id):
+        return False
+    pipe = client.pipeline(transaction=False)
+    pipe.hset(key, 'position', position_ms)
+    pipe.expire(key, _ttl())
+    pipe.sadd(DIRTY_KEY, str(session_id))
+    pipe.execute()
+    return True
+
+
+def buffered_position(client, session_id):
+    'Returns the buffered position of a session in ms, or None if nothing is buffered.'
+    if client is None:
+        return None
+    position = client.hget(SESSION_KEY.format(session_id=session_id), 'position')
+    return None if position is None else int(position)
+
+
+def forget_session(client, session_id):
+    'Drops an ended session from the buffer so a later flush cannot overwrite it.'
+    if client is None:
+        return
+    pipe = client.pipeline(transaction=False)
+    pipe.delete(SESSION_KEY.format(session_id=session_id))
+    pipe.srem(DIRTY_KEY, str(session_id))
+    pipe.execute()
+
+
+def flush_positions(client, batch_size=None):
+    '''
+    Writes buffered positions to the database with one UPDATE per batch of
+    sessions. Sessions are popped from the dirty set atomically, so
+    concurrent flushers never write the same batch, and a heartbeat arriving
+    mid-flush simply marks its session dirty again. Returns the number of
+    sessions updated.
+    '''
+    batch_size = batch_size or getattr(settings, 'STREAMING_HEARTBEAT_FLUSH_BATCH', 1000)
+    flushed = 0
+    while True:
+        session_ids = [_decode(value) for value in client.spop(DIRTY_KEY, batch_size) or []]
+        if not session_ids:
+            break
+
+        pipe = client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.hget(SESSION_KEY.format(session_id=session_id), 'position')
+        positions = {
+            session_id: int(position)
+            for session_id, position in zip(session_ids, pipe.execute())
+            if position is not None
+        }
+        if not positions:
+            continue
+
+        flushed += StreamingSession.objects.filter(pk__in=positions, ended_at__isnull=True).update(
+            last_position_ms=Case(
+                *[When(pk=session_id, then=position) for session_id, position in positions.items()],
+                output_field=IntegerField(),
+            )
+        )
+
+    if flushed:
+        logger.info(f'Flushed {flushed} buffered session positions.')
+    return flushed
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from artists.models import Track
+from streaming.models import AudioFile
+from streaming.tasks import fingerprint_audio_file
+
+
+class Command(BaseCommand):
+    help = (
+        'Fingerprints processed audio files that have no fingerprint yet, oldest first, '
+        'and flags the near-duplicates among them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows read per query. Defaults to 500.')
+        parser.add_argument('--limit', type=int, help='Stop after this many files.')
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Fingerprint in this process instead of queueing one task per file on the batch queue.',
+        )
+
+    def handle(self, *args, **options):
+        pending = (
+            AudioFile.objects.filter(status=Track.ProcessingStatus.COMPLETED, fingerprint__isnull=True)
+            .exclude(original_file='')
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)
+        )
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        count = duplicates = 0
+        # Rows are streamed in chunks so a large catalog is never loaded at once.
+        for audio_file_id in pending.iterator(chunk_size=options['batch_size']):
+            if options['sync']:
+                try:
+                    duplicates += fingerprint_audio_file.apply(args=[audio_file_id], throw=True).result is not None
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'AudioFile {audio_file_id}: {e}'))
+                    continue
+            else:
+                fingerprint_audio_file.delay(audio_file_id)
+            count += 1
+
+        if options['sync']:
+            self.stdout.write(self.style.SUCCESS(f'Fingerprinted {count} audio files, {duplicates} flagged as duplicates.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Queued {count} audio files for fingerprinting.'))
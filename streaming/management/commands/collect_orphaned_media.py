@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from streaming.media_gc import sweep_orphaned_media
+
+
+class Command(BaseCommand):
+    help = (
+        'Finds media objects that no Track, AudioFile, AudioQuality or MasterAsset refers to '
+        '(partial outputs of failed runs, abandoned direct uploads) and deletes those past the grace period.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report orphans without deleting anything.')
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 72),
+            help='Leave orphans younger than this alone. Defaults to MEDIA_GC_GRACE_HOURS.',
+        )
+        parser.add_argument('--page-size', type=int, default=1000, help='Objects listed per request. Defaults to 1000.')
+
+    def handle(self, *args, **options):
+        report = sweep_orphaned_media(
+            dry_run=options['dry_run'],
+            grace=timedelta(hours=options['grace_hours']),
+            page_size=options['page_size'],
+        )
+
+        self.stdout.write(f"{'prefix':<20} {'scanned':>9} {'orphaned':>9} {'in grace':>9} {'deleted':>9}")
+        for row in report:
+            self.stdout.write(
+                f"{row['prefix']:<20} {row['scanned']:>9} {row['orphaned']:>9} {row['recent']:>9} {row['deleted']:>9}"
+            )
+            for name in row['sample']:
+                self.stdout.write(f'  {name}')
+
+        orphaned = sum(row['orphaned'] for row in report)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {orphaned} orphaned objects would be deleted.'))
+        else:
+            deleted = sum(row['deleted'] for row in report)
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} of {orphaned} orphaned objects.'))
@@ -0,0 +1,163 @@
+import hashlib
+import posixpath
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserPreferences, UserSubscription
+from artists.packaging import parse_attributes
+from artists.storage import signed_url
+
+from .models import AudioFile, AudioQuality, PlaybackSettings
+
+TIER_KEY = 'streaming:quality-tier:{user_id}'
+MANIFEST_KEY = 'streaming:manifest:{slug}:{version}:{tier}'
+MASTER_TOKEN_SALT = 'streaming.master-playlist'
+
+
+def _ttl():
+    return getattr(settings, 'STREAMING_MANIFEST_CACHE_TTL', 300)
+
+
+def _load_tier(user):
+    '''
+    Works out which HLS variants a user gets: the bitrate cap from their
+    playback preference and subscription, and the variant they prefer to
+    start on (PlaybackSettings.default_quality).
+    '''
+    caps = getattr(settings, 'STREAMING_QUALITY_TIERS', {})
+    preference = (
+        UserPreferences.objects.filter(user=user).values_list('playback_quality', flat=True).first()
+        or UserPreferences.PlaybackQuality.NORMAL
+    )
+    limits = [caps.get(preference)]
+
+    subscribed = UserSubscription.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+        user=user,
+        status=UserSubscription.SubscriptionStatus.ACTIVE,
+    ).exists()
+    if not subscribed:
+        limits.append(getattr(settings, 'STREAMING_FREE_MAX_BITRATE', 0))
+
+    limits = [limit for limit in limits if limit]
+    preferred = PlaybackSettings.objects.filter(user=user).values_list('default_quality__bitrate_kbps', flat=True).first()
+    return {'max_bitrate': min(limits) if limits else None, 'preferred': preferred}
+
+
+def user_tier(user):
+    '''
+    Returns the cached quality tier of `user` as {'max_bitrate', 'preferred'}
+    (either may be None). Saving the preferences, playback settings or a
+    subscription drops the cached entry.
+    '''
+    key = TIER_KEY.format(user_id=user.pk)
+    tier = cache.get(key)
+    if tier is None:
+        tier = _load_tier(user)
+        cache.set(key, tier, timeout=_ttl())
+    return tier
+
+
+def forget_user_tier(user_id):
+    cache.delete(TIER_KEY.format(user_id=user_id))
+
+
+def _master_token_ttl():
+    return getattr(settings, 'STREAMING_MASTER_TOKEN_TTL', 60 * 60)
+
+
+def master_url(request, slug):
+    '''
+    Returns the absolute URL of a track's personal master playlist with a
+    short-lived `token` bound to the user and track, so native HLS players
+    that cannot send an Authorization header can open it.
+    '''
+    token = signing.dumps({'user': str(request.user.pk), 'slug': slug}, salt=MASTER_TOKEN_SALT, compress=True)
+    url = request.build_absolute_uri(reverse('track-master-playlist', kwargs={'slug': slug}))
+    return f'{url}?token={token}'
+
+
+def master_token_user(token, slug):
+    'Returns the user id a master playlist token was issued to, or None if it is invalid, expired or for another track.'
+    try:
+        data = signing.loads(token, salt=MASTER_TOKEN_SALT, max_age=_master_token_ttl())
+    except signing.BadSignature:
+        return None
+    return data['user'] if data.get('slug') == slug else None
+
+
+def allows(tier, bitrate):
+    return tier['max_bitrate'] is None or bitrate <= tier['max_bitrate']
+
+
+def _parse_master(text):
+    'Splits a master playlist into its header tags and (bitrate, tag, uri) variant entries.'
+    header, variants = [], []
+    lines = iter(line.strip() for line in text.splitlines())
+    for line in lines:
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            bandwidth = int(parse_attributes(line[len('#EXT-X-STREAM-INF:'):]).get('BANDWIDTH', 0))
+            variants.append((bandwidth // 1000, line, next(lines, '')))
+        elif line:
+            header.append(line)
+    return header, variants
+
+
+def render_master(text, tier, variant_url):
+    '''
+    Rewrites a master playlist for one quality tier: variants above the cap
+    are dropped (the lowest one is always kept), the preferred bitrate is
+    listed first so players start on it, and variant URIs are made absolute
+    with `variant_url(uri)`.
+    '''
+    header, variants = _parse_master(text)
+    variants.sort(key=lambda variant: variant[0])
+    allowed = [variant for variant in variants if allows(tier, variant[0])] or variants[:1]
+
+    preferred = tier['preferred']
+    if preferred is not None and allowed:
+        fitting = [variant for variant in allowed if variant[0] <= preferred] or allowed[:1]
+        first = fitting[-1]
+        allowed = [first] + [variant for variant in allowed if variant is not first]
+
+    lines = header or ['#EXTM3U']
+    for _, tag, uri in allowed:
+        lines.extend([tag, variant_url(uri)])
+    return '\n'.join(lines) + '\n'
+
+
+def _tier_name(tier):
+    return f"{tier['max_bitrate'] or 'all'}-{tier['preferred'] or 'auto'}"
+
+
+def _version(resolution):
+    # The resolution is invalidated whenever variants change, so its content versions the rendering.
+    bitrates = sorted(
+        quality['bitrate_kbps'] for quality in resolution['qualities']
+        if quality['format'] == AudioQuality.AudioFormat.HLS
+    )
+    return hashlib.sha1(f"{resolution['hls_master']}:{bitrates}".encode()).hexdigest()[:12]
+
+
+def personal_master(slug, resolution, tier):
+    '''
+    Returns the master playlist of a resolved track rendered for `tier`,
+    cached per (track, tier) so a play start reads storage only on a miss.
+    '''
+    key = MANIFEST_KEY.format(slug=slug, version=_version(resolution), tier=_tier_name(tier))
+    manifest = cache.get(key)
+    if manifest is None:
+        storage = AudioFile._meta.get_field('hls_master').storage
+        base = posixpath.dirname(resolution['hls_master'])
+        with storage.open(resolution['hls_master'], 'rb') as f:
+            text = f.read().decode('utf-8')
+        manifest = render_master(
+            text, tier, lambda uri: uri if '://' in uri else signed_url(posixpath.join(base, uri), storage)
+        )
+        cache.set(key, manifest, timeout=_ttl())
+    return manifest
@@ -0,0 +1,102 @@
+import logging
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from artists.models import Track
+from artists.storage import delete_objects, list_objects
+from .assets import content_prefix
+from .models import AudioFile, AudioQuality, MasterAsset
+
+logger = logging.getLogger(__name__)
+
+READ_BATCH = 2000
+
+
+def gc_prefixes():
+    return getattr(settings, 'MEDIA_GC_PREFIXES', ['content/', 'tracks/', 'uploads/original/'])
+
+
+def _values(queryset, *fields):
+    # Streamed in chunks, so the reference tables are never loaded whole.
+    for row in queryset.values_list(*fields).iterator(chunk_size=READ_BATCH):
+        yield from (value for value in row if value)
+
+
+def referenced_media():
+    '''
+    Returns (keys, prefixes): the storage names the database points at, and
+    the prefixes whose whole contents are live. Manifests only name their
+    playlists and segments relative to themselves, so a referenced manifest
+    or variant keeps its directory alive, as does every MasterAsset and the
+    content prefix of any pipeline that has not finished (a retry resumes
+    its uploads there).
+    '''
+    keys = set(_values(Track.objects.all(), 'audio_original', 'audio_preview'))
+    keys.update(_values(AudioFile.objects.all(), 'original_file'))
+
+    prefixes = set(_values(MasterAsset.objects.all(), 'storage_prefix'))
+    for name in _values(Track.objects.all(), 'audio_hls_master'):
+        prefixes.add(posixpath.dirname(name))
+    for name in _values(AudioFile.objects.all(), 'hls_master', 'dash_master'):
+        prefixes.add(posixpath.dirname(name))
+    for name in _values(AudioQuality.objects.all(), 'file'):
+        prefixes.add(posixpath.dirname(name))
+
+    unfinished = (
+        (Track.objects.exclude(status=Track.ProcessingStatus.COMPLETED), 'metadata__pipeline__data__content_sha256',
+         MasterAsset.Profile.CATALOG),
+        (AudioFile.objects.exclude(status=Track.ProcessingStatus.COMPLETED), 'pipeline_state__data__content_sha256',
+         MasterAsset.Profile.STREAMING),
+    )
+    for queryset, field, profile in unfinished:
+        for sha256 in _values(queryset, field):
+            prefixes.add(content_prefix(sha256, profile))
+    prefixes.discard('')
+    return keys, prefixes
+
+
+def _is_live(name, keys, prefixes):
+    if name in keys:
+        return True
+    parts = name.split('/')
+    return any('/'.join(parts[:depth]) in prefixes for depth in range(1, len(parts)))
+
+
+def sweep_orphaned_media(dry_run=True, grace=None, storage=None, page_size=1000, now=None):
+    '''
+    Lists each GC prefix of the media storage a page at a time and deletes,
+    in bulk, the objects nothing in the database refers to that are older
+    than `grace` (MEDIA_GC_GRACE_HOURS by default), which covers uploads and
+    pipeline runs still in flight. With `dry_run` nothing is deleted.
+    Returns a report per prefix: objects scanned, orphans found, orphans
+    still within the grace period, orphans deleted and a sample of their keys.
+    '''
+    storage = storage or default_storage
+    grace = grace if grace is not None else timedelta(hours=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 72))
+    cutoff = (now or timezone.now()) - grace
+    keys, prefixes = referenced_media()
+
+    report = []
+    for prefix in gc_prefixes():
+        row = {'prefix': prefix, 'scanned': 0, 'orphaned': 0, 'recent': 0, 'deleted': 0, 'sample': []}
+        for page in list_objects(prefix, storage, page_size=page_size):
+            row['scanned'] += len(page)
+            listed = dict(page)
+            # Exact references first (one set difference per page), then the live prefixes.
+            unreferenced = [name for name in set(listed) - keys if not _is_live(name, keys, prefixes)]
+            orphans = sorted(name for name in unreferenced if listed[name] < cutoff)
+            row['recent'] += len(unreferenced) - len(orphans)
+            row['orphaned'] += len(orphans)
+            row['sample'].extend(orphans[:max(0, 20 - len(row['sample']))])
+            if orphans and not dry_run:
+                row['deleted'] += delete_objects(orphans, storage)
+        logger.info(
+            f"Media GC {prefix}: {row['scanned']} scanned, {row['orphaned']} orphaned, "
+            f"{row['recent']} within the grace period, {row['deleted']} deleted"
+        )
+        report.append(row)
+    return report
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:52
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0002_audiofile_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterAsset',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('profile', models.CharField(choices=[('catalog', 'Catalog'), ('streaming', 'Streaming')], max_length=20)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('storage_prefix', models.CharField(max_length=255)),
+                ('hls_master', models.CharField(max_length=1024)),
+                ('dash_master', models.CharField(blank=True, max_length=1024)),
+                ('variants', models.JSONField(default=list, help_text='Bitrates (kbps) the outputs were encoded at')),
+                ('qualities', models.JSONField(default=list, help_text='AudioQuality rows to recreate for duplicates')),
+                ('fields', models.JSONField(default=dict, help_text='Technical metadata copied onto duplicates')),
+                ('reuse_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Master Asset',
+                'verbose_name_plural': 'Master Assets',
+                'constraints': [models.UniqueConstraint(fields=('sha256', 'profile'), name='unique_master_asset_per_profile')],
+            },
+        ),
+    ]
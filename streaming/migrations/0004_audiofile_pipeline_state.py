@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0003_masterasset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiofile',
+            name='pipeline_state',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-stage processing checkpoints'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0004_audiofile_pipeline_state'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='masterasset',
+            name='unique_master_asset_per_profile',
+        ),
+        migrations.AddField(
+            model_name='masterasset',
+            name='packaging',
+            field=models.CharField(choices=[('ts', 'HLS (MPEG-TS)'), ('cmaf', 'CMAF (HLS + DASH)'), ('cmaf-single', 'CMAF, single file per variant')], default='ts', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='masterasset',
+            constraint=models.UniqueConstraint(fields=('sha256', 'profile', 'packaging'), name='unique_master_asset_per_profile_packaging'),
+        ),
+    ]
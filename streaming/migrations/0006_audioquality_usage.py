@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0005_masterasset_packaging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioquality',
+            name='last_requested_at',
+            field=models.DateTimeField(blank=True, help_text='Last playback request, for evicting cold variants', null=True),
+        ),
+        migrations.AddField(
+            model_name='audioquality',
+            name='request_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:36
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0006_audioquality_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioFingerprint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('version', models.PositiveSmallIntegerField(default=1)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('landmark_count', models.PositiveIntegerField(default=0)),
+                ('match_score', models.FloatField(blank=True, help_text='Share of landmarks aligned with duplicate_of', null=True)),
+                ('audio_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint', to='streaming.audiofile')),
+                ('duplicate_of', models.ForeignKey(blank=True, help_text='Best matching earlier master, when the match clears the thresholds', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='streaming.audiofile')),
+            ],
+            options={
+                'verbose_name': 'Audio Fingerprint',
+                'verbose_name_plural': 'Audio Fingerprints',
+            },
+        ),
+        migrations.CreateModel(
+            name='FingerprintLandmark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.IntegerField(db_index=True)),
+                ('offset', models.PositiveIntegerField(help_text='Frame of the anchor peak (128ms each)')),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='landmarks', to='streaming.audiofingerprint')),
+            ],
+        ),
+    ]
@@ -28,6 +28,7 @@ class AudioFile(BaseModel):
     channels = models.PositiveSmallIntegerField(null=True, blank=True)
     loudness_lufs = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     metadata = models.JSONField(default=dict, help_text='duration, codec, format, key, bpm')
+    pipeline_state = models.JSONField(default=dict, blank=True, help_text='Per-stage processing checkpoints')
 
     class Meta:
         verbose_name = 'Audio File'
@@ -56,6 +57,8 @@ class AudioQuality(BaseModel):
     resolution_label = models.CharField(max_length=20, help_text='e.g., 64kbps, 128kbps')
     file = models.FileField(upload_to='tracks/transcoded/')
     format = models.CharField(max_length=10, choices=AudioFormat.choices)
+    last_requested_at = models.DateTimeField(null=True, blank=True, help_text='Last playback request, for evicting cold variants')
+    request_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         verbose_name = 'Audio Quality'
@@ -72,6 +75,84 @@ class AudioQuality(BaseModel):
         return f'{self.audio_file.track.title} ({self.resolution_label})'
 
 
+class MasterAsset(BaseModel):
+    'Content-addressed transcode output, shared by every master with the same SHA-256.'
+    class Profile(models.TextChoices):
+        CATALOG = 'catalog', 'Catalog'  # artists.tasks.process_audio_upload
+        STREAMING = 'streaming', 'Streaming'  # streaming.tasks.process_audio_file
+
+    class Packaging(models.TextChoices):
+        TS = 'ts', 'HLS (MPEG-TS)'
+        CMAF = 'cmaf', 'CMAF (HLS + DASH)'
+        CMAF_SINGLE_FILE = 'cmaf-single', 'CMAF, single file per variant'
+
+    sha256 = models.CharField(max_length=64)
+    profile = models.CharField(max_length=20, choices=Profile.choices)
+    packaging = models.CharField(max_length=20, choices=Packaging.choices, default=Packaging.TS)
+    size_bytes = models.BigIntegerField(default=0)
+    storage_prefix = models.CharField(max_length=255)
+    hls_master = models.CharField(max_length=1024)
+    dash_master = models.CharField(max_length=1024, blank=True)
+    variants = models.JSONField(default=list, help_text='Bitrates (kbps) the outputs were encoded at')
+    qualities = models.JSONField(default=list, help_text='AudioQuality rows to recreate for duplicates')
+    fields = models.JSONField(default=dict, help_text='Technical metadata copied onto duplicates')
+    reuse_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Master Asset'
+        verbose_name_plural = 'Master Assets'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sha256', 'profile', 'packaging'], name='unique_master_asset_per_profile_packaging'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.sha256[:12]} ({self.profile}, {self.packaging})'
+
+
+class AudioFingerprint(BaseModel):
+    'Spectral-peak landmark fingerprint of a master, used to find duplicate and near-duplicate uploads.'
+    audio_file = models.OneToOneField(
+        AudioFile,
+        on_delete=models.CASCADE,
+        related_name='fingerprint'
+    )
+    version = models.PositiveSmallIntegerField(default=1)
+    duration_ms = models.PositiveIntegerField(default=0)
+    landmark_count = models.PositiveIntegerField(default=0)
+    duplicate_of = models.ForeignKey(
+        AudioFile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='near_duplicates',
+        help_text='Best matching earlier master, when the match clears the thresholds'
+    )
+    match_score = models.FloatField(null=True, blank=True, help_text='Share of landmarks aligned with duplicate_of')
+
+    class Meta:
+        verbose_name = 'Audio Fingerprint'
+        verbose_name_plural = 'Audio Fingerprints'
+
+    def __str__(self):
+        return f'Fingerprint of {self.audio_file_id} ({self.landmark_count} landmarks)'
+
+
+class FingerprintLandmark(models.Model):
+    'One hashed peak pair of a fingerprint; the hash index keeps candidate lookup sub-linear.'
+    fingerprint = models.ForeignKey(
+        AudioFingerprint,
+        on_delete=models.CASCADE,
+        related_name='landmarks'
+    )
+    hash = models.IntegerField(db_index=True)
+    offset = models.PositiveIntegerField(help_text='Frame of the anchor peak (128ms each)')
+
+    def __str__(self):
+        return f'{self.hash:06x}@{self.offset}'
+
+
 class StreamingSession(BaseModel):
     'Tracks a user\'s listening session for a particular track.'
     user = models.ForeignKey(
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Q, Subquery
+
+from artists.models import Track
+from artists.storage import signed_url
+from playlists.models import Playlist, PlaylistTrack
+
+from .manifests import allows, master_url, personal_master, user_tier
+from .models import AudioQuality
+from .resolution import resolve_streams
+
+
+def prefetch_count():
+    'Returns how many upcoming tracks are bundled with a play start.'
+    return getattr(settings, 'STREAMING_PREFETCH_TRACKS', 3)
+
+
+def upcoming_slugs(user, track, queue=None, playlist=None, limit=None):
+    '''
+    Returns the slugs of the next `limit` tracks after `track`: the head of
+    an explicit `queue` (track ids, in play order), or the tracks positioned
+    after it in a `playlist` the user can see. One query either way.
+    '''
+    limit = prefetch_count() if limit is None else limit
+    if limit <= 0:
+        return []
+
+    if queue:
+        ids = queue[:limit]
+        slugs = dict(Track.objects.filter(pk__in=ids).values_list('pk', 'slug'))
+        return [slugs[pk] for pk in ids if pk in slugs]
+
+    if playlist:
+        visible = Playlist.objects.filter(
+            Q(is_public=True) | Q(owner=user) | Q(collaborators__user=user), slug=playlist
+        ).values('pk')
+        entries = PlaylistTrack.objects.filter(playlist__in=visible)
+        current = entries.filter(track=track).order_by('position').values('position')[:1]
+        return list(
+            entries.filter(position__gt=Subquery(current))
+            .order_by('position')
+            .values_list('track__slug', flat=True)[:limit]
+        )
+
+    return []
+
+
+def prefetch_bundle(request, slugs):
+    '''
+    Returns what a player needs to start each of `slugs` without another
+    request: the master playlist rendered for the user's tier and the
+    qualities they may play, with signed URLs. Resolutions are read in one
+    batch and manifests come from the per-tier cache; tracks that are
+    missing or not streamable yet are left out.
+    '''
+    if not slugs:
+        return []
+
+    tier = user_tier(request.user)
+    resolutions = resolve_streams(slugs)
+    storage = AudioQuality._meta.get_field('file').storage
+
+    bundle = []
+    for slug in slugs:
+        resolution = resolutions.get(slug)
+        if resolution is None or resolution['status'] != Track.ProcessingStatus.COMPLETED:
+            continue
+        has_master = bool(resolution['hls_master'])
+        bundle.append({
+            'track': resolution['track_id'],
+            'slug': slug,
+            'master_url': master_url(request, slug) if has_master else None,
+            'manifest': personal_master(slug, resolution, tier) if has_master else None,
+            'qualities': [
+                {
+                    'id': quality['id'],
+                    'resolution_label': quality['resolution_label'],
+                    'bitrate_kbps': quality['bitrate_kbps'],
+                    'format': quality['format'],
+                    'file': request.build_absolute_uri(signed_url(quality['file'], storage)) if quality['file'] else None,
+                }
+                for quality in resolution['qualities']
+                if allows(tier, quality['bitrate_kbps'])
+            ],
+        })
+    return bundle
@@ -0,0 +1,72 @@
+import posixpath
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect
+
+from artists.storage import object_key, presigned_url
+
+from .models import AudioQuality
+
+# Single-file renditions a client can play with a plain (ranged) GET.
+PROGRESSIVE_FORMATS = {
+    AudioQuality.AudioFormat.AAC: 'audio/mp4',
+    AudioQuality.AudioFormat.MP3: 'audio/mpeg',
+    AudioQuality.AudioFormat.FLAC: 'audio/flac',
+}
+
+PROGRESSIVE_FILENAME = 'progressive_{bitrate}k.m4a'
+
+
+def progressive_bitrate():
+    'Returns the bitrate of the AAC rendition encoded at ingest, or 0 when none is.'
+    return getattr(settings, 'STREAMING_PROGRESSIVE_BITRATE', 0)
+
+
+def pick_rendition(qualities, bitrate=None):
+    '''
+    Returns the progressive rendition to serve from resolved `qualities`: the
+    best one not above `bitrate` (the lowest if all are), or the best overall.
+    '''
+    renditions = sorted(
+        (quality for quality in qualities if quality['format'] in PROGRESSIVE_FORMATS),
+        key=lambda quality: quality['bitrate_kbps'],
+    )
+    if not renditions:
+        return None
+    if bitrate is None:
+        return renditions[-1]
+    fitting = [quality for quality in renditions if quality['bitrate_kbps'] <= bitrate]
+    return fitting[-1] if fitting else renditions[0]
+
+
+def _internal_location(name, storage):
+    '''
+    Maps a stored object onto the internal nginx location that serves it:
+    files on local storage are read from disk, S3 objects are proxied from a
+    presigned URL (the signature travels in the query string).
+    '''
+    prefix = getattr(settings, 'STREAMING_ACCEL_REDIRECT_PREFIX', '/_protected/')
+    bucket_name = getattr(storage, 'bucket_name', None)
+    if bucket_name:
+        url = urlsplit(presigned_url(object_key(name, storage), bucket_name=bucket_name))
+        return f"{prefix}s3{url.path}?{url.query}"
+    return f'{prefix}media/{quote(name)}'
+
+
+def progressive_response(quality, storage):
+    '''
+    Answers a progressive download of an authorised rendition without the
+    worker handling any bytes. Behind nginx (STREAMING_ACCEL_REDIRECT) the
+    transfer, Range requests and sendfile are handed over with
+    X-Accel-Redirect; otherwise the client is redirected to the storage URL.
+    '''
+    name = quality['file']
+    if not getattr(settings, 'STREAMING_ACCEL_REDIRECT', False):
+        return HttpResponseRedirect(storage.url(name))
+
+    response = HttpResponse(content_type=PROGRESSIVE_FORMATS[quality['format']])
+    response['X-Accel-Redirect'] = _internal_location(name, storage)
+    response['Content-Disposition'] = f'inline; filename="{posixpath.basename(name)}"'
+    response['Cache-Control'] = 'private, no-transform'
+    return response
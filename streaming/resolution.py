@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from artists.models import Track
+
+RESOLUTION_KEY = 'streaming:resolve:{slug}'
+
+
+def _ttl():
+    return getattr(settings, 'STREAMING_RESOLUTION_CACHE_TTL', 60 * 60)
+
+
+def _build(rows):
+    first = rows[0]
+    return {
+        'track_id': str(first['id']),
+        'track_status': first['status'],
+        'track_hls_master': first['audio_hls_master'] or '',
+        'audio_file_id': str(first['audio_file_data__id']) if first['audio_file_data__id'] else None,
+        'status': first['audio_file_data__status'],
+        'hls_master': first['audio_file_data__hls_master'] or '',
+        'dash_master': first['audio_file_data__dash_master'] or '',
+        'qualities': [
+            {
+                'id': str(row['audio_file_data__qualities__id']),
+                'bitrate_kbps': row['audio_file_data__qualities__bitrate_kbps'],
+                'format': row['audio_file_data__qualities__format'],
+                'resolution_label': row['audio_file_data__qualities__resolution_label'],
+                'file': row['audio_file_data__qualities__file'],
+            }
+            for row in rows
+            if row['audio_file_data__qualities__id'] is not None
+        ],
+    }
+
+
+def _load(slugs):
+    '''
+    Reads everything a play start needs for the given tracks in a single
+    query: each track, its AudioFile and qualities joined in, one row per
+    quality. Returns {slug: resolution} for the slugs that exist.
+    '''
+    rows = Track.objects.filter(slug__in=slugs).values(
+        'slug',
+        'id',
+        'status',
+        'audio_hls_master',
+        'audio_file_data__id',
+        'audio_file_data__status',
+        'audio_file_data__hls_master',
+        'audio_file_data__dash_master',
+        'audio_file_data__qualities__id',
+        'audio_file_data__qualities__bitrate_kbps',
+        'audio_file_data__qualities__format',
+        'audio_file_data__qualities__resolution_label',
+        'audio_file_data__qualities__file',
+    ).order_by('slug', '-audio_file_data__qualities__bitrate_kbps')
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['slug'], []).append(row)
+    return {slug: _build(track_rows) for slug, track_rows in grouped.items()}
+
+
+def resolve_streams(slugs):
+    '''
+    Batched resolve_stream: returns {slug: resolution} for the slugs that
+    exist, reading the cache in one round trip and loading every miss with
+    one joined query.
+    '''
+    keys = {RESOLUTION_KEY.format(slug=slug): slug for slug in slugs}
+    resolutions = {keys[key]: resolution for key, resolution in cache.get_many(keys).items()}
+
+    missing = [slug for slug in keys.values() if slug not in resolutions]
+    if missing:
+        loaded = _load(missing)
+        cache.set_many({RESOLUTION_KEY.format(slug=slug): resolution for slug, resolution in loaded.items()}, timeout=_ttl())
+        resolutions.update(loaded)
+    return resolutions
+
+
+def resolve_stream(slug):
+    '''
+    Returns the cached stream resolution for a track slug (manifest keys,
+    statuses and available qualities), or None if no such track exists.
+    Filled by one joined query on a miss; the processing tasks invalidate it.
+    '''
+    return resolve_streams([slug]).get(slug)
+
+
+def invalidate_stream(slug):
+    cache.delete(RESOLUTION_KEY.format(slug=slug))
@@ -98,6 +98,10 @@ class StreamingSessionCreateSerializer(serializers.ModelSerializer):
         )
     )
 
+    # Optional play context: the upcoming track ids, or the playlist being played.
+    queue = serializers.ListField(child=serializers.UUIDField(), required=False, write_only=True, max_length=100)
+    playlist = serializers.SlugField(required=False, write_only=True)
+
     class Meta:
         model = StreamingSession
-        fields = ['track', 'device_info']
+        fields = ['track', 'device_info', 'queue', 'playlist']
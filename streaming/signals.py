@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from accounts.models import UserPreferences, UserSubscription
+from artists.models import Track
+
+from .manifests import forget_user_tier
+from .models import AudioFile, PlaybackSettings
+from .resolution import invalidate_stream
+
+
+@receiver(post_save, sender=UserPreferences)
+@receiver(post_delete, sender=UserPreferences)
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+@receiver(post_save, sender=PlaybackSettings)
+@receiver(post_delete, sender=PlaybackSettings)
+def refresh_quality_tier(sender, instance, **kwargs):
+    '''
+    Drops the cached quality tier when anything it is derived from changes,
+    so the next manifest is rendered with the new preference or plan.
+    '''
+    forget_user_tier(instance.user_id)
+
+
+@receiver(post_init, sender=Track, dispatch_uid='remember_track_slug')
+def remember_track_slug(sender, instance, **kwargs):
+    # The slug the row was loaded with, so a rename can clear the old entry.
+    instance._loaded_slug = instance.__dict__.get('slug')
+
+
+@receiver(post_save, sender=Track, dispatch_uid='track_saved_stream_resolution')
+@receiver(post_delete, sender=Track, dispatch_uid='track_deleted_stream_resolution')
+def refresh_track_resolution(sender, instance, **kwargs):
+    '''
+    Drops the cached stream resolution once a track is saved or deleted, so
+    admin or API edits to its status or slug take effect at once. A renamed
+    track's old slug is cleared as well.
+    '''
+    slugs = {instance.slug, getattr(instance, '_loaded_slug', None)} - {None}
+    instance._loaded_slug = instance.slug
+
+    def invalidate():
+        for slug in slugs:
+            invalidate_stream(slug)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=AudioFile, dispatch_uid='audio_file_saved_stream_resolution')
+@receiver(post_delete, sender=AudioFile, dispatch_uid='audio_file_deleted_stream_resolution')
+def refresh_audio_file_resolution(sender, instance, **kwargs):
+    slug = Track.objects.filter(pk=instance.track_id).values_list('slug', flat=True).first()
+    if slug:
+        transaction.on_commit(lambda: invalidate_stream(slug))
@@ -1,16 +1,41 @@
 import subprocess
 import json
 import logging
+import posixpath
 import tempfile
+import time
+from datetime import timedelta
 from pathlib import Path
 
 from celery import shared_task
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
-from .models import AudioFile, AudioQuality
+from .assets import apply_asset, content_prefix, find_asset, new_digest, record_asset
+from .fingerprints import fingerprint_file, fingerprinting_enabled, store_fingerprint
+from .heartbeats import flush_positions, heartbeat_client
+from .media_gc import sweep_orphaned_media
+from .progressive import PROGRESSIVE_FILENAME, progressive_bitrate
+from .resolution import invalidate_stream
+from .models import AudioFile, AudioQuality, MasterAsset
+from .variants import (
+    VARIANT_PLAYLIST,
+    baseline_bitrate,
+    flush_requests,
+    ingest_bitrates,
+    lazy_variants_enabled,
+    publish_manifests,
+    release_variant,
+    variant_objects,
+)
 from artists.models import Track
+from artists.storage import fetch_source, upload_directory
+from artists.analysis import analyze_audio
+from artists.packaging import write_dash_manifest
+from artists.pipeline import Checkpoint
+from artists.transcoding import run_variant_jobs, write_master_playlist
 
 logger = logging.getLogger(__name__)
 
@@ -32,9 +57,93 @@ def _run_command(command):
         logger.error(f"Stderr: {e.stderr}")
         raise e
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def process_audio_file(self, audio_file_id):
-    'Celery task to process, transcode, and extract metadata from an audio file.'
+def _save_qualities(audio_file, qualities):
+    'Creates or updates the AudioQuality rows described by `qualities`.'
+    for quality in qualities:
+        AudioQuality.objects.update_or_create(
+            audio_file=audio_file,
+            bitrate_kbps=quality['bitrate_kbps'],
+            format=quality['format'],
+            defaults={
+                'resolution_label': quality['resolution_label'],
+                'file': quality['file'],
+            },
+        )
+
+def _packaging():
+    'Returns the MasterAsset.Packaging value selected by the streaming settings.'
+    if getattr(settings, 'STREAMING_PACKAGING', 'ts') != 'cmaf':
+        return MasterAsset.Packaging.TS
+    if getattr(settings, 'STREAMING_CMAF_SINGLE_FILE', False):
+        return MasterAsset.Packaging.CMAF_SINGLE_FILE
+    return MasterAsset.Packaging.CMAF
+
+def _segment_options(output_dir, bitrate, packaging):
+    'Returns the ffmpeg HLS muxer options that lay out the segments of one variant.'
+    if packaging == MasterAsset.Packaging.TS:
+        return ['-hls_segment_filename', str(output_dir / f'segment_{bitrate}k_%03d.ts')]
+    options = ['-hls_segment_type', 'fmp4']
+    if packaging == MasterAsset.Packaging.CMAF_SINGLE_FILE:
+        # One file per variant; the playlist addresses the init section and fragments by byte range.
+        return options + ['-hls_flags', 'single_file', '-hls_segment_filename', str(output_dir / f'segment_{bitrate}k.mp4')]
+    return options + [
+        '-hls_fmp4_init_filename', f'init_{bitrate}k.mp4',
+        '-hls_segment_filename', str(output_dir / f'segment_{bitrate}k_%03d.m4s'),
+    ]
+
+def _encode_variant(pcm_path, output_dir, analysis, bitrate, gain_db, packaging=MasterAsset.Packaging.TS):
+    '''
+    Encodes one HLS variant and returns its timing report. Reads the decoded
+    PCM described by `analysis`, or any file ffmpeg can probe when it is None.
+    '''
+    started = time.monotonic()
+    command = ['ffmpeg', '-y']
+    if analysis:
+        command.extend(['-f', 'f32le', '-ar', str(analysis['sample_rate']), '-ac', str(analysis['channels'])])
+    command.extend([
+        '-i', str(pcm_path),
+        '-map', '0:a:0', '-c:a', 'aac', '-b:a', f'{bitrate}k', '-ac', '2', '-ar', '48000',
+    ])
+    if gain_db:
+        command.extend(['-af', f'volume={gain_db}dB'])
+    command.extend([
+        '-f', 'hls',
+        '-hls_time', '4',
+        '-hls_playlist_type', 'vod',
+        *_segment_options(output_dir, bitrate, packaging),
+        str(output_dir / f'playlist_{bitrate}k.m3u8'),
+    ])
+    _run_command(command)
+    return {'bitrate': bitrate, 'seconds': round(time.monotonic() - started, 3)}
+
+def _encode_progressive(pcm_path, output_dir, analysis, bitrate, gain_db):
+    'Encodes the single-file AAC rendition served by the progressive endpoint.'
+    command = [
+        'ffmpeg', '-y',
+        '-f', 'f32le', '-ar', str(analysis['sample_rate']), '-ac', str(analysis['channels']),
+        '-i', str(pcm_path),
+        '-c:a', 'aac', '-b:a', f'{bitrate}k', '-ac', '2', '-ar', '48000',
+    ]
+    if gain_db:
+        command.extend(['-af', f'volume={gain_db}dB'])
+    # The moov atom goes first so playback and seeking can start before the download ends.
+    command.extend(['-movflags', '+faststart', str(output_dir / PROGRESSIVE_FILENAME.format(bitrate=bitrate))])
+    _run_command(command)
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, queue='media')
+def process_audio_file(self, audio_file_id, allow_duplicate=False):
+    '''
+    Celery task to process, transcode, and extract metadata from an audio file.
+    Runs as stages (fetch, probe, analyze, encode per variant, upload,
+    finalize) checkpointed in AudioFile.pipeline_state, so a retry resumes
+    after the last finished stage. With CMAF packaging the fMP4 segments are
+    encoded once and addressed by both the HLS and the DASH manifest.
+
+    The analyze stage also fingerprints the master. A near-duplicate of an
+    earlier master is flagged, and with STREAMING_FINGERPRINT_HOLD_DUPLICATES
+    it is held before anything is encoded, until it is re-queued with
+    `allow_duplicate`.
+    '''
     try:
         audio_file = AudioFile.objects.select_related('track').get(pk=audio_file_id)
     except AudioFile.DoesNotExist:
@@ -46,19 +155,56 @@ def process_audio_file(self, audio_file_id):
         return
 
     audio_file.status = Track.ProcessingStatus.PROCESSING
+    checkpoint = Checkpoint(audio_file.pipeline_state, audio_file.save, f'audiofile-{audio_file.pk}')
     audio_file.save()
 
-    try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_dir_path = Path(temp_dir)
+    data = checkpoint.data
+    if allow_duplicate:
+        data['allow_duplicate'] = True
+    packaging = data.setdefault('packaging', _packaging())
+    cmaf = packaging != MasterAsset.Packaging.TS
+    work_dir = Path(checkpoint.work_dir)
+    pcm_path = work_dir / 'decoded.pcm'
+    output_name = 'cmaf' if cmaf else 'hls'
+    output_dir = work_dir / output_name
+    # In lazy mode only the baseline is encoded here; encode_variant adds the rest on demand.
+    hls_bitrates = ingest_bitrates()
+    progressive = data.setdefault('progressive_bitrate', progressive_bitrate())
 
-            # 1. Get the original file from storage
+    try:
+        # 1. Get the original file from storage, hashing it on the way in
+        if not checkpoint.done('fetch'):
             original_file_name = Path(audio_file.original_file.name).name
-            input_path = temp_dir_path / original_file_name
-            with open(input_path, 'wb') as f:
-                f.write(audio_file.original_file.read())
+            digest = new_digest()
+            data['source_path'] = str(fetch_source(
+                audio_file.original_file.name,
+                work_dir / original_file_name,
+                audio_file.original_file.storage,
+                digest=digest,
+            ))
+            data['content_sha256'] = digest.hexdigest()
+
+            asset = find_asset(data['content_sha256'], MasterAsset.Profile.STREAMING, hls_bitrates, packaging)
+            if asset is not None:
+                # Identical master already transcoded: share its outputs and qualities.
+                with transaction.atomic():
+                    apply_asset(audio_file, asset)
+                    audio_file.hls_master.name = asset.hls_master
+                    audio_file.dash_master.name = asset.dash_master or None
+                    audio_file.status = Track.ProcessingStatus.COMPLETED
+                    checkpoint.complete('finalize')
+                    _save_qualities(audio_file, asset.qualities)
+                checkpoint.cleanup()
+                invalidate_stream(audio_file.track.slug)
+                logger.info(f"AudioFile {audio_file_id} reuses transcodes of master {data['content_sha256'][:12]}.")
+                return
+            checkpoint.complete('fetch')
 
-            # 2. Run ffprobe to get metadata
+        input_path = Path(data['source_path'])
+        content_sha256 = data['content_sha256']
+
+        # 2. Run ffprobe to get metadata
+        if not checkpoint.done('probe'):
             probe_command = [
                 'ffprobe', '-v', 'quiet', '-print_format', 'json',
                 '-show_format', '-show_streams', str(input_path)
@@ -70,82 +216,308 @@ def process_audio_file(self, audio_file_id):
             if not audio_stream:
                 raise ValueError('No audio stream found in the file.')
 
-            # 3. Update database with metadata
-            with transaction.atomic():
-                audio_file.duration_ms = int(float(metadata['format']['duration']) * 1000)
-                audio_file.bitrate_kbps = int(int(audio_stream.get('bit_rate', 0)) / 1000)
-                audio_file.sample_rate = int(audio_stream.get('sample_rate', 0))
-                audio_file.channels = audio_stream.get('channels', 0)
-                audio_file.metadata = metadata # Save all raw metadata
-                audio_file.save()
-
-            # 4. Run ffmpeg to transcode to HLS
-            output_dir = temp_dir_path / 'hls'
-            output_dir.mkdir()
+            audio_file.bitrate_kbps = int(int(audio_stream.get('bit_rate', 0)) / 1000)
+            audio_file.sample_rate = int(audio_stream.get('sample_rate', 0))
+            audio_file.channels = audio_stream.get('channels', 0)
+            metadata['content_sha256'] = content_sha256
+            audio_file.metadata = metadata # Save all raw metadata
+            checkpoint.complete('probe')
 
-            hls_bitrates = settings.STREAMING_HLS_BITRATES
-            ffmpeg_command = [
-                'ffmpeg', '-i', str(input_path),
-                '-preset', 'veryfast', '-keyint_min', '25', '-g', '250', '-sc_threshold', '0',
-                '-map', '0:a:0', '-map', '0:a:0', '-map', '0:a:0',
-            ]
+        # 3. Analyze in a single decode (loudness, peaks, waveform, fingerprint)
+        # and keep the decoded PCM for the encoder
+        if not checkpoint.done('analyze'):
+            analysis = analyze_audio(input_path, audio_file.channels, pcm_path, fingerprint=fingerprinting_enabled())
+            audio_file.metadata['analysis'] = {
+                'duration_ms': analysis['duration_ms'],
+                'true_peak_dbtp': analysis['true_peak_dbtp'],
+                'sample_peak_dbfs': analysis['sample_peak_dbfs'],
+                'gain_db': analysis['gain_db'],
+            }
+            audio_file.waveform_json = analysis['waveform']
+            audio_file.loudness_lufs = analysis['integrated_lufs']
+            data['pcm'] = {'sample_rate': analysis['sample_rate'], 'channels': analysis['channels']}
+            data['gain_db'] = analysis['gain_db'] if getattr(settings, 'CATALOG_LOUDNESS_NORMALIZE', True) else 0.0
+            if analysis.get('fingerprint'):
+                fingerprint = store_fingerprint(audio_file, analysis['fingerprint'])
+                if fingerprint.duplicate_of_id:
+                    data['duplicate_of'] = str(fingerprint.duplicate_of_id)
+                    audio_file.metadata['near_duplicate_of'] = {
+                        'audio_file': str(fingerprint.duplicate_of_id),
+                        'score': fingerprint.match_score,
+                    }
+            checkpoint.complete('analyze')
 
-            stream_map_str = ''
-            for i, br in enumerate(hls_bitrates):
-                ffmpeg_command.extend([
-                    f'-b:a:{i}', f'{br}k', '-ac', '2', '-ar', '48000',
-                ])
-                stream_map_str += f'v:0,a:{i},name:{br}k '
-
-            stream_map_str = stream_map_str.strip()
-
-            ffmpeg_command.extend([
-                '-f', 'hls',
-                '-hls_time', '4',
-                '-hls_playlist_type', 'vod',
-                '-hls_segment_filename', str(output_dir / 'segment_%v_%03d.ts'),
-                '-master_pl_name', 'master.m3u8',
-                '-var_stream_map', stream_map_str,
-                str(output_dir / 'playlist_%v.m3u8')
-            ])
-
-            _run_command(ffmpeg_command)
-
-            # 5. Upload HLS files to storage and create AudioQuality objects
-            with transaction.atomic():
-                # Upload master playlist
-                master_playlist_path = output_dir / 'master.m3u8'
-                with open(master_playlist_path, 'rb') as f:
-                    audio_file.hls_master.save('master.m3u8', ContentFile(f.read()))
-
-                # Upload variant playlists and segments
-                for f in output_dir.iterdir():
-                    if f.is_file():
-                        with open(f, 'rb'):
-                            # This needs a proper storage backend utility
-                            # For simplicity, we assume default storage handles upload
-                            # In a real app, you'd use boto3 directly for more control
-                            pass # Placeholder for segment upload logic
-
-                for br in hls_bitrates:
-                    AudioQuality.objects.create(
-                        audio_file=audio_file,
-                        bitrate_kbps=br,
-                        resolution_label=f'{br}kbps',
-                        format='hls',
-                        # file field would point to the variant m3u8
-                    )
+        # Hold near-duplicates for review before spending transcode time and storage on them
+        if (
+            data.get('duplicate_of')
+            and getattr(settings, 'STREAMING_FINGERPRINT_HOLD_DUPLICATES', False)
+            and not data.get('allow_duplicate')
+        ):
+            audio_file.status = Track.ProcessingStatus.FAILED
+            checkpoint.fail(f"Held as a near-duplicate of AudioFile {data['duplicate_of']}")
+            checkpoint.cleanup()
+            invalidate_stream(audio_file.track.slug)
+            logger.warning(f"AudioFile {audio_file_id} held as a near-duplicate of AudioFile {data['duplicate_of']}.")
+            return
 
+        # 4. Transcode the decoded PCM to HLS, one ffmpeg process per variant,
+        # skipping variants a previous attempt already encoded
+        if not checkpoint.done('encode'):
+            output_dir.mkdir(exist_ok=True)
+            pending = [br for br in hls_bitrates if not checkpoint.variant_done(br)]
+            if pending:
+                run_variant_jobs(
+                    lambda br: _encode_variant(pcm_path, output_dir, data['pcm'], br, data['gain_db'], packaging),
+                    pending,
+                    on_variant=checkpoint.complete_variant,
+                )
+            if progressive and not (output_dir / PROGRESSIVE_FILENAME.format(bitrate=progressive)).exists():
+                _encode_progressive(pcm_path, output_dir, data['pcm'], progressive, data['gain_db'])
+            write_master_playlist(output_dir, hls_bitrates, variant_playlist=VARIANT_PLAYLIST)
+            if cmaf:
+                # The DASH manifest points at the same fMP4 objects as the HLS playlists.
+                write_dash_manifest(output_dir, hls_bitrates, variant_playlist=VARIANT_PLAYLIST)
+            checkpoint.complete('encode')
+
+        # 5. Upload the outputs under content-addressed keys (manifests go up last);
+        # objects that landed on an earlier attempt are not sent again
+        storage_prefix = content_prefix(content_sha256, MasterAsset.Profile.STREAMING)
+        if not checkpoint.done('upload'):
+            upload_directory(
+                output_dir, f'{storage_prefix}/{output_name}', audio_file.hls_master.storage,
+                publish_last=('master.m3u8', 'manifest.mpd'), uploaded=checkpoint.uploaded,
+            )
+            checkpoint.complete('upload')
+
+        # 6. Create AudioQuality objects pointing at the variant playlists
+        # and index the outputs for later duplicates
+        uploaded = checkpoint.uploaded
+        qualities = [
+            {
+                'bitrate_kbps': br,
+                'format': AudioQuality.AudioFormat.HLS,
+                'resolution_label': f'{br}kbps',
+                'file': uploaded.get(VARIANT_PLAYLIST.format(bitrate=br), ''),
+            }
+            for br in hls_bitrates
+        ]
+        if progressive:
+            qualities.append({
+                'bitrate_kbps': progressive,
+                'format': AudioQuality.AudioFormat.AAC,
+                'resolution_label': f'{progressive}kbps',
+                'file': uploaded[PROGRESSIVE_FILENAME.format(bitrate=progressive)],
+            })
+        with transaction.atomic():
+            audio_file.hls_master.name = uploaded['master.m3u8']
+            audio_file.dash_master.name = uploaded.get('manifest.mpd')
             audio_file.status = Track.ProcessingStatus.COMPLETED
-            audio_file.save()
+            checkpoint.complete('finalize')
+            _save_qualities(audio_file, qualities)
+            record_asset(
+                content_sha256,
+                MasterAsset.Profile.STREAMING,
+                input_path.stat().st_size if input_path.exists() else 0,
+                storage_prefix,
+                audio_file.hls_master.name,
+                hls_bitrates,
+                fields={
+                    'waveform_json': audio_file.waveform_json,
+                    'loudness_lufs': audio_file.loudness_lufs,
+                    'bitrate_kbps': audio_file.bitrate_kbps,
+                    'sample_rate': audio_file.sample_rate,
+                    'channels': audio_file.channels,
+                    'metadata': {k: v for k, v in audio_file.metadata.items() if k != 'reused_from_asset'},
+                },
+                qualities=qualities,
+                dash_master=audio_file.dash_master.name or '',
+                packaging=packaging,
+            )
 
+        checkpoint.cleanup()
+        invalidate_stream(audio_file.track.slug)
         logger.info(f'Successfully processed AudioFile {audio_file_id}.')
 
     except Exception as e:
         logger.exception(f'Failed to process AudioFile {audio_file_id}: {e}')
         audio_file.status = Track.ProcessingStatus.FAILED
-        audio_file.save()
+        checkpoint.fail(e)
+        invalidate_stream(audio_file.track.slug)
+        if self.request.retries >= self.max_retries:
+            checkpoint.cleanup()
         try:
             raise self.retry(exc=e)
         except self.MaxRetriesExceededError:
             logger.error(f"Max retries exceeded for AudioFile {audio_file_id}.")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, queue='media')
+def encode_variant(self, audio_file_id, bitrate):
+    '''
+    Encodes one ladder bitrate that lazy ingest skipped, next to the
+    existing variants, then republishes the manifests so players pick it up.
+    Triggered by the first playback request for that quality.
+    '''
+    try:
+        audio_file = AudioFile.objects.select_related('track').get(pk=audio_file_id, status=Track.ProcessingStatus.COMPLETED)
+    except AudioFile.DoesNotExist:
+        release_variant(audio_file_id, bitrate)
+        logger.error(f'AudioFile {audio_file_id} is not available for on-demand encoding.')
+        return
+
+    if AudioQuality.objects.filter(audio_file=audio_file, bitrate_kbps=bitrate, format=AudioQuality.AudioFormat.HLS).exists():
+        release_variant(audio_file_id, bitrate)
+        return
+
+    state = audio_file.pipeline_state.get('data', {})
+    packaging = state.get('packaging', MasterAsset.Packaging.TS)
+    storage_prefix = posixpath.dirname(audio_file.hls_master.name)
+    analysis = audio_file.metadata.get('analysis', {})
+    gain_db = analysis.get('gain_db', 0.0) if getattr(settings, 'CATALOG_LOUDNESS_NORMALIZE', True) else 0.0
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_dir_path = Path(temp_dir)
+            input_path = fetch_source(
+                audio_file.original_file.name,
+                temp_dir_path / Path(audio_file.original_file.name).name,
+                audio_file.original_file.storage,
+            )
+            output_dir = temp_dir_path / 'variant'
+            output_dir.mkdir()
+            report = _encode_variant(input_path, output_dir, None, bitrate, gain_db, packaging)
+            uploaded = upload_directory(output_dir, storage_prefix, audio_file.hls_master.storage, publish_last=())
+
+        quality = {
+            'bitrate_kbps': bitrate,
+            'format': AudioQuality.AudioFormat.HLS,
+            'resolution_label': f'{bitrate}kbps',
+            'file': uploaded[VARIANT_PLAYLIST.format(bitrate=bitrate)],
+        }
+        with transaction.atomic():
+            _save_qualities(audio_file, [quality])
+            sha256 = audio_file.metadata.get('content_sha256')
+            asset = MasterAsset.objects.select_for_update().filter(
+                sha256=sha256, profile=MasterAsset.Profile.STREAMING, packaging=packaging
+            ).first()
+            if asset is not None and bitrate not in asset.variants:
+                asset.variants = sorted(asset.variants + [bitrate])
+                asset.qualities = asset.qualities + [quality]
+                asset.save(update_fields=['variants', 'qualities', 'updated_at'])
+
+        publish_manifests(audio_file, storage_prefix, packaging)
+        invalidate_stream(audio_file.track.slug)
+        logger.info(f"Encoded {bitrate}k on demand for AudioFile {audio_file_id} in {report['seconds']}s")
+
+    except Exception as e:
+        logger.exception(f'On-demand {bitrate}k encode failed for AudioFile {audio_file_id}: {e}')
+        try:
+            raise self.retry(exc=e)
+        except self.MaxRetriesExceededError:
+            logger.error(f'Max retries exceeded for {bitrate}k of AudioFile {audio_file_id}.')
+    finally:
+        release_variant(audio_file_id, bitrate)
+
+
+def _forget_variant(sha256, packaging, bitrate):
+    'Drops an evicted bitrate from the MasterAsset so duplicates stop cloning it.'
+    for asset in MasterAsset.objects.filter(sha256=sha256, profile=MasterAsset.Profile.STREAMING, packaging=packaging):
+        asset.variants = [b for b in asset.variants if b != bitrate]
+        asset.qualities = [q for q in asset.qualities if q['bitrate_kbps'] != bitrate]
+        asset.save(update_fields=['variants', 'qualities', 'updated_at'])
+
+
+@shared_task(queue='batch')
+def evict_cold_variants():
+    '''
+    Deletes lazily encoded variants that nobody has requested for
+    STREAMING_VARIANT_IDLE_DAYS and republishes the affected manifests. The
+    baseline is never evicted, and objects shared with a duplicate master
+    are only removed once every AudioFile using them has gone cold.
+    '''
+    if not lazy_variants_enabled():
+        return 0
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'STREAMING_VARIANT_IDLE_DAYS', 30))
+    hls = AudioQuality.objects.filter(format=AudioQuality.AudioFormat.HLS).exclude(bitrate_kbps=baseline_bitrate())
+    warm = hls.filter(Q(last_requested_at__gte=cutoff) | Q(last_requested_at__isnull=True, created_at__gte=cutoff))
+    cold = hls.exclude(pk__in=warm.values('pk')).exclude(file__in=warm.values('file')).select_related('audio_file__track')
+
+    evicted = 0
+    deleted_files = set()
+    republish = {}
+    for quality in cold:
+        audio_file = quality.audio_file
+        storage = audio_file.hls_master.storage
+        storage_prefix = posixpath.dirname(quality.file.name)
+        packaging = audio_file.pipeline_state.get('data', {}).get('packaging', MasterAsset.Packaging.TS)
+        if quality.file.name not in deleted_files:
+            for name in variant_objects(storage, storage_prefix, quality.bitrate_kbps):
+                storage.delete(name)
+            deleted_files.add(quality.file.name)
+            _forget_variant(audio_file.metadata.get('content_sha256'), packaging, quality.bitrate_kbps)
+        quality.delete()
+        republish[audio_file.pk] = (audio_file, storage_prefix, packaging)
+        evicted += 1
+
+    for audio_file, storage_prefix, packaging in republish.values():
+        publish_manifests(audio_file, storage_prefix, packaging)
+        invalidate_stream(audio_file.track.slug)
+
+    logger.info(f'Evicted {evicted} cold variants.')
+    return evicted
+
+
+@shared_task(queue='batch')
+def collect_orphaned_media():
+    '''
+    Deletes media objects no Track, AudioFile, AudioQuality or MasterAsset
+    refers to once they are older than MEDIA_GC_GRACE_HOURS (partial outputs
+    of failed runs, abandoned direct uploads). Only reports with MEDIA_GC_DRY_RUN.
+    '''
+    report = sweep_orphaned_media(dry_run=getattr(settings, 'MEDIA_GC_DRY_RUN', False))
+    return {row['prefix']: {'orphaned': row['orphaned'], 'deleted': row['deleted']} for row in report}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, queue='batch')
+def fingerprint_audio_file(self, audio_file_id):
+    '''
+    Fingerprints an already processed master (the backfill for files that
+    predate fingerprinting) and flags it if it matches an earlier one.
+    '''
+    try:
+        audio_file = AudioFile.objects.get(pk=audio_file_id)
+    except AudioFile.DoesNotExist:
+        logger.error(f'AudioFile with id {audio_file_id} not found.')
+        return None
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='fingerprint-') as work_dir:
+            input_path = fetch_source(
+                audio_file.original_file.name,
+                Path(work_dir) / Path(audio_file.original_file.name).name,
+                audio_file.original_file.storage,
+            )
+            fingerprint = store_fingerprint(audio_file, fingerprint_file(input_path))
+    except Exception as e:
+        logger.exception(f'Failed to fingerprint AudioFile {audio_file_id}: {e}')
+        raise self.retry(exc=e)
+    return str(fingerprint.duplicate_of_id) if fingerprint.duplicate_of_id else None
+
+
+@shared_task(queue='batch')
+def flush_variant_requests(counts=None):
+    '''
+    Applies the buffered variant request counts, or only `counts` when a
+    process without Redis hands over its own.
+    '''
+    return flush_requests(counts)
+
+
+@shared_task(queue='realtime')
+def flush_session_heartbeats():
+    'Writes the session positions buffered by heartbeats to the database.'
+    client = heartbeat_client()
+    if client is None:
+        return 0
+    return flush_positions(client)
@@ -1,11 +1,26 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from storages.backends.s3 import S3Storage
 
+from accounts.models import UserPreferences, UserSubscription
 from artists.tests.factories import UserFactory
+from artists.tests.test_popularity import FakeRedis
 from artists.models import Track
+from artists.popularity import flush_play_counts, popularity_score
+from streaming.models import AudioQuality
+from streaming.resolution import invalidate_stream, resolve_stream
+from streaming.tasks import flush_variant_requests
 from .factories import (
     AudioFileFactory,
+    AudioQualityFactory,
     PlaybackSettingsFactory,
     StreamingSessionFactory,
     TrackFactory
@@ -100,8 +115,13 @@ class StreamingSessionAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsNotNone(response.data['ended_at'])
 
+        # The play is buffered and reaches the track on the next flush.
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.popularity, initial_popularity)
+        flush_play_counts()
         self.track.refresh_from_db()
-        self.assertEqual(self.track.popularity, initial_popularity + 1)
+        self.assertEqual(self.track.play_count, 1)
+        self.assertEqual(self.track.popularity, popularity_score(1))
 
 
 class TrackStreamingAPITests(APITestCase):
@@ -119,6 +139,19 @@ class TrackStreamingAPITests(APITestCase):
         self.assertTrue('url' in response.data)
         self.assertIn('.m3u8', response.data['url']) # Check for HLS playlist
 
+    def test_get_dash_stream_url(self):
+        'GET /stream/?protocol=dash returns the DASH manifest when one was packaged.'
+        url = reverse('track-stream', kwargs={'slug': self.track.slug})
+        response = self.client.get(url, {'protocol': 'dash'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.audio_file.dash_master.name = 'content/ab/abc/streaming/cmaf/manifest.mpd'
+        self.audio_file.save()
+        invalidate_stream(self.track.slug)
+        response = self.client.get(url, {'protocol': 'dash'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('manifest.mpd', response.data['url'])
+
     def test_get_stream_url_for_unprocessed_file_fails(self):
         'GET /stream/ returns 404 if the audio file is not marked as COMPLETED.'
         self.audio_file.status = Track.ProcessingStatus.PENDING
@@ -126,3 +159,210 @@ class TrackStreamingAPITests(APITestCase):
         url = reverse('track-stream', kwargs={'slug': self.track.slug})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StreamResolutionCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.track = TrackFactory()
+        self.audio_file = AudioFileFactory(track=self.track)
+        AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=128)
+        AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=256)
+
+    def test_cold_start_is_one_query_and_warm_start_none(self):
+        url = reverse('track-stream', kwargs={'slug': self.track.slug})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        master_url = reverse('track-master-playlist', kwargs={'slug': self.track.slug})
+        self.assertTrue(response.data['url'].startswith(f'http://testserver{master_url}?token='))
+
+    def test_qualities_are_served_from_the_resolution(self):
+        resolve_stream(self.track.slug)
+        url = reverse('track-qualities', kwargs={'slug': self.track.slug})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual([q['bitrate_kbps'] for q in response.data['results']], [256, 128])
+
+    def test_invalidation_picks_up_new_status(self):
+        url = reverse('track-stream', kwargs={'slug': self.track.slug})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.audio_file.status = Track.ProcessingStatus.FAILED
+            self.audio_file.save()
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_renamed_and_deleted_tracks_stop_resolving(self):
+        old_url = reverse('track-stream', kwargs={'slug': self.track.slug})
+        self.client.get(old_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.track.slug = 'renamed-track'
+            self.track.save()
+
+        self.assertEqual(self.client.get(old_url).status_code, status.HTTP_404_NOT_FOUND)
+        new_url = reverse('track-stream', kwargs={'slug': 'renamed-track'})
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Track.objects.get(pk=self.track.pk).delete()
+
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unknown_slug_is_not_found(self):
+        response = self.client.get(reverse('track-stream', kwargs={'slug': 'no-such-track'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProgressiveStreamAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.track = TrackFactory()
+        self.audio_file = AudioFileFactory(track=self.track)
+        AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=256)
+        for bitrate in (96, 160):
+            AudioQualityFactory(
+                audio_file=self.audio_file,
+                bitrate_kbps=bitrate,
+                format=AudioQuality.AudioFormat.AAC,
+                file=f'content/ab/abc/streaming/hls/progressive_{bitrate}k.m4a',
+            )
+        self.url = reverse('track-progressive', kwargs={'slug': self.track.slug})
+
+    @override_settings(STREAMING_ACCEL_REDIRECT=True)
+    def test_transfer_is_handed_to_nginx(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1023')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/_protected/media/content/ab/abc/streaming/hls/progressive_160k.m4a')
+        self.assertEqual(response['Content-Type'], 'audio/mp4')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(STREAMING_ACCEL_REDIRECT=True)
+    def test_quality_picks_the_best_rendition_that_fits(self):
+        response = self.client.get(self.url, {'quality': '128'})
+        self.assertTrue(response['X-Accel-Redirect'].endswith('progressive_96k.m4a'))
+
+    @override_settings(STREAMING_ACCEL_REDIRECT=True)
+    @patch('streaming.progressive.presigned_url')
+    def test_s3_objects_are_proxied_from_a_presigned_url(self, mock_presigned_url):
+        mock_presigned_url.return_value = 'http://minio:9000/media/content/ab/progressive_160k.m4a?X-Amz-Signature=abc'
+        storage = S3Storage(bucket_name='media', location='prod')
+
+        with patch.object(AudioQuality._meta.get_field('file'), 'storage', storage):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/_protected/s3/media/content/ab/progressive_160k.m4a?X-Amz-Signature=abc')
+        mock_presigned_url.assert_called_once_with('prod/content/ab/abc/streaming/hls/progressive_160k.m4a', bucket_name='media')
+
+    def test_without_nginx_the_client_is_redirected_to_storage(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn('progressive_160k.m4a', response['Location'])
+
+    def test_track_without_progressive_rendition(self):
+        AudioQuality.objects.filter(format=AudioQuality.AudioFormat.AAC).delete()
+        invalidate_stream(self.track.slug)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(STREAMING_LAZY_VARIANTS=True, STREAMING_HLS_BITRATES=[64, 128, 256], STREAMING_BASELINE_BITRATE=128)
+class OnDemandVariantAPITests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        # Premium listener on the highest preference, so every ladder bitrate is included.
+        self.user.preferences.playback_quality = UserPreferences.PlaybackQuality.LOSSLESS
+        self.user.preferences.save()
+        UserSubscription.objects.create(
+            user=self.user, plan_name='Premium', status=UserSubscription.SubscriptionStatus.ACTIVE, started_at=timezone.now()
+        )
+        self.client.force_authenticate(user=self.user)
+        self.track = TrackFactory()
+        self.audio_file = AudioFileFactory(track=self.track)
+        self.baseline = AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=128)
+        self.url = reverse('track-stream', kwargs={'slug': self.track.slug})
+
+    def test_existing_quality_is_served_and_counted(self):
+        response = self.client.get(self.url, {'quality': '128'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quality'], 128)
+        self.baseline.refresh_from_db()
+        self.assertEqual(self.baseline.request_count, 1)
+        self.assertIsNotNone(self.baseline.last_requested_at)
+
+    def test_requests_are_buffered_in_redis_and_flushed_in_bulk(self):
+        redis = FakeRedis()
+        with patch('streaming.variants._redis_client', return_value=redis):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url, {'quality': '128'})
+                self.client.get(self.url, {'quality': '128kbps'})
+            self.assertFalse([query for query in queries.captured_queries if not query['sql'].startswith('SELECT')])
+
+            self.assertEqual(flush_variant_requests(), 1)
+            self.assertEqual(flush_variant_requests(), 0)
+
+        self.baseline.refresh_from_db()
+        self.assertEqual(self.baseline.request_count, 2)
+        self.assertIsNotNone(self.baseline.last_requested_at)
+
+    def test_malformed_quality_is_rejected(self):
+        for value in ('128bps', '128k', 'kbps', '-128', '12 8'):
+            response = self.client.get(self.url, {'quality': value})
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, value)
+            self.assertIn('quality', response.data)
+
+    @patch('streaming.tasks.encode_variant.delay')
+    def test_missing_quality_is_encoded_once_and_served_from_baseline(self, mock_delay):
+        first = self.client.get(self.url, {'quality': '256'})
+        second = self.client.get(self.url, {'quality': '256kbps'})
+
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(first.data['pending'])
+        self.assertIn('.m3u8', first.data['url'])
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once_with(str(self.audio_file.pk), 256)
+
+    @patch('streaming.tasks.encode_variant.delay')
+    def test_quality_outside_the_ladder_is_rejected(self, mock_delay):
+        response = self.client.get(self.url, {'quality': '320'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        mock_delay.assert_not_called()
+
+    @patch('streaming.tasks.encode_variant.delay')
+    def test_qualities_listing_schedules_a_missing_bitrate(self, mock_delay):
+        url = reverse('track-qualities', kwargs={'slug': self.track.slug})
+
+        response = self.client.get(url, {'bitrate': '64'})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once_with(str(self.audio_file.pk), 64)
+        self.assertEqual(self.client.get(url, {'bitrate': '128'}).status_code, status.HTTP_200_OK)
+
+
+@override_settings(STREAMING_LAZY_VARIANTS=False, STREAMING_HLS_BITRATES=[64, 128, 256])
+class EagerVariantAPITests(APITestCase):
+    # Same listener and track as the on-demand tests, with every rung encoded at ingest.
+    setUp = OnDemandVariantAPITests.setUp
+
+    @patch('streaming.tasks.encode_variant.delay')
+    def test_missing_quality_is_not_encoded_on_demand(self, mock_delay):
+        response = self.client.get(self.url, {'quality': '256'})
+        listing = self.client.get(reverse('track-qualities', kwargs={'slug': self.track.slug}), {'bitrate': '64'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(listing.status_code, status.HTTP_200_OK)
+        mock_delay.assert_not_called()
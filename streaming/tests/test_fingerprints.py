@@ -0,0 +1,183 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from artists.fingerprint import Fingerprinter
+from artists.models import Track
+from streaming.fingerprints import find_matches, store_fingerprint
+from streaming.models import AudioFile, AudioFingerprint, FingerprintLandmark
+from streaming.tasks import process_audio_file
+from .factories import AudioFileFactory
+
+SAMPLE_RATE = 48000
+
+
+def melody(seconds, seed):
+    'Three-note chords changing every 250ms, so the spectrum has clear, moving peaks.'
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE // 4) / SAMPLE_RATE
+    chords = rng.uniform(200, 2000, (seconds * 4, 3))
+    return 0.3 * np.concatenate([
+        np.sin(2 * np.pi * a * t) + 0.6 * np.sin(2 * np.pi * b * t) + 0.3 * np.sin(2 * np.pi * c * t)
+        for a, b, c in chords
+    ])
+
+
+def fingerprint(mono, chunk_frames=SAMPLE_RATE):
+    fingerprinter = Fingerprinter(SAMPLE_RATE, channels=2)
+    stereo = np.repeat(mono[:, None], 2, axis=1).ravel()
+    for start in range(0, len(stereo), chunk_frames * 2):
+        fingerprinter.feed(stereo[start:start + chunk_frames * 2])
+    return fingerprinter.finish()
+
+
+class FingerprinterTest(SimpleTestCase):
+    def test_landmarks_do_not_depend_on_chunking(self):
+        signal = melody(10, seed=1)
+
+        self.assertEqual(fingerprint(signal)['landmarks'], fingerprint(signal, chunk_frames=777)['landmarks'])
+
+    def test_quieter_noisy_copy_keeps_its_landmarks(self):
+        signal = melody(10, seed=1)
+        original = set(fingerprint(signal)['landmarks'])
+        copy = fingerprint(0.5 * signal + np.random.default_rng(2).normal(0, 0.02, len(signal)))
+
+        self.assertEqual(copy['duration_ms'], 10000)
+        self.assertGreater(len(original & set(copy['landmarks'])), 0.8 * len(original))
+
+
+class FingerprintMatchingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        signal = melody(20, seed=1)
+        cls.original = fingerprint(signal)
+        # A copy trimmed by one second: the same landmarks at shifted offsets.
+        cls.trimmed = fingerprint(0.7 * signal[SAMPLE_RATE:])
+        cls.other = fingerprint(melody(20, seed=3))
+
+    def test_near_duplicate_is_flagged_against_the_older_master(self):
+        first = AudioFileFactory()
+        store_fingerprint(first, self.original)
+        unrelated = AudioFileFactory()
+        stored = store_fingerprint(unrelated, self.other)
+        self.assertIsNone(stored.duplicate_of)
+
+        copy = AudioFileFactory()
+        stored = store_fingerprint(copy, self.trimmed)
+
+        self.assertEqual(stored.duplicate_of, first)
+        self.assertGreater(stored.match_score, 0.5)
+        self.assertEqual(stored.landmark_count, FingerprintLandmark.objects.filter(fingerprint=stored).count())
+        self.assertEqual([match['audio_file'] for match in find_matches(self.trimmed['landmarks'])], [copy.pk, first.pk])
+
+    def test_flag_points_at_the_older_master_whatever_the_order(self):
+        first = AudioFileFactory()
+        copy = AudioFileFactory()
+        AudioFile.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(days=1))
+        first.refresh_from_db()
+
+        store_fingerprint(copy, self.trimmed)
+        store_fingerprint(first, self.original)
+
+        self.assertIsNone(first.fingerprint.duplicate_of)
+        self.assertEqual(AudioFingerprint.objects.get(audio_file=copy).duplicate_of, first)
+
+    def test_refingerprinting_replaces_the_landmarks(self):
+        audio_file = AudioFileFactory()
+        store_fingerprint(audio_file, self.original)
+        store_fingerprint(audio_file, self.original)
+
+        self.assertEqual(AudioFingerprint.objects.count(), 1)
+        self.assertEqual(FingerprintLandmark.objects.count(), len(self.original['landmarks']))
+
+
+@patch('streaming.tasks._run_command')
+@patch('streaming.tasks.analyze_audio')
+@patch('streaming.tasks._encode_variant')
+class FingerprintStageTest(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        override = override_settings(MEDIA_PIPELINE_WORK_DIR=self.work_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        signal = melody(10, seed=1)
+        self.original = AudioFileFactory()
+        store_fingerprint(self.original, fingerprint(signal))
+        self.copy_fingerprint = fingerprint(signal + np.random.default_rng(2).normal(0, 0.02, len(signal)))
+        self.audio_file = AudioFileFactory(status=Track.ProcessingStatus.PENDING, hls_master=None)
+
+    def _prepare(self, mock_analyze, mock_run_command):
+        mock_run_command.return_value.stdout = (
+            '{"format": {"duration": "10.0"}, "streams": '
+            '[{"codec_type": "audio", "bit_rate": "320000", "sample_rate": "48000", "channels": 2}]}'
+        )
+        mock_analyze.return_value = {
+            'duration_ms': 10000, 'integrated_lufs': -14.0, 'true_peak_dbtp': -1.5, 'sample_peak_dbfs': -1.6,
+            'gain_db': 0.0, 'waveform': {'levels': []}, 'channels': 2, 'sample_rate': 48000,
+            'fingerprint': self.copy_fingerprint,
+        }
+
+    @override_settings(STREAMING_FINGERPRINT_HOLD_DUPLICATES=True)
+    def test_duplicate_is_held_before_encoding(self, mock_encode, mock_analyze, mock_run_command):
+        self._prepare(mock_analyze, mock_run_command)
+
+        process_audio_file(self.audio_file.id)
+
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.FAILED)
+        self.assertIn(str(self.original.pk), self.audio_file.pipeline_state['error']['message'])
+        self.assertEqual(self.audio_file.pipeline_state['error']['stage'], 'encode')
+        self.assertEqual(self.audio_file.fingerprint.duplicate_of, self.original)
+        mock_encode.assert_not_called()
+
+    @override_settings(STREAMING_FINGERPRINT_HOLD_DUPLICATES=True)
+    def test_released_duplicate_is_encoded(self, mock_encode, mock_analyze, mock_run_command):
+        self._prepare(mock_analyze, mock_run_command)
+        mock_encode.side_effect = RuntimeError('encoder crashed')
+
+        with patch.object(process_audio_file, 'retry', side_effect=process_audio_file.MaxRetriesExceededError):
+            process_audio_file(self.audio_file.id, allow_duplicate=True)
+
+        self.assertTrue(mock_encode.called)
+        self.audio_file.refresh_from_db()
+        self.assertEqual(
+            self.audio_file.metadata['near_duplicate_of']['audio_file'], str(self.original.pk)
+        )
+
+    def test_duplicate_is_only_flagged_by_default(self, mock_encode, mock_analyze, mock_run_command):
+        self._prepare(mock_analyze, mock_run_command)
+        mock_encode.side_effect = RuntimeError('encoder crashed')
+
+        with patch.object(process_audio_file, 'retry', side_effect=process_audio_file.MaxRetriesExceededError):
+            process_audio_file(self.audio_file.id)
+
+        self.assertTrue(mock_encode.called)
+        self.assertEqual(mock_analyze.call_args.kwargs, {'fingerprint': True})
+        self.assertEqual(AudioFingerprint.objects.get(audio_file=self.audio_file).duplicate_of, self.original)
+
+
+class BackfillFingerprintsCommandTest(TestCase):
+    @patch('streaming.tasks.fingerprint_file')
+    def test_processed_files_without_fingerprint_are_backfilled(self, mock_fingerprint_file):
+        signal = melody(10, seed=1)
+        mock_fingerprint_file.side_effect = [fingerprint(signal), fingerprint(0.5 * signal)]
+        first = AudioFileFactory(status=Track.ProcessingStatus.COMPLETED)
+        copy = AudioFileFactory(status=Track.ProcessingStatus.COMPLETED)
+        AudioFileFactory(status=Track.ProcessingStatus.FAILED)
+        out = StringIO()
+
+        call_command('backfill_fingerprints', '--sync', stdout=out)
+
+        self.assertIn('Fingerprinted 2 audio files, 1 flagged as duplicates.', out.getvalue())
+        self.assertEqual(AudioFingerprint.objects.get(audio_file=copy).duplicate_of, first)
+
+        call_command('backfill_fingerprints', '--sync', stdout=out)
+        self.assertIn('Fingerprinted 0 audio files', out.getvalue())
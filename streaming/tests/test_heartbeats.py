@@ -0,0 +1,163 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from artists.models import Track
+from artists.popularity import flush_play_counts
+from artists.tests.factories import UserFactory
+from streaming.heartbeats import DIRTY_KEY, SESSION_KEY, flush_positions, track_session
+from streaming.models import StreamingSession
+from streaming.tasks import flush_session_heartbeats
+from .factories import AudioFileFactory, StreamingSessionFactory, TrackFactory
+
+
+class FakeRedis:
+    'The handful of hash and set commands the heartbeat buffer uses, returning bytes like redis-py.'
+
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = dict(mapping or {})
+        if field is not None:
+            values[field] = value
+        self.hashes.setdefault(key, {}).update({k: str(v).encode() for k, v in values.items()})
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def expire(self, key, seconds):
+        pass
+
+    def sadd(self, key, *values):
+        self.sets.setdefault(key, set()).update(v.encode() for v in values)
+
+    def srem(self, key, *values):
+        self.sets.get(key, set()).difference_update(v.encode() for v in values)
+
+    def spop(self, key, count):
+        members = self.sets.get(key, set())
+        return [members.pop() for _ in range(min(count, len(members)))]
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.client, name), args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class HeartbeatBufferAPITests(APITestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = patch('streaming.views.heartbeat_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.track = TrackFactory()
+        self.audio_file = AudioFileFactory(track=self.track, status=Track.ProcessingStatus.COMPLETED)
+
+    def test_start_session_tracks_owner(self):
+        response = self.client.post(reverse('session-list'), {'track': self.track.pk}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        key = SESSION_KEY.format(session_id=response.data['id'])
+        self.assertEqual(self.redis.hget(key, 'user'), str(self.user.pk).encode())
+
+    def test_heartbeat_is_buffered_without_saving(self):
+        session = StreamingSessionFactory(user=self.user, track=self.track, audio_file=self.audio_file)
+        track_session(self.redis, session)
+        url = reverse('session-detail', kwargs={'pk': session.pk})
+
+        with self.assertNumQueries(0):
+            response = self.client.patch(url, {'last_position_ms': 30000}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['last_position_ms'], 30000)
+        session.refresh_from_db()
+        self.assertEqual(session.last_position_ms, 0)
+        self.assertIn(str(session.pk).encode(), self.redis.sets[DIRTY_KEY])
+        self.assertEqual(self.client.get(url).data['last_position_ms'], 30000)
+
+    def test_untracked_session_is_checked_in_the_database(self):
+        session = StreamingSessionFactory(user=self.user, track=self.track, audio_file=self.audio_file)
+        url = reverse('session-detail', kwargs={'pk': session.pk})
+
+        response = self.client.patch(url, {'last_position_ms': 12000}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.redis.hget(SESSION_KEY.format(session_id=session.pk), 'position'), b'12000')
+
+    def test_cannot_buffer_another_users_session(self):
+        session = StreamingSessionFactory(user=UserFactory(), track=self.track, audio_file=self.audio_file)
+        track_session(self.redis, session)
+        url = reverse('session-detail', kwargs={'pk': session.pk})
+
+        response = self.client.patch(url, {'last_position_ms': 30000}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.redis.hget(SESSION_KEY.format(session_id=session.pk), 'position'), b'0')
+
+    def test_end_uses_buffered_position(self):
+        session = StreamingSessionFactory(user=self.user, track=self.track, audio_file=self.audio_file)
+        track_session(self.redis, session)
+        self.client.patch(reverse('session-detail', kwargs={'pk': session.pk}), {'last_position_ms': 45000}, format='json')
+
+        response = self.client.post(reverse('session-end', kwargs={'pk': session.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['last_position_ms'], 45000)
+        flush_play_counts()
+        self.track.refresh_from_db()
+        self.assertEqual(self.track.play_count, 1)
+        self.assertNotIn(SESSION_KEY.format(session_id=session.pk), self.redis.hashes)
+        self.assertNotIn(str(session.pk).encode(), self.redis.sets[DIRTY_KEY])
+
+
+class FlushPositionsTest(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.sessions = StreamingSessionFactory.create_batch(5)
+        for position, session in enumerate(self.sessions, start=1):
+            track_session(self.redis, session)
+            self.redis.hset(SESSION_KEY.format(session_id=session.pk), 'position', position * 1000)
+            self.redis.sadd(DIRTY_KEY, str(session.pk))
+
+    def test_one_update_per_batch(self):
+        # One UPDATE for each batch of two sessions.
+        with self.assertNumQueries(3):
+            flushed = flush_positions(self.redis, batch_size=2)
+
+        self.assertEqual(flushed, 5)
+        for position, session in enumerate(self.sessions, start=1):
+            session.refresh_from_db()
+            self.assertEqual(session.last_position_ms, position * 1000)
+        self.assertEqual(self.redis.sets[DIRTY_KEY], set())
+
+    def test_ended_sessions_are_not_overwritten(self):
+        ended = self.sessions[0]
+        StreamingSession.objects.filter(pk=ended.pk).update(last_position_ms=99000, ended_at=ended.started_at)
+
+        self.assertEqual(flush_positions(self.redis), 4)
+        ended.refresh_from_db()
+        self.assertEqual(ended.last_position_ms, 99000)
+
+    def test_task_is_a_noop_without_redis(self):
+        # The test settings use the file cache, which has no Redis client.
+        self.assertEqual(flush_session_heartbeats(), 0)
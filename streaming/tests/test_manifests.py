@@ -0,0 +1,137 @@
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import UserPreferences, UserSubscription
+from artists.tests.factories import UserFactory
+from streaming.manifests import render_master, user_tier
+from .factories import AudioFileFactory, AudioQualityFactory, PlaybackSettingsFactory
+
+MASTER = (
+    '#EXTM3U\n'
+    '#EXT-X-STREAM-INF:BANDWIDTH=64000,RESOLUTION=,NAME="64k"\nplaylist_64k.m3u8\n'
+    '#EXT-X-STREAM-INF:BANDWIDTH=128000,RESOLUTION=,NAME="128k"\nplaylist_128k.m3u8\n'
+    '#EXT-X-STREAM-INF:BANDWIDTH=256000,RESOLUTION=,NAME="256k"\nplaylist_256k.m3u8\n'
+)
+
+
+def _variants(manifest):
+    return [line for line in manifest.splitlines() if not line.startswith('#')]
+
+
+class RenderMasterTest(SimpleTestCase):
+    def render(self, max_bitrate=None, preferred=None):
+        tier = {'max_bitrate': max_bitrate, 'preferred': preferred}
+        return render_master(MASTER, tier, lambda uri: f'https://cdn/{uri}')
+
+    def test_uncapped_tier_keeps_every_variant_with_absolute_uris(self):
+        manifest = self.render()
+
+        self.assertTrue(manifest.startswith('#EXTM3U\n'))
+        self.assertEqual(
+            _variants(manifest),
+            ['https://cdn/playlist_64k.m3u8', 'https://cdn/playlist_128k.m3u8', 'https://cdn/playlist_256k.m3u8'],
+        )
+
+    def test_variants_above_the_cap_are_dropped(self):
+        self.assertEqual(_variants(self.render(max_bitrate=128)), ['https://cdn/playlist_64k.m3u8', 'https://cdn/playlist_128k.m3u8'])
+
+    def test_lowest_variant_survives_a_cap_below_the_ladder(self):
+        self.assertEqual(_variants(self.render(max_bitrate=32)), ['https://cdn/playlist_64k.m3u8'])
+
+    def test_preferred_variant_is_listed_first(self):
+        self.assertEqual(
+            _variants(self.render(max_bitrate=128, preferred=256)),
+            ['https://cdn/playlist_128k.m3u8', 'https://cdn/playlist_64k.m3u8'],
+        )
+
+
+@override_settings(
+    STREAMING_QUALITY_TIERS={'LOW': 64, 'NORMAL': 128, 'HIGH': 256, 'LOSSLESS': 0},
+    STREAMING_FREE_MAX_BITRATE=128,
+)
+class MasterPlaylistAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.audio_file = AudioFileFactory(hls_master__from_func=lambda: ContentFile(MASTER.encode(), 'master.m3u8'))
+        self.url = reverse('track-master-playlist', kwargs={'slug': self.audio_file.track.slug})
+
+    def subscribe(self):
+        UserSubscription.objects.create(
+            user=self.user, plan_name='Premium', status=UserSubscription.SubscriptionStatus.ACTIVE, started_at=timezone.now()
+        )
+
+    def set_preference(self, quality):
+        self.user.preferences.playback_quality = quality
+        self.user.preferences.save()
+
+    def test_free_listener_is_capped(self):
+        self.set_preference(UserPreferences.PlaybackQuality.HIGH)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        variants = _variants(response.content.decode())
+        self.assertEqual(len(variants), 2)
+        self.assertTrue(variants[-1].endswith('playlist_128k.m3u8'))
+
+    def test_subscriber_gets_their_preference_and_default_quality_first(self):
+        self.subscribe()
+        self.set_preference(UserPreferences.PlaybackQuality.HIGH)
+        PlaybackSettingsFactory(user=self.user, default_quality=AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=128))
+
+        variants = _variants(self.client.get(self.url).content.decode())
+
+        self.assertEqual(len(variants), 3)
+        self.assertTrue(variants[0].endswith('playlist_128k.m3u8'))
+
+    def test_rendering_is_cached_per_tier(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_changing_the_plan_refreshes_the_tier(self):
+        self.set_preference(UserPreferences.PlaybackQuality.LOSSLESS)
+        self.assertEqual(user_tier(self.user)['max_bitrate'], 128)
+
+        self.subscribe()
+
+        self.assertIsNone(user_tier(self.user)['max_bitrate'])
+        self.assertEqual(len(_variants(self.client.get(self.url).content.decode())), 3)
+
+    def test_token_from_the_stream_endpoint_opens_the_playlist_without_a_header(self):
+        self.set_preference(UserPreferences.PlaybackQuality.HIGH)
+        slug = self.audio_file.track.slug
+        url = self.client.get(reverse('track-stream', kwargs={'slug': slug})).data['url']
+        other = reverse('track-master-playlist', kwargs={'slug': 'other-track'}) + '?' + url.split('?')[1]
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(_variants(response.content.decode())), 2)
+        self.assertEqual(self.client.get(other).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(self.url, {'token': 'forged'}).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_quality_above_the_plan_is_refused(self):
+        response = self.client.get(reverse('track-stream', kwargs={'slug': self.audio_file.track.slug}), {'quality': '256'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from artists.models import Track
+from artists.storage import delete_objects, list_objects
+from streaming.media_gc import sweep_orphaned_media
+from streaming.models import MasterAsset
+from .factories import AudioFileFactory, AudioQualityFactory
+
+LIVE_SHA = 'ab' + '1' * 62
+PARTIAL_SHA = 'cd' + '2' * 62
+RETRYING_SHA = 'ef' + '3' * 62
+
+
+class SweepOrphanedMediaTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        audio_file = AudioFileFactory()
+        AudioQualityFactory(audio_file=audio_file)
+        prefix = f'content/ab/{LIVE_SHA}/streaming'
+        MasterAsset.objects.create(
+            sha256=LIVE_SHA, profile=MasterAsset.Profile.STREAMING, storage_prefix=prefix,
+            hls_master=f'{prefix}/hls/master.m3u8',
+        )
+        AudioFileFactory(
+            status=Track.ProcessingStatus.FAILED, pipeline_state={'data': {'content_sha256': RETRYING_SHA}},
+        )
+
+        self.live = [
+            self._save(f'{prefix}/hls/master.m3u8'),
+            self._save(f'{prefix}/hls/segment_128k_00000.ts'),
+            self._save(f'content/ef/{RETRYING_SHA}/streaming/hls/segment_64k_00000.ts'),
+            audio_file.original_file.name,
+            audio_file.track.audio_original.name,
+        ]
+        self.orphans = [
+            self._save(f'content/cd/{PARTIAL_SHA}/catalog/hls/segment_64k_00000.ts'),
+            self._save(f'content/cd/{PARTIAL_SHA}/catalog/hls/playlist_64k.m3u8'),
+            self._save('uploads/original/0f8b0c3e/abandoned.wav'),
+        ]
+        self.recent = self._save('uploads/original/5d1e7a42/in-flight.wav', age=timedelta(hours=1))
+
+    def _save(self, name, age=timedelta(days=10)):
+        name = default_storage.save(name, ContentFile(b'x'))
+        stamp = time.time() - age.total_seconds()
+        os.utime(default_storage.path(name), (stamp, stamp))
+        return name
+
+    def test_dry_run_reports_without_deleting(self):
+        report = {row['prefix']: row for row in sweep_orphaned_media(dry_run=True, page_size=2)}
+
+        self.assertEqual(report['content/']['orphaned'], 2)
+        self.assertEqual((report['uploads/original/']['orphaned'], report['uploads/original/']['recent']), (1, 1))
+        self.assertEqual(sorted(sum((row['sample'] for row in report.values()), [])), sorted(self.orphans))
+        self.assertFalse(any(row['deleted'] for row in report.values()))
+        self.assertTrue(all(default_storage.exists(name) for name in self.orphans))
+
+    def test_only_old_orphans_are_deleted(self):
+        report = sweep_orphaned_media(dry_run=False, grace=timedelta(hours=72), page_size=2)
+
+        self.assertEqual(sum(row['deleted'] for row in report), len(self.orphans))
+        self.assertFalse(any(default_storage.exists(name) for name in self.orphans))
+        self.assertTrue(all(default_storage.exists(name) for name in self.live + [self.recent]))
+
+    def test_command_prints_the_report(self):
+        out = StringIO()
+
+        call_command('collect_orphaned_media', '--dry-run', stdout=out)
+
+        self.assertIn('Dry run: 3 orphaned objects would be deleted.', out.getvalue())
+        self.assertIn(f'  {self.orphans[2]}', out.getvalue().splitlines())
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        return iter(self.pages)
+
+
+class S3ObjectsTest(TestCase):
+    def test_listing_and_deletion_use_bulk_requests(self):
+        modified = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        paginator = FakePaginator([
+            {'Contents': [{'Key': 'media/uploads/original/a/x.wav', 'LastModified': modified}]},
+            {},
+        ])
+        deletes = []
+        client = SimpleNamespace(
+            get_paginator=lambda name: paginator,
+            delete_objects=lambda **kwargs: deletes.append(kwargs) or {'Errors': [{'Key': 'media/b', 'Code': 'AccessDenied'}]},
+        )
+        storage = SimpleNamespace(bucket_name='bucket', location='media')
+
+        with patch('artists.storage.get_s3_client', return_value=client):
+            pages = list(list_objects('uploads/original/', storage, page_size=500))
+            deleted = delete_objects([f'k{i}' for i in range(1500)] + ['b'], storage)
+
+        self.assertEqual(pages, [[('uploads/original/a/x.wav', modified)]])
+        self.assertEqual(paginator.calls[0]['Prefix'], 'media/uploads/original/')
+        self.assertEqual(paginator.calls[0]['PaginationConfig'], {'PageSize': 500})
+        self.assertEqual([len(call['Delete']['Objects']) for call in deletes], [1000, 501])
+        self.assertEqual(deletes[0]['Delete']['Objects'][0], {'Key': 'media/k0'})
+        self.assertEqual(deleted, 1499)
@@ -0,0 +1,122 @@
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from artists.models import Track
+from artists.tests.factories import TrackFactory, UserFactory
+from playlists.tests.factories import PlaylistFactory, PlaylistTrackFactory
+from streaming.resolution import resolve_streams
+from .factories import AudioFileFactory, AudioQualityFactory
+
+MASTER = (
+    '#EXTM3U\n'
+    '#EXT-X-STREAM-INF:BANDWIDTH=128000,RESOLUTION=,NAME="128k"\nplaylist_128k.m3u8\n'
+    '#EXT-X-STREAM-INF:BANDWIDTH=256000,RESOLUTION=,NAME="256k"\nplaylist_256k.m3u8\n'
+)
+
+
+@override_settings(
+    STREAMING_PREFETCH_TRACKS=2,
+    STREAMING_QUALITY_TIERS={'LOW': 64, 'NORMAL': 128, 'HIGH': 256, 'LOSSLESS': 0},
+    STREAMING_FREE_MAX_BITRATE=128,
+)
+class PrefetchBundleAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.current, *self.upcoming = [self.streamable() for _ in range(4)]
+        self.url = reverse('session-list')
+
+    def streamable(self):
+        audio_file = AudioFileFactory(hls_master__from_func=lambda: ContentFile(MASTER.encode(), 'master.m3u8'))
+        for bitrate in (128, 256):
+            AudioQualityFactory(audio_file=audio_file, bitrate_kbps=bitrate)
+        return audio_file.track
+
+    def start(self, **context):
+        return self.client.post(self.url, {'track': self.current.pk, **context}, format='json')
+
+    def test_queue_context_bundles_the_next_tracks(self):
+        response = self.start(queue=[str(track.pk) for track in self.upcoming])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        prefetch = response.data['prefetch']
+        self.assertEqual([entry['slug'] for entry in prefetch], [track.slug for track in self.upcoming[:2]])
+        entry = prefetch[0]
+        self.assertIn(reverse('track-master-playlist', kwargs={'slug': entry['slug']}) + '?token=', entry['master_url'])
+        self.assertIn('playlist_128k.m3u8', entry['manifest'])
+        self.assertNotIn('playlist_256k.m3u8', entry['manifest'])
+        self.assertEqual([quality['bitrate_kbps'] for quality in entry['qualities']], [128])
+        self.assertIn('autoplay_next', response.data['playback_settings'])
+
+    def test_unstreamable_tracks_are_skipped(self):
+        pending = TrackFactory(status=Track.ProcessingStatus.PENDING)
+
+        response = self.start(queue=[str(pending.pk), str(self.upcoming[0].pk)])
+
+        self.assertEqual([entry['slug'] for entry in response.data['prefetch']], [self.upcoming[0].slug])
+
+    def test_playlist_context_follows_the_playlist_order(self):
+        playlist = PlaylistFactory(owner=self.user)
+        for track in [self.upcoming[0], self.current, *self.upcoming[1:]]:
+            PlaylistTrackFactory(playlist=playlist, track=track)
+
+        response = self.start(playlist=playlist.slug)
+
+        self.assertEqual([entry['slug'] for entry in response.data['prefetch']], [track.slug for track in self.upcoming[1:3]])
+
+    def test_private_playlists_of_others_are_not_prefetched(self):
+        playlist = PlaylistFactory()
+        PlaylistTrackFactory(playlist=playlist, track=self.current)
+        PlaylistTrackFactory(playlist=playlist, track=self.upcoming[0])
+
+        response = self.start(playlist=playlist.slug)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['prefetch'], [])
+
+    def test_no_context_keeps_the_plain_response(self):
+        response = self.start()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('prefetch', response.data)
+
+    def test_warm_prefetch_endpoint_skips_the_database(self):
+        url = reverse('session-prefetch')
+        slugs = ','.join(track.slug for track in self.upcoming)
+        self.client.get(url, {'tracks': slugs})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'tracks': slugs})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+class ResolveStreamsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_misses_are_loaded_in_one_query(self):
+        tracks = [AudioQualityFactory().audio_file.track for _ in range(3)]
+        slugs = [track.slug for track in tracks] + ['missing']
+
+        with self.assertNumQueries(1):
+            resolutions = resolve_streams(slugs)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_streams(slugs[:-1]), resolutions)
+
+        self.assertEqual(set(resolutions), {track.slug for track in tracks})
+        self.assertEqual(resolutions[tracks[0].slug]['track_id'], str(tracks[0].pk))
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from artists.models import Track
+from streaming.models import AudioQuality, MasterAsset
+from streaming.resolution import RESOLUTION_KEY, resolve_stream
+from streaming.tasks import encode_variant, evict_cold_variants, process_audio_file
+from .factories import AudioFileFactory, AudioQualityFactory
+
+
+class ProcessAudioFileDeduplicationTest(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        override = override_settings(MEDIA_PIPELINE_WORK_DIR=self.work_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.audio_file = AudioFileFactory(status=Track.ProcessingStatus.PENDING, hls_master=None)
+        self.sha256 = hashlib.sha256(b'dummy audio content').hexdigest()
+        self.prefix = f'content/{self.sha256[:2]}/{self.sha256}/streaming'
+
+    @patch('streaming.tasks.analyze_audio')
+    @patch('streaming.tasks._run_command')
+    def test_duplicate_master_clones_qualities(self, mock_run_command, mock_analyze):
+        asset = MasterAsset.objects.create(
+            sha256=self.sha256,
+            profile=MasterAsset.Profile.STREAMING,
+            storage_prefix=self.prefix,
+            hls_master=f'{self.prefix}/hls/master.m3u8',
+            variants=[64, 128, 256],
+            qualities=[
+                {
+                    'bitrate_kbps': br,
+                    'format': 'hls',
+                    'resolution_label': f'{br}kbps',
+                    'file': f'{self.prefix}/hls/playlist_{br}k.m3u8',
+                }
+                for br in (64, 128, 256)
+            ],
+            fields={'channels': 2, 'sample_rate': 44100, 'loudness_lufs': -14.5},
+        )
+        resolve_stream(self.audio_file.track.slug)
+
+        process_audio_file(self.audio_file.id)
+
+        mock_run_command.assert_not_called()
+        mock_analyze.assert_not_called()
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.COMPLETED)
+        self.assertEqual(self.audio_file.hls_master.name, asset.hls_master)
+        self.assertEqual(self.audio_file.channels, 2)
+        self.assertEqual(self.audio_file.metadata['content_sha256'], self.sha256)
+
+        qualities = AudioQuality.objects.filter(audio_file=self.audio_file).order_by('bitrate_kbps')
+        self.assertEqual([q.bitrate_kbps for q in qualities], [64, 128, 256])
+        self.assertEqual(qualities[1].file.name, f'{self.prefix}/hls/playlist_128k.m3u8')
+        self.assertIsNone(cache.get(RESOLUTION_KEY.format(slug=self.audio_file.track.slug)))
+
+    @patch('streaming.tasks._run_command', side_effect=FileNotFoundError('ffprobe'))
+    def test_unknown_master_is_processed(self, mock_run_command):
+        with patch.object(process_audio_file, 'retry', side_effect=process_audio_file.MaxRetriesExceededError):
+            process_audio_file(self.audio_file.id)
+
+        mock_run_command.assert_called_once()
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.FAILED)
+        self.assertFalse(MasterAsset.objects.exists())
+        self.assertEqual(self.audio_file.pipeline_state['error']['stage'], 'probe')
+        self.assertTrue(self.audio_file.pipeline_state['stages']['fetch'])
+
+    @patch('streaming.tasks.upload_directory')
+    @patch('streaming.tasks._encode_variant')
+    @patch('streaming.tasks.analyze_audio')
+    @patch('streaming.tasks._run_command')
+    def test_retry_resumes_with_the_variants_that_failed(self, mock_run_command, mock_analyze, mock_encode, mock_upload):
+        mock_run_command.return_value.stdout = (
+            '{"format": {"duration": "1.0"}, "streams": '
+            '[{"codec_type": "audio", "bit_rate": "320000", "sample_rate": "44100", "channels": 2}]}'
+        )
+        mock_analyze.return_value = {
+            'duration_ms': 1000, 'integrated_lufs': -14.0, 'true_peak_dbtp': -1.5, 'sample_peak_dbfs': -1.6,
+            'gain_db': 0.0, 'waveform': {'levels': []}, 'channels': 2, 'sample_rate': 48000,
+        }
+
+        def encode(pcm_path, output_dir, pcm, bitrate, gain_db, packaging):
+            (output_dir / f'playlist_{bitrate}k.m3u8').write_text('#EXTM3U')
+            return {'bitrate': bitrate, 'seconds': 0.1}
+
+        def encode_crashing_at_256(pcm_path, output_dir, pcm, bitrate, gain_db, packaging):
+            if bitrate == 256:
+                raise RuntimeError('encoder crashed')
+            return encode(pcm_path, output_dir, pcm, bitrate, gain_db, packaging)
+
+        def upload(local_dir, prefix, storage=None, publish_last=(), uploaded=None):
+            for filename in os.listdir(local_dir):
+                uploaded[filename] = f'{prefix}/{filename}'
+            return uploaded
+
+        mock_encode.side_effect = encode_crashing_at_256
+        mock_upload.side_effect = upload
+        with patch.object(process_audio_file, 'retry', side_effect=process_audio_file.MaxRetriesExceededError):
+            process_audio_file(self.audio_file.id)
+
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.FAILED)
+        self.assertEqual(sorted(self.audio_file.pipeline_state['variants']), ['128', '64'])
+
+        mock_encode.side_effect = encode
+        process_audio_file(self.audio_file.id)
+
+        self.assertEqual(sorted(call.args[3] for call in mock_encode.call_args_list), [64, 128, 256, 256])
+        self.assertEqual(mock_analyze.call_count, 1)
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.COMPLETED)
+        self.assertTrue(self.audio_file.hls_master.name.endswith('/streaming/hls/master.m3u8'))
+        self.assertEqual(AudioQuality.objects.filter(audio_file=self.audio_file).count(), 3)
+
+    @override_settings(STREAMING_PACKAGING='cmaf', STREAMING_CMAF_SINGLE_FILE=True)
+    @patch('streaming.tasks.upload_directory')
+    @patch('streaming.tasks._encode_variant')
+    @patch('streaming.tasks.analyze_audio')
+    @patch('streaming.tasks._run_command')
+    def test_cmaf_packaging_publishes_hls_and_dash_over_one_segment_set(
+        self, mock_run_command, mock_analyze, mock_encode, mock_upload
+    ):
+        mock_run_command.return_value.stdout = (
+            '{"format": {"duration": "8.0"}, "streams": '
+            '[{"codec_type": "audio", "bit_rate": "320000", "sample_rate": "48000", "channels": 2}]}'
+        )
+        mock_analyze.return_value = {
+            'duration_ms': 8000, 'integrated_lufs': -14.0, 'true_peak_dbtp': -1.5, 'sample_peak_dbfs': -1.6,
+            'gain_db': 0.0, 'waveform': {'levels': []}, 'channels': 2, 'sample_rate': 48000,
+        }
+
+        def encode(pcm_path, output_dir, pcm, bitrate, gain_db, packaging):
+            (output_dir / f'playlist_{bitrate}k.m3u8').write_text(
+                '#EXTM3U\n#EXT-X-VERSION:7\n'
+                f'#EXT-X-MAP:URI="segment_{bitrate}k.mp4",BYTERANGE="800@0"\n'
+                f'#EXTINF:4.000000,\n#EXT-X-BYTERANGE:2000@800\nsegment_{bitrate}k.mp4\n'
+                f'#EXTINF:4.000000,\n#EXT-X-BYTERANGE:2000\nsegment_{bitrate}k.mp4\n#EXT-X-ENDLIST\n'
+            )
+            (output_dir / f'segment_{bitrate}k.mp4').write_bytes(b'\0' * 4800)
+            return {'bitrate': bitrate, 'seconds': 0.1}
+
+        uploads = {}
+
+        def upload(local_dir, prefix, storage=None, publish_last=(), uploaded=None):
+            uploads['publish_last'] = publish_last
+            for filename in os.listdir(local_dir):
+                uploaded[filename] = f'{prefix}/{filename}'
+            return uploaded
+
+        mock_encode.side_effect = encode
+        mock_upload.side_effect = upload
+        process_audio_file(self.audio_file.id)
+
+        self.assertEqual({call.args[5] for call in mock_encode.call_args_list}, {MasterAsset.Packaging.CMAF_SINGLE_FILE})
+        self.assertIn('manifest.mpd', uploads['publish_last'])
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, Track.ProcessingStatus.COMPLETED)
+        self.assertEqual(self.audio_file.hls_master.name, f'{self.prefix}/cmaf/master.m3u8')
+        self.assertEqual(self.audio_file.dash_master.name, f'{self.prefix}/cmaf/manifest.mpd')
+        asset = MasterAsset.objects.get()
+        self.assertEqual(asset.packaging, MasterAsset.Packaging.CMAF_SINGLE_FILE)
+        self.assertEqual(asset.dash_master, self.audio_file.dash_master.name)
+
+    @override_settings(STREAMING_LAZY_VARIANTS=True, STREAMING_BASELINE_BITRATE=128)
+    @patch('streaming.tasks.upload_directory')
+    @patch('streaming.tasks._encode_variant')
+    @patch('streaming.tasks.analyze_audio')
+    @patch('streaming.tasks._run_command')
+    def test_lazy_ingest_encodes_only_the_baseline(self, mock_run_command, mock_analyze, mock_encode, mock_upload):
+        mock_run_command.return_value.stdout = (
+            '{"format": {"duration": "1.0"}, "streams": '
+            '[{"codec_type": "audio", "bit_rate": "320000", "sample_rate": "48000", "channels": 2}]}'
+        )
+        mock_analyze.return_value = {
+            'duration_ms': 1000, 'integrated_lufs': -14.0, 'true_peak_dbtp': -1.5, 'sample_peak_dbfs': -1.6,
+            'gain_db': 0.0, 'waveform': {'levels': []}, 'channels': 2, 'sample_rate': 48000,
+        }
+        mock_encode.return_value = {'bitrate': 128, 'seconds': 0.1}
+
+        def upload(local_dir, prefix, storage=None, publish_last=(), uploaded=None):
+            for filename in ('master.m3u8', 'playlist_128k.m3u8'):
+                uploaded[filename] = f'{prefix}/{filename}'
+            return uploaded
+
+        mock_upload.side_effect = upload
+        process_audio_file(self.audio_file.id)
+
+        self.assertEqual([call.args[3] for call in mock_encode.call_args_list], [128])
+        self.assertEqual(list(self.audio_file.qualities.values_list('bitrate_kbps', flat=True)), [128])
+        self.assertEqual(MasterAsset.objects.get().variants, [128])
+
+
+    @override_settings(STREAMING_LAZY_VARIANTS=True, STREAMING_BASELINE_BITRATE=128, STREAMING_PROGRESSIVE_BITRATE=96)
+    @patch('streaming.tasks.upload_directory')
+    @patch('streaming.tasks._encode_variant')
+    @patch('streaming.tasks.analyze_audio')
+    @patch('streaming.tasks._run_command')
+    def test_progressive_rendition_is_encoded_at_ingest(self, mock_run_command, mock_analyze, mock_encode, mock_upload):
+        mock_run_command.return_value.stdout = (
+            '{"format": {"duration": "1.0"}, "streams": '
+            '[{"codec_type": "audio", "bit_rate": "320000", "sample_rate": "48000", "channels": 2}]}'
+        )
+        mock_analyze.return_value = {
+            'duration_ms': 1000, 'integrated_lufs': -14.0, 'true_peak_dbtp': -1.5, 'sample_peak_dbfs': -1.6,
+            'gain_db': 0.0, 'waveform': {'levels': []}, 'channels': 2, 'sample_rate': 48000,
+        }
+        mock_encode.return_value = {'bitrate': 128, 'seconds': 0.1}
+
+        def upload(local_dir, prefix, storage=None, publish_last=(), uploaded=None):
+            for filename in ('master.m3u8', 'playlist_128k.m3u8', 'progressive_96k.m4a'):
+                uploaded[filename] = f'{prefix}/{filename}'
+            return uploaded
+
+        mock_upload.side_effect = upload
+        process_audio_file(self.audio_file.id)
+
+        encode_command = mock_run_command.call_args_list[-1].args[0]
+        self.assertIn('+faststart', encode_command)
+        self.assertTrue(encode_command[-1].endswith('progressive_96k.m4a'))
+        progressive = self.audio_file.qualities.get(format=AudioQuality.AudioFormat.AAC)
+        self.assertEqual(progressive.bitrate_kbps, 96)
+        self.assertEqual(progressive.file.name, f'{self.prefix}/hls/progressive_96k.m4a')
+
+
+@override_settings(STREAMING_LAZY_VARIANTS=True, STREAMING_HLS_BITRATES=[64, 128, 256], STREAMING_BASELINE_BITRATE=128)
+class OnDemandVariantTaskTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.prefix = 'content/ab/abc/streaming/hls'
+        self.audio_file = AudioFileFactory(
+            metadata={'content_sha256': 'abc', 'analysis': {'gain_db': -2.0}},
+            pipeline_state={'data': {'packaging': 'ts'}},
+        )
+        self.audio_file.hls_master.name = f'{self.prefix}/master.m3u8'
+        self.audio_file.save()
+        self.baseline = self._quality(128)
+
+    def _quality(self, bitrate, days_idle=None):
+        playlist = f'{self.prefix}/playlist_{bitrate}k.m3u8'
+        default_storage.save(playlist, ContentFile(b'#EXTM3U'))
+        default_storage.save(f'{self.prefix}/segment_{bitrate}k_000.ts', ContentFile(b'ts'))
+        quality = AudioQualityFactory(audio_file=self.audio_file, bitrate_kbps=bitrate, file=playlist)
+        if days_idle is not None:
+            idle_since = timezone.now() - timedelta(days=days_idle)
+            AudioQuality.objects.filter(pk=quality.pk).update(created_at=idle_since, last_requested_at=idle_since)
+        return quality
+
+    def _master(self):
+        with default_storage.open(f'{self.prefix}/master.m3u8') as f:
+            return f.read().decode()
+
+    @patch('streaming.tasks._encode_variant')
+    def test_on_demand_encode_adds_the_variant_and_republishes_the_master(self, mock_encode):
+        def encode(source_path, output_dir, analysis, bitrate, gain_db, packaging):
+            (output_dir / f'playlist_{bitrate}k.m3u8').write_text('#EXTM3U')
+            (output_dir / f'segment_{bitrate}k_000.ts').write_bytes(b'ts')
+            return {'bitrate': bitrate, 'seconds': 0.1}
+
+        mock_encode.side_effect = encode
+        encode_variant(str(self.audio_file.pk), 256)
+
+        self.assertIsNone(mock_encode.call_args.args[2])
+        self.assertEqual(mock_encode.call_args.args[4], -2.0)
+        quality = AudioQuality.objects.get(audio_file=self.audio_file, bitrate_kbps=256)
+        self.assertEqual(quality.file.name, f'{self.prefix}/playlist_256k.m3u8')
+        self.assertTrue(default_storage.exists(f'{self.prefix}/segment_256k_000.ts'))
+        self.assertIn('playlist_128k.m3u8', self._master())
+        self.assertIn('playlist_256k.m3u8', self._master())
+
+    def test_cold_variants_are_evicted_but_the_baseline_and_warm_ones_stay(self):
+        AudioQuality.objects.filter(pk=self.baseline.pk).update(created_at=timezone.now() - timedelta(days=90))
+        self._quality(256, days_idle=40)
+        self._quality(64, days_idle=2)
+
+        self.assertEqual(evict_cold_variants(), 1)
+
+        self.assertEqual(
+            sorted(AudioQuality.objects.filter(audio_file=self.audio_file).values_list('bitrate_kbps', flat=True)),
+            [64, 128],
+        )
+        self.assertFalse(default_storage.exists(f'{self.prefix}/playlist_256k.m3u8'))
+        self.assertFalse(default_storage.exists(f'{self.prefix}/segment_256k_000.ts'))
+        self.assertTrue(default_storage.exists(f'{self.prefix}/segment_128k_000.ts'))
+        self.assertNotIn('256k', self._master())
+        self.assertIn('playlist_64k.m3u8', self._master())
+
+    @override_settings(STREAMING_LAZY_VARIANTS=False)
+    def test_eviction_is_off_without_lazy_mode(self):
+        self._quality(256, days_idle=40)
+
+        self.assertEqual(evict_cold_variants(), 0)
@@ -11,10 +11,13 @@ router.register(r'sessions', views.StreamingSessionViewSet, basename='session')
 # - `sessions/` -> list (GET), create (POST)
 # - `sessions/{pk}/` -> retrieve (GET), update (PUT/PATCH)
 # - `sessions/{pk}/end/` -> end (POST) (custom action)
+# - `sessions/prefetch/` -> prefetch (GET) (custom action)
 
 urlpatterns = [
     # Manually defined URLs for specific actions
     path('tracks/<slug:slug>/stream/', views.TrackStreamView.as_view(), name='track-stream'),
+    path('tracks/<slug:slug>/master.m3u8', views.MasterPlaylistView.as_view(), name='track-master-playlist'),
+    path('tracks/<slug:slug>/progressive/', views.ProgressiveStreamView.as_view(), name='track-progressive'),
     path('tracks/<slug:slug>/upload/', views.TrackUploadView.as_view(), name='track-upload'),
     path('tracks/<slug:slug>/transcode/', views.TrackTranscodeView.as_view(), name='track-transcode'),
     path('tracks/<slug:slug>/qualities/', views.AudioQualitiesView.as_view(), name='track-qualities'),
@@ -0,0 +1,148 @@
+import logging
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from artists.packaging import write_dash_manifest
+from artists.storage import copy_to_local, upload_file
+from artists.transcoding import write_master_playlist
+
+from .models import AudioQuality, MasterAsset
+
+logger = logging.getLogger(__name__)
+
+VARIANT_PLAYLIST = 'playlist_{bitrate}k.m3u8'
+ENCODE_LOCK_SECONDS = 60 * 60
+# Playback requests per variant (quality id -> count), applied by flush_variant_requests.
+REQUESTS_KEY = 'streaming:variant-requests'
+
+
+def lazy_variants_enabled():
+    return getattr(settings, 'STREAMING_LAZY_VARIANTS', False)
+
+
+def baseline_bitrate():
+    '''
+    Returns the bitrate encoded at ingest in lazy mode: the configured
+    baseline if it is part of the ladder, otherwise the lowest rung.
+    '''
+    ladder = settings.STREAMING_HLS_BITRATES
+    baseline = getattr(settings, 'STREAMING_BASELINE_BITRATE', 128)
+    return baseline if baseline in ladder else min(ladder)
+
+
+def ingest_bitrates():
+    'Returns the bitrates process_audio_file encodes up front.'
+    if lazy_variants_enabled():
+        return [baseline_bitrate()]
+    return list(settings.STREAMING_HLS_BITRATES)
+
+
+def _lock_key(audio_file_id, bitrate):
+    return f'streaming:variant-encode:{audio_file_id}:{bitrate}'
+
+
+def request_variant(audio_file_id, bitrate):
+    '''
+    Schedules a background encode of a missing ladder bitrate. Concurrent
+    requests for the same variant share one encode: only the caller that
+    takes the lock enqueues the task. Returns True while the variant is on
+    its way, False if the bitrate is not part of the ladder or variants are
+    encoded eagerly at ingest (a missing rung is then not encoded on demand).
+    '''
+    if not lazy_variants_enabled() or bitrate not in settings.STREAMING_HLS_BITRATES:
+        return False
+    if cache.add(_lock_key(audio_file_id, bitrate), 1, timeout=ENCODE_LOCK_SECONDS):
+        from .tasks import encode_variant
+        encode_variant.delay(str(audio_file_id), bitrate)
+        logger.info(f'Scheduled on-demand {bitrate}k encode for AudioFile {audio_file_id}')
+    return True
+
+
+def release_variant(audio_file_id, bitrate):
+    cache.delete(_lock_key(audio_file_id, bitrate))
+
+
+def _redis_client():
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client.get_client()
+
+
+def record_request(quality_id):
+    '''
+    Counts a playback request against a variant for the eviction policy
+    without writing to the database: the count is buffered in Redis, or
+    handed to flush_variant_requests when the cache is not Redis.
+    '''
+    client = _redis_client()
+    if client is not None:
+        client.hincrby(REQUESTS_KEY, str(quality_id), 1)
+        return
+    from .tasks import flush_variant_requests
+    flush_variant_requests.delay({str(quality_id): 1})
+
+
+def flush_requests(counts=None):
+    '''
+    Adds buffered request counts to AudioQuality.request_count and stamps
+    last_requested_at with one UPDATE. The Redis hash is read and deleted in
+    one MULTI, so concurrent flushes never apply a request twice. Returns
+    the number of variants updated.
+    '''
+    if counts is None:
+        client = _redis_client()
+        if client is None:
+            return 0
+        pipe = client.pipeline(transaction=True)
+        pipe.hgetall(REQUESTS_KEY)
+        pipe.delete(REQUESTS_KEY)
+        counts, _ = pipe.execute()
+    counts = {(key.decode() if isinstance(key, bytes) else key): int(count) for key, count in counts.items()}
+    if not counts:
+        return 0
+    return AudioQuality.objects.filter(pk__in=counts).update(
+        last_requested_at=timezone.now(),
+        request_count=F('request_count') + Case(
+            *[When(pk=quality_id, then=count) for quality_id, count in counts.items()],
+            output_field=IntegerField(),
+        ),
+    )
+
+
+def publish_manifests(audio_file, storage_prefix, packaging):
+    '''
+    Rewrites master.m3u8 (and manifest.mpd for CMAF) under `storage_prefix`
+    so they list exactly the HLS variants that currently have an
+    AudioQuality row.
+    '''
+    storage = audio_file.hls_master.storage
+    bitrates = sorted(
+        AudioQuality.objects.filter(audio_file=audio_file, format=AudioQuality.AudioFormat.HLS)
+        .values_list('bitrate_kbps', flat=True)
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        master_path = write_master_playlist(temp_dir, bitrates, variant_playlist=VARIANT_PLAYLIST)
+        manifests = {'master.m3u8': master_path}
+        if packaging != MasterAsset.Packaging.TS:
+            for bitrate in bitrates:
+                playlist = VARIANT_PLAYLIST.format(bitrate=bitrate)
+                copy_to_local(posixpath.join(storage_prefix, playlist), os.path.join(temp_dir, playlist), storage)
+            manifests['manifest.mpd'] = write_dash_manifest(temp_dir, bitrates, variant_playlist=VARIANT_PLAYLIST)
+
+        for filename, path in manifests.items():
+            upload_file(path, posixpath.join(storage_prefix, filename), storage)
+    return bitrates
+
+
+def variant_objects(storage, storage_prefix, bitrate):
+    'Returns the storage names of the playlist, init section and segments of one variant.'
+    _, files = storage.listdir(storage_prefix)
+    prefixes = (f'segment_{bitrate}k', f'init_{bitrate}k', VARIANT_PLAYLIST.format(bitrate=bitrate))
+    return [posixpath.join(storage_prefix, name) for name in files if name.startswith(prefixes)]
@@ -1,16 +1,27 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db import models
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status, views, viewsets, mixins
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotAuthenticated, NotFound, PermissionDenied, ValidationError
 
 from artists.models import Track
+from artists.popularity import record_play
 from .models import AudioFile, StreamingSession, PlaybackSettings, AudioQuality
+from .heartbeats import buffer_position, buffered_position, forget_session, heartbeat_client, track_session
+from .manifests import allows, master_token_user, master_url, personal_master, user_tier
+from .prefetch import prefetch_bundle, prefetch_count, upcoming_slugs
+from .progressive import pick_rendition, progressive_response
+from .resolution import resolve_stream
 from .permissions import IsStaffOrArtistManager, IsOwnerOfSession
+from .variants import record_request, request_variant
 from .serializers import (
     AudioQualitySerializer,
     PlaybackSettingsSerializer,
@@ -19,6 +30,19 @@ from .serializers import (
     StreamingSessionCreateSerializer,
 )
 
+BITRATE_PARAM = re.compile(r'(\d+)(?:kbps)?', re.IGNORECASE)
+
+
+def _requested_bitrate(request, param='quality'):
+    'Parses `?quality=256` or `?quality=256kbps`; anything else is a 400.'
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    match = BITRATE_PARAM.fullmatch(value)
+    if match is None:
+        raise ValidationError({param: 'Expected a bitrate in kbps, e.g. 256.'})
+    return int(match.group(1))
+
 class PlaybackSettingsView(generics.RetrieveUpdateAPIView):
     'Get and update the authenticated user\'s playback settings.'
     serializer_class = PlaybackSettingsSerializer
@@ -55,10 +79,18 @@ class StreamingSessionViewSet(
         return super().get_permissions()
 
     def create(self, request, *args, **kwargs):
+        '''
+        Starts a session. With a `queue` (upcoming track ids) or `playlist`
+        context the response also carries a `prefetch` bundle for the next
+        tracks and the user's playback settings, so the player can move on
+        without further requests.
+        '''
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         track = serializer.validated_data.get('track')
+        queue = serializer.validated_data.pop('queue', None)
+        playlist = serializer.validated_data.pop('playlist', None)
 
         user_agent = self.request.META.get('HTTP_USER_AGENT', '')
         ip_address = self.request.META.get('REMOTE_ADDR', '')
@@ -75,10 +107,59 @@ class StreamingSessionViewSet(
             audio_file=audio_file,
             device_info=device_info
         )
+        client = heartbeat_client()
+        if client is not None:
+            track_session(client, instance)
 
         display_serializer = StreamingSessionSerializer(instance, context=self.get_serializer_context())
+        data = dict(display_serializer.data)
+        if queue or playlist:
+            slugs = upcoming_slugs(request.user, track, queue=queue, playlist=playlist)
+            data['prefetch'] = prefetch_bundle(request, slugs)
+            playback_settings, _ = PlaybackSettings.objects.get_or_create(user=request.user)
+            data['playback_settings'] = PlaybackSettingsSerializer(playback_settings).data
         headers = self.get_success_headers(display_serializer.data)
-        return Response(display_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @action(detail=False, methods=['get'], url_path='prefetch')
+    def prefetch(self, request):
+        '''
+        Prefetch bundle for tracks queued after the session started
+        (`?tracks=slug-a,slug-b`), in the same shape as on create.
+        '''
+        slugs = [slug for slug in request.query_params.get('tracks', '').split(',') if slug][:prefetch_count()]
+        return Response(prefetch_bundle(request, slugs))
+
+    def update(self, request, *args, **kwargs):
+        '''
+        Heartbeats from a tracked session are buffered in Redis and answered
+        without loading or saving the row; flush_session_heartbeats writes
+        them in bulk. Untracked sessions go through the regular update.
+        '''
+        client = heartbeat_client()
+        if client is None:
+            return super().update(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data, partial=kwargs.get('partial', False))
+        serializer.is_valid(raise_exception=True)
+        position = serializer.validated_data.get('last_position_ms')
+        if position is None:
+            return super().update(request, *args, **kwargs)
+        session_id = kwargs[self.lookup_field]
+        if not buffer_position(client, session_id, request.user.pk, position):
+            session = self.get_object()
+            if session.ended_at:
+                return super().update(request, *args, **kwargs)
+            track_session(client, session)
+            buffer_position(client, session.pk, request.user.pk, position)
+        return Response({'id': session_id, 'last_position_ms': position})
+
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        position = buffered_position(heartbeat_client(), session.pk)
+        if position is not None:
+            session.last_position_ms = position
+        return Response(self.get_serializer(session).data)
 
     @action(detail=True, methods=['post'], url_path='end')
     def end(self, request, pk=None):
@@ -86,31 +167,119 @@ class StreamingSessionViewSet(
         if session.ended_at:
             return Response({'detail': 'Session has already ended.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        client = heartbeat_client()
+        position = buffered_position(client, session.pk)
+        if position is not None:
+            session.last_position_ms = position
         session.ended_at = timezone.now()
 
         duration_listened = (timezone.now() - session.started_at).total_seconds()
         if duration_listened > 30 or session.last_position_ms > 30000:
-            Track.objects.filter(pk=session.track.pk).update(popularity=models.F('popularity') + 1)
+            record_play(session.track_id)
 
         session.save()
+        forget_session(client, session.pk)
 
         serializer = StreamingSessionSerializer(session)
         return Response(serializer.data)
 
 class TrackStreamView(views.APIView):
-    'Returns a signed URL for HLS/DASH streaming.'
+    '''
+    Returns a signed URL for HLS/DASH streaming (`?protocol=dash` for the DASH manifest).
+    Resolved from the stream-resolution cache, so warm play starts skip the database.
+    '''
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        track = get_object_or_404(Track, slug=kwargs.get('slug'))
-        audio_file = get_object_or_404(AudioFile, track=track, status=Track.ProcessingStatus.COMPLETED)
+        resolution = resolve_stream(kwargs.get('slug'))
+        if resolution is None or resolution['status'] != Track.ProcessingStatus.COMPLETED:
+            raise NotFound()
+        storage = AudioFile._meta.get_field('hls_master').storage
 
-        if not audio_file.hls_master:
+        if request.query_params.get('protocol') == 'dash':
+            if not resolution['dash_master']:
+                return Response({'error': 'DASH stream not available for this track.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'url': storage.url(resolution['dash_master']), 'protocol': 'dash'})
+
+        if not resolution['hls_master']:
             return Response({'error': 'HLS stream not available for this track.'}, status=status.HTTP_404_NOT_FOUND)
 
-        url = audio_file.hls_master.url
+        # The master playlist is rendered per quality tier by MasterPlaylistView.
+        # Tokenised, so players that cannot send the Authorization header can open it.
+        url = master_url(request, kwargs.get('slug'))
+
+        bitrate = _requested_bitrate(request)
+        if bitrate is not None:
+            variant = next((
+                quality for quality in resolution['qualities']
+                if quality['bitrate_kbps'] == bitrate and quality['format'] == AudioQuality.AudioFormat.HLS
+            ), None)
+            if variant is None and bitrate not in settings.STREAMING_HLS_BITRATES:
+                return Response({'error': f'{bitrate}kbps is not offered for this track.'}, status=status.HTTP_404_NOT_FOUND)
+            if not allows(user_tier(request.user), bitrate):
+                return Response({'error': f'{bitrate}kbps is not included in your plan.'}, status=status.HTTP_403_FORBIDDEN)
+            if variant is not None:
+                record_request(variant['id'])
+                return Response({'url': storage.url(variant['file']), 'quality': bitrate})
+            if not request_variant(resolution['audio_file_id'], bitrate):
+                return Response({'error': f'{bitrate}kbps is not available for this track.'}, status=status.HTTP_404_NOT_FOUND)
+            # Served from the master (baseline) until the on-demand encode lands.
+            return Response(
+                {'url': url, 'requested_quality': bitrate, 'pending': True},
+                status=status.HTTP_202_ACCEPTED,
+            )
+
         return Response({'url': url})
 
+class MasterPlaylistView(views.APIView):
+    '''
+    Serves the HLS master playlist rewritten for the user's quality tier:
+    variants above their preference or plan are dropped and their default
+    quality is listed first. Accepts the bearer token or the `token` query
+    parameter handed out by the stream endpoints.
+    '''
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        slug = kwargs.get('slug')
+        token = request.query_params.get('token')
+        if token:
+            user_id = master_token_user(token, slug)
+            if user_id is None:
+                raise PermissionDenied('Invalid or expired playlist token.')
+            user = get_user_model()(pk=user_id)
+        elif request.user.is_authenticated:
+            user = request.user
+        else:
+            raise NotAuthenticated()
+
+        resolution = resolve_stream(slug)
+        if resolution is None or resolution['status'] != Track.ProcessingStatus.COMPLETED or not resolution['hls_master']:
+            raise NotFound()
+
+        manifest = personal_master(slug, resolution, user_tier(user))
+        response = HttpResponse(manifest, content_type='application/vnd.apple.mpegurl')
+        response['Cache-Control'] = 'private'
+        return response
+
+class ProgressiveStreamView(views.APIView):
+    '''
+    Progressive download of a single-file rendition for clients that cannot
+    play HLS (`?quality=128` picks the best rendition up to that bitrate).
+    Only the authorisation happens here; the bytes are served by nginx.
+    '''
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        resolution = resolve_stream(kwargs.get('slug'))
+        if resolution is None or resolution['status'] != Track.ProcessingStatus.COMPLETED:
+            raise NotFound()
+
+        rendition = pick_rendition(resolution['qualities'], _requested_bitrate(request))
+        if rendition is None:
+            return Response({'error': 'No progressive rendition is available for this track.'}, status=status.HTTP_404_NOT_FOUND)
+        return progressive_response(rendition, AudioQuality._meta.get_field('file').storage)
+
 class TrackUploadView(views.APIView):
     'Handles the upload of the original master audio file.'
     permission_classes = [IsStaffOrArtistManager]
@@ -133,13 +302,36 @@ class TrackTranscodeView(views.APIView):
         return Response({'status': 'Transcoding initiated.'})
 
 class AudioQualitiesView(generics.ListAPIView):
-    'Lists available audio qualities for a given track.'
+    '''
+    Lists available audio qualities for a given track from the
+    stream-resolution cache. Asking for a ladder bitrate that has not been
+    encoded yet (`?bitrate=256`) schedules it and answers 202 with an empty list.
+    '''
     serializer_class = AudioQualitySerializer
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
-        track_slug = self.kwargs.get('slug')
-        return AudioQuality.objects.filter(audio_file__track__slug=track_slug).order_by('-bitrate_kbps')
+    def list(self, request, *args, **kwargs):
+        resolution = resolve_stream(self.kwargs.get('slug')) or {'qualities': [], 'status': None}
+        storage = AudioQuality._meta.get_field('file').storage
+        bitrate = _requested_bitrate(request, 'bitrate')
+        qualities = [
+            {
+                'id': quality['id'],
+                'resolution_label': quality['resolution_label'],
+                'bitrate_kbps': quality['bitrate_kbps'],
+                'format': quality['format'],
+                'file': request.build_absolute_uri(storage.url(quality['file'])) if quality['file'] else None,
+            }
+            for quality in resolution['qualities']
+            if bitrate is None or quality['bitrate_kbps'] == bitrate
+        ]
+
+        page = self.paginate_queryset(qualities)
+        response = self.get_paginated_response(page) if page is not None else Response(qualities)
+        if bitrate is not None and not qualities and resolution['status'] == Track.ProcessingStatus.COMPLETED:
+            if request_variant(resolution['audio_file_id'], bitrate):
+                response.status_code = status.HTTP_202_ACCEPTED
+        return response
 
 class AudioFilePublishView(views.APIView):
     'A view to publish an audio file (e.g., after transcoding and review).'